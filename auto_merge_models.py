@@ -26,6 +26,10 @@ def find_model_directories(base_path):
 
 def merge_model(actor_path, dry_run=False):
     """Merge a single model using the model_merger.py script."""
+    if (Path(actor_path) / "huggingface" / "model.safetensors.index.json").exists():
+        print(f"Skipping model exported at save time: {actor_path}")
+        return True
+
     print(f"Merging model: {actor_path}")
     
     command = [
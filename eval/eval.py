@@ -1,13 +1,17 @@
 import os
 import re
+import glob
 import json
 import argparse
-import torch
+import importlib
+import multiprocessing as mp
+from abc import ABC, abstractmethod
 from tqdm import tqdm
 from datetime import datetime
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Type
 from math_verify import parse, verify
-from transformers import AutoModelForCausalLM
 from datasets import load_dataset
 
 
@@ -66,12 +70,153 @@ def format_reward(completions, **kwargs):
     return [1.0 if match else 0.0 for match in matches]
 
 
-@torch.inference_mode()
-def model_generate(model, media, prompt) -> str:
-    # TODO: Please implement your model generation code here.
-    # Note: The implementation should differ for VILA/Qwen-VL/LLaVA and other models.
-    pass
-    return response
+class Generator(ABC):
+    """The generation backend, `load_media` runs in the prefetch threads and `generate` handles a batch.
+
+    Subclass it for the models that `VLLMGenerator` does not cover (e.g. VILA or LLaVA), and pass it as `module:Class`.
+    """
+
+    def __init__(self, model_path: str, max_new_tokens: int, num_frames: int):
+        self.model_path = model_path
+        self.max_new_tokens = max_new_tokens
+        self.num_frames = num_frames
+
+    def load_media(self, video_path: str):
+        return video_path
+
+    @abstractmethod
+    def generate(self, medias: List[Any], prompts: List[str]) -> List[str]:
+        """Generate the responses of a batch of loaded medias and prompts."""
+        ...
+
+
+class VLLMGenerator(Generator):
+    """Batched generation of Qwen-VL style models with vLLM, the videos are decoded by the prefetch threads."""
+
+    def __init__(self, model_path: str, max_new_tokens: int, num_frames: int):
+        super().__init__(model_path, max_new_tokens, num_frames)
+        from transformers import AutoProcessor
+        from vllm import LLM, SamplingParams
+
+        self.processor = AutoProcessor.from_pretrained(model_path)
+        self.llm = LLM(model=model_path, limit_mm_per_prompt={"video": 1})
+        self.sampling_params = SamplingParams(temperature=0.0, max_tokens=max_new_tokens)
+
+    def load_media(self, video_path: str):
+        from qwen_vl_utils import fetch_video
+
+        return fetch_video({"video": video_path, "nframes": self.num_frames})
+
+    def generate(self, medias: List[Any], prompts: List[str]) -> List[str]:
+        inputs = []
+        for media, prompt in zip(medias, prompts):
+            messages = [{"role": "user", "content": [{"type": "video"}, {"type": "text", "text": prompt}]}]
+            text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            inputs.append({"prompt": text, "multi_modal_data": {"video": media}})
+
+        outputs = self.llm.generate(inputs, sampling_params=self.sampling_params, use_tqdm=False)
+        return [output.outputs[0].text for output in outputs]
+
+
+GENERATORS = {"vllm": VLLMGenerator}
+
+
+def get_generator_cls(name: str) -> Type[Generator]:
+    """Use a registered backend, or `path.to.module:ClassName` for your own."""
+    if ":" in name:
+        module_name, class_name = name.split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    return GENERATORS[name]
+
+
+def get_sample_id(index: int, instance: Dict[str, Any]) -> str:
+    return str(instance.get("id", index))
+
+
+def load_finished(output_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Read the finished samples of all shards, the last record of a sample wins."""
+    finished = {}
+    for path in sorted(glob.glob(os.path.join(output_dir, "outputs.shard*.jsonl"))):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # a partial line of an interrupted run
+                    continue
+
+                finished[record["sample_id"]] = record
+
+    return finished
+
+
+def run_shard(args: argparse.Namespace, shard_id: int) -> None:
+    if args.num_shards > 1:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(shard_id)
+
+    data_path, data_split = args.data_path.split("@") if "@" in args.data_path else (args.data_path, "test")
+    instances = load_dataset(data_path)[data_split]
+    finished = load_finished(args.output_dir)
+    todo = [
+        (index, instances[index])
+        for index in range(shard_id, len(instances), args.num_shards)
+        if get_sample_id(index, instances[index]) not in finished
+    ]
+    print(f"Shard {shard_id}: {len(todo)} samples to evaluate.")
+    if not todo:
+        return
+
+    generator = get_generator_cls(args.generator)(args.model_path, args.max_new_tokens, args.num_frames)
+    batches = [todo[i : i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    num_correct, num_format, num_samples = 0.0, 0.0, 0
+    with ThreadPoolExecutor(max_workers=args.num_decode_workers) as executor, open(
+        os.path.join(args.output_dir, f"outputs.shard{shard_id}.jsonl"), "a"
+    ) as output_file:
+
+        def prefetch(batch):
+            return [executor.submit(generator.load_media, os.path.join(args.video_dir, x["videos"])) for _, x in batch]
+
+        # decode the videos of the next batches while generating the current one
+        pending = deque(prefetch(batch) for batch in batches[: args.prefetch_batches + 1])
+        for batch_idx, batch in enumerate(tqdm(batches, position=shard_id)):
+            media_futures = pending.popleft()
+            if batch_idx + args.prefetch_batches + 1 < len(batches):
+                pending.append(prefetch(batches[batch_idx + args.prefetch_batches + 1]))
+
+            records, medias, prompts = [], [], []
+            for (index, instance), media_future in zip(batch, media_futures):
+                try:
+                    medias.append(media_future.result())
+                except Exception as e:
+                    print("Failed to process video %s." % instance["videos"], e)
+                    continue
+
+                prompts.append(QUESTION_TEMPLATE_VIDEO.format(question=instance["problem"]))
+                records.append(
+                    {
+                        "sample_id": get_sample_id(index, instance),
+                        "video_id": instance["videos"].split("/")[-1].split(".")[0],
+                        "question": instance["problem"],
+                        "answer": instance["answer"],
+                    }
+                )
+
+            if not records:
+                continue
+
+            responses = generator.generate(medias, prompts)
+            accuracies = accuracy_reward(responses, [record["answer"] for record in records])
+            format_accuracies = format_reward(responses)
+            for record, response, accuracy, format_accuracy in zip(records, responses, accuracies, format_accuracies):
+                record.update({"response": response, "accuracy": accuracy, "format_accuracy": format_accuracy})
+                output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            output_file.flush()
+            num_correct += sum(accuracies)
+            num_format += sum(format_accuracies)
+            num_samples += len(records)
+            print(f"Shard {shard_id}: running accuracy {num_correct / num_samples:.4f} over {num_samples} samples.")
+
 
 def main() -> None:
     parser = argparse.ArgumentParser()
@@ -79,54 +224,39 @@ def main() -> None:
     parser.add_argument("--data-path", type=str, required=True)
     parser.add_argument("--video-dir", type=str, required=True)
     parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--generator", type=str, default="vllm", help="`vllm` or `module:Class` of a `Generator`")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--num-shards", type=int, default=1, help="Number of local processes, one gpu each")
+    parser.add_argument("--num-decode-workers", type=int, default=8, help="Threads decoding videos ahead")
+    parser.add_argument("--prefetch-batches", type=int, default=2)
+    parser.add_argument("--max-new-tokens", type=int, default=2048)
+    parser.add_argument("--num-frames", type=int, default=64)
 
     args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
 
-    # Load model
-    model = AutoModelForCausalLM.from_pretrained(args.model_path)
+    if args.num_shards > 1:
+        processes = [mp.get_context("spawn").Process(target=run_shard, args=(args, i)) for i in range(args.num_shards)]
+        for process in processes:
+            process.start()
 
-    if "@" in args.data_path:
-        data_path, data_split = args.data_path.split("@")
+        for process in processes:
+            process.join()
     else:
-        data_split = "test"
-    instances = load_dataset(data_path)[data_split]
+        run_shard(args, 0)
 
-    outputs = []
-    if not os.path.isdir(args.output_dir):
-        os.system("mkdir -p %s"%args.output_dir)
+    # aggregate the results of all shards, including the ones of the previous runs
+    outputs = list(load_finished(args.output_dir).values())
+    metrics = {
+        "accuracy": sum(output["accuracy"] for output in outputs) / max(len(outputs), 1),
+        "format_accuracy": sum(output["format_accuracy"] for output in outputs) / max(len(outputs), 1),
+        "num_samples": len(outputs),
+    }
+    with open(os.path.join(args.output_dir, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=4)
 
-    for instance in tqdm(instances):
-        video_id = instance["videos"].split("/")[-1].split(".")[0]
-        output_path  = os.path.join(args.output_dir, "%s.json"%video_id)
-        video_path = os.path.join(args.video_dir, instance["videos"])
+    print(f"Metrics: {metrics}")
 
-        if os.path.exists(output_path):
-            print("Finished processing %s." % instance["videos"])
-            output = json.load(open(output_path))
-            outputs.append(output)
-            continue
-
-        try:
-            question = instance["problem"]
-            prompt = QUESTION_TEMPLATE_VIDEO.format(question=question)
-
-            response = model_generate(model, video_path, prompt)
-
-            output = {"video_id": video_id, "question": question, "response": response, "answer": instance["answer"]}
-            json.dump(output, open(output_path, "w"), ensure_ascii=False, indent=4)
-            outputs.append(output)
-        except Exception as e:
-            print("Failed to process video %s."%instance["videos"], e)
-
-    accuracies = accuracy_reward([output["response"] for output in outputs], [output["answer"] for output in outputs])
-    format_accuracies = format_reward([output["response"] for output in outputs])
-    # Gather and save outputs
-    io.save(os.path.join(args.output_dir, "outputs.jsonl"), outputs)
-
-    # Run evaluation
-    metrics = {"accuracy": sum(accuracies) / len(outputs), "format_accuracy": sum(format_accuracies) / len(outputs)}
-    io.save(os.path.join(args.output_dir, "metrics.json"), metrics)
-    logger.info(f"Metrics: {metrics}") 
 
 if __name__ == "__main__":
     main()
@@ -14,7 +14,8 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any, Dict, List
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
 import torch
 import piq
 
@@ -48,40 +49,91 @@ def _normalize(raw: float, lo: float = 0.0, hi: float = 100.0) -> float:
     return max(0.0, min(1.0, 1.0 - (raw - lo) / (hi - lo)))
 # ------------------------------------------------------------
 
+def _sample_frames(
+    vid: torch.Tensor, sample_ratio: Optional[float] = 0.125, generator: Optional[torch.Generator] = None
+) -> torch.Tensor:
+    """(F,3,H,W) → 随机 F*sample_ratio 帧 (n,3,H,W)，sample_ratio 为 None 时保留全部帧"""
+    if sample_ratio is None:
+        return vid
+
+    F = vid.shape[0]
+    n_sample = max(1, int(F * sample_ratio))
+    idx = torch.randperm(F, generator=generator)[:n_sample].to(vid.device)
+    return vid.index_select(0, idx)
+
+
+def _brisque_items(
+    items: List[torch.Tensor], chunk_size: int = 64, device: Optional[str] = None
+) -> List[float]:
+    """
+    items: [(n,3,H,W), ...] → 每个 item 的平均 BRISQUE 原始分
+    所有帧拼成同尺寸的大 batch，按 chunk_size 分块一次性计算，结果与逐个 _brisque_batch 一致
+    """
+    device = device or _device
+    frames: Dict[Tuple[int, ...], List[torch.Tensor]] = defaultdict(list)  # 按 (C,H,W) 分组
+    owners: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+    for i, item in enumerate(items):
+        item = _to_01(item)                      # 逐 item 判断取值范围，与单条路径一致
+        frames[tuple(item.shape[1:])].append(item)
+        owners[tuple(item.shape[1:])].extend([i] * item.size(0))
+
+    sums = torch.zeros(len(items), dtype=torch.float64)
+    counts = torch.zeros(len(items), dtype=torch.float64)
+    for shape, group in frames.items():
+        group = torch.cat(group, dim=0)
+        owner = torch.tensor(owners[shape])
+        with torch.no_grad():
+            for start in range(0, group.size(0), chunk_size):
+                chunk = group[start : start + chunk_size].to(device)
+                raw = piq.brisque(chunk, data_range=1.0, reduction="none").double().cpu()
+                chunk_owner = owner[start : start + chunk_size]
+                sums.index_add_(0, chunk_owner, raw)
+                counts.index_add_(0, chunk_owner, torch.ones_like(raw))
+
+    return (sums / counts).tolist()
+
+
 def compute_score(
     reward_inputs: List[Dict[str, Any]],
     format_weight: float = 0.0,
+    batched: bool = True,
+    chunk_size: int = 64,
+    seed: Optional[int] = None,
+    frame_sample_ratio: Optional[float] = 0.125,
 ) -> List[Dict[str, float]]:
     """
     reward_inputs:
         [{"images": Tensor(3,H,W)},                 # 单张图片
          {"videos": Tensor(F,3,H,W)}, ...]         # 单段视频 (F,3,H,W)
+    batched: 所有图片 / 视频帧拼成一个 batch 分块计算，False 时逐个计算
+    chunk_size: 每次送入 BRISQUE 的最大帧数
+    seed: 视频抽帧的随机种子
+    frame_sample_ratio: 视频抽帧比例，默认随机抽 F/8 帧，None 时使用全部帧
     返回:
         [{"overall": v, "format": 0.0, "accuracy": v}, ...]
         accuracy / overall 已归一化到 0‑1，越高越好
     """
-    results: List[Dict[str, float]] = []
-
+    generator = torch.Generator().manual_seed(seed) if seed is not None else None
+    items: List[torch.Tensor] = []
     for itm in reward_inputs:
         # ---------- 单图 ----------
         if "images" in itm and isinstance(itm["images"], torch.Tensor):
-            # print("*** images ***", itm["images"].shape)
-            img = itm["images"]                        # (3,H,W)
-            raw = _brisque_batch(img.unsqueeze(0))
+            items.append(itm["images"].unsqueeze(0))   # (1,3,H,W)
 
         # ---------- 单段视频 ----------
         elif "videos" in itm and isinstance(itm["videos"], torch.Tensor):
-            # print("*** videos ***", itm["videos"].shape)
-            vid = itm["videos"]                        # (F,3,H,W)
-            F, C, H, W = vid.shape
-            n_sample = max(1, F // 8)                  # 随机 F/8 帧
-            idx = torch.randperm(F, device=vid.device)[:n_sample]
-            sampled = vid.index_select(0, idx)         # (n,3,H,W)
-            raw = _brisque_batch(sampled)
+            items.append(_sample_frames(itm["videos"], frame_sample_ratio, generator))  # (n,3,H,W)
 
         else:
             raise ValueError('reward_input 必须含 "images" 或 "videos" 张量')
 
+    if batched:
+        raws = _brisque_items(items, chunk_size=chunk_size)
+    else:
+        raws = [_brisque_batch(item) for item in items]
+
+    results: List[Dict[str, float]] = []
+    for raw in raws:
         acc = _normalize(raw)          # 0‑1, 越高越好
         fmt = 0.0                      # 若需排版分，可替换
         overall = (1 - format_weight) * acc + format_weight * fmt
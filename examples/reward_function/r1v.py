@@ -13,9 +13,104 @@
 # limitations under the License.
 
 import re
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import sympy
+from mathruler.grader import (
+    _is_frac,
+    _normalize,
+    _str_is_int,
+    _sympy_parse,
+    grade_answer,
+    should_allow_eval,
+    split_tuple,
+)
+from mathruler.math_normalize import normalize_answer
+
+
+class ParsedGroundTruth(NamedTuple):
+    text: str
+    mathd_normalized: str
+    normalized: Optional[str]
+    elems: Tuple[str, ...]
+    exprs: Tuple[Optional[sympy.Expr], ...]
+
+
+def _try_sympy_parse(expr: str) -> Optional[sympy.Expr]:
+    try:
+        return _sympy_parse(expr)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=65536)
+def parse_ground_truth(ground_truth: str) -> ParsedGroundTruth:
+    """Normalize and sympy-parse the ground truth once, it is shared by all the responses to the same prompt."""
+    ground_truth = ground_truth.strip()
+    normalized = _normalize(ground_truth)
+    elems = tuple(split_tuple(normalized)) if normalized is not None else ()
+    exprs = tuple(_try_sympy_parse(elem) for elem in elems)
+    return ParsedGroundTruth(ground_truth, normalize_answer(ground_truth), normalized, elems, exprs)
+
+
+def _are_equal_under_sympy(ground_truth_elem: str, ground_truth_expr: Optional[sympy.Expr], given_elem: str) -> bool:
+    """Same as `are_equal_under_sympy`, but only parses the given answer."""
+    if ground_truth_expr is None or not should_allow_eval(f"({ground_truth_elem})-({given_elem})"):
+        return False
+
+    try:
+        return sympy.simplify(ground_truth_expr - _sympy_parse(given_elem)) == 0
+    except Exception:
+        return False
+
+
+def grade_parsed_answer(given_answer: str, ground_truth: ParsedGroundTruth) -> bool:
+    """Same as `grade_answer`, but compares against the pre-parsed ground truth."""
+    if given_answer is None:
+        return False
+
+    if ground_truth.mathd_normalized == normalize_answer(given_answer):
+        return True
 
-from mathruler.grader import grade_answer
+    given_normalized = _normalize(given_answer)
+    if ground_truth.normalized is None:
+        return False
+
+    if ground_truth.normalized == given_normalized:
+        return True
+
+    if len(given_normalized) == 0:
+        return False
+
+    given_elems = split_tuple(given_normalized)
+    if len(ground_truth.elems) > 1 and (
+        ground_truth.normalized[0] != given_normalized[0] or ground_truth.normalized[-1] != given_normalized[-1]
+    ):
+        return False
+
+    if len(ground_truth.elems) != len(given_elems):
+        return False
+
+    for ground_truth_elem, ground_truth_expr, given_elem in zip(ground_truth.elems, ground_truth.exprs, given_elems):
+        if _is_frac(ground_truth_elem) and _is_frac(given_elem):
+            is_correct = ground_truth_elem == given_elem
+        elif _str_is_int(ground_truth_elem) != _str_is_int(given_elem):
+            is_correct = False
+        else:
+            is_correct = _are_equal_under_sympy(ground_truth_elem, ground_truth_expr, given_elem)
+
+        if not is_correct:
+            return False
+
+    return True
+
+
+def _grade(given_answer: str, ground_truth: str, use_ground_truth_index: bool) -> bool:
+    if use_ground_truth_index:
+        return grade_parsed_answer(given_answer, parse_ground_truth(ground_truth))
+
+    return grade_answer(given_answer, ground_truth.strip())
 
 
 def format_reward(response: str) -> float:
@@ -24,11 +119,11 @@ def format_reward(response: str) -> float:
     return 1.0 if format_match else 0.0
 
 
-def accuracy_reward(response: str, ground_truth: str) -> float:
+def accuracy_reward(response: str, ground_truth: str, use_ground_truth_index: bool = True) -> float:
     try:
         content_match = re.search(r"<answer>(.*?)</answer>", response.replace("\n", "").replace(" ", ""))
         given_answer = content_match.group(1).strip() if content_match else response.strip()
-        if grade_answer(given_answer, ground_truth.strip()):
+        if _grade(given_answer, ground_truth, use_ground_truth_index):
             return 1.0
 
     except Exception:
@@ -37,7 +132,7 @@ def accuracy_reward(response: str, ground_truth: str) -> float:
     return 0.0
 
 
-def sqa_accuracy_reward(response: str, ground_truth: str) -> float:
+def sqa_accuracy_reward(response: str, ground_truth: str, use_ground_truth_index: bool = True) -> float:
     """
     SQA-style accuracy reward function based on token matching.
     Splits response by spaces, periods, and commas, then checks if ground_truth matches any token using grade_answer.
@@ -51,9 +146,6 @@ def sqa_accuracy_reward(response: str, ground_truth: str) -> float:
         
         pred = content_match.group(1).strip()
         
-        # Normalize target
-        target = ground_truth.strip()
-        
         # Split response by spaces, periods, and commas
         tokens = re.split(r'[ .,:;]+', pred)
         
@@ -62,7 +154,7 @@ def sqa_accuracy_reward(response: str, ground_truth: str) -> float:
         
         # Check if target matches any token using grade_answer
         for token in tokens:
-            if grade_answer(token, target):
+            if _grade(token, ground_truth, use_ground_truth_index):
                 return 1.0
         
         return 0.0
@@ -71,12 +163,14 @@ def sqa_accuracy_reward(response: str, ground_truth: str) -> float:
         return 0.0
 
 
-def compute_score(reward_input: Dict[str, Any], format_weight: float = 0.1) -> Dict[str, float]:
+def compute_score(
+    reward_input: Dict[str, Any], format_weight: float = 0.1, use_ground_truth_index: bool = True
+) -> Dict[str, float]:
     if not isinstance(reward_input, dict):
         raise ValueError("Please use `reward_type=sequential` for r1v reward function.")
 
     format_score = format_reward(reward_input["response"])
-    accuracy_score = accuracy_reward(reward_input["response"], reward_input["ground_truth"])
+    accuracy_score = accuracy_reward(reward_input["response"], reward_input["ground_truth"], use_ground_truth_index)
     return {
         "overall": (1 - format_weight) * accuracy_score + format_weight * format_score,
         "format": format_score,
@@ -84,7 +178,9 @@ def compute_score(reward_input: Dict[str, Any], format_weight: float = 0.1) -> D
     }
 
 
-def sqa_compute_score(reward_input: Dict[str, Any], format_weight: float = 0.1) -> Dict[str, float]:
+def sqa_compute_score(
+    reward_input: Dict[str, Any], format_weight: float = 0.1, use_ground_truth_index: bool = True
+) -> Dict[str, float]:
     """
     SQA-style compute score function using SQA accuracy logic.
     """
@@ -92,7 +188,9 @@ def sqa_compute_score(reward_input: Dict[str, Any], format_weight: float = 0.1)
         raise ValueError("Please use `reward_type=sequential` for SQA reward function.")
 
     format_score = format_reward(reward_input["response"])
-    accuracy_score = sqa_accuracy_reward(reward_input["response"], reward_input["ground_truth"])
+    accuracy_score = sqa_accuracy_reward(
+        reward_input["response"], reward_input["ground_truth"], use_ground_truth_index
+    )
     return {
         "overall": (1 - format_weight) * accuracy_score + format_weight * format_score,
         "format": format_score,
@@ -0,0 +1,100 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmark the r1v reward with and without the pre-parsed ground truth index on a synthetic math set.
+
+python scripts/benchmark_r1v_reward.py --num_prompts 200 --n 8 --epochs 2
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import time
+from typing import Dict, List, Tuple
+
+
+def load_r1v():
+    path = os.path.join(os.path.dirname(__file__), "..", "examples", "reward_function", "r1v.py")
+    spec = importlib.util.spec_from_file_location("r1v", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_problem(rng: random.Random) -> Tuple[str, List[str]]:
+    """Return a LaTeX ground truth and some equivalent or wrong answers."""
+    a, b = rng.randint(1, 50), rng.randint(2, 50)
+    kind = rng.choice(["int", "frac", "sqrt", "tuple", "expr"])
+    if kind == "int":
+        return str(a), [str(a), f"{a}.0", str(a + 1), f"x={a}"]
+    elif kind == "frac":
+        return f"\\frac{{{a}}}{{{b}}}", [
+            f"\\frac{{{a}}}{{{b}}}",
+            f"{a}/{b}",
+            f"\\dfrac{{{a}}}{{{b}}}",
+            f"\\frac{{{b}}}{{{a}}}",
+        ]
+    elif kind == "sqrt":
+        return f"{a}\\sqrt{{{b}}}", [f"{a}\\sqrt{{{b}}}", f"\\sqrt{{{b}}}{a}", f"{a}\\sqrt{{{b + 1}}}", str(a * b)]
+    elif kind == "tuple":
+        return f"({a}, {b})", [f"({a},{b})", f"({b},{a})", f"[{a},{b}]", f"({a},{b},0)"]
+    else:
+        return f"{a}x^2+{b}", [f"{a}x^2+{b}", f"{b}+{a}x^2", f"{a}x^2-{b}", f"{a}x+{b}"]
+
+
+def make_dataset(num_prompts: int, n: int, seed: int) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    reward_inputs = []
+    for _ in range(num_prompts):
+        ground_truth, answers = make_problem(rng)
+        for _ in range(n):
+            answer = rng.choice(answers)
+            reward_inputs.append(
+                {"response": f"<think>...</think> <answer>{answer}</answer>", "ground_truth": ground_truth}
+            )
+
+    return reward_inputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_prompts", type=int, default=200)
+    parser.add_argument("--n", type=int, default=8, help="number of responses per prompt")
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    r1v = load_r1v()
+    reward_inputs = make_dataset(args.num_prompts, args.n, args.seed)
+    results = {}
+    for use_ground_truth_index in (False, True):
+        r1v.parse_ground_truth.cache_clear()
+        start = time.perf_counter()
+        for _ in range(args.epochs):
+            scores = [
+                r1v.compute_score(reward_input, use_ground_truth_index=use_ground_truth_index)
+                for reward_input in reward_inputs
+            ]
+
+        elapsed = time.perf_counter() - start
+        results[use_ground_truth_index] = scores
+        print(f"{use_ground_truth_index=}: {elapsed:.2f}s for {len(reward_inputs) * args.epochs} responses.")
+
+    assert results[False] == results[True], "The ground truth index changes the scores."
+    print("Scores match.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmark the seek-based VILA frame loader against a sequential walk on synthetic long videos.
+
+The videos are generated locally with OpenCV, every frame carries its own index, so the two loaders must return
+identical frames.
+
+python scripts/benchmark_vila_video_loader.py --minutes 10 30 --num_frames 64 256
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+import cv2
+import numpy as np
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from verl.utils.vila_remote_code.media import _load_video, _sample_frame_indices  # noqa: E402
+
+
+def make_video(path: str, num_frames: int, fps: int, height: int, width: int, gop_size: int) -> None:
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if hasattr(cv2, "VIDEOWRITER_PROP_KEYINTERVAL"):
+        writer.set(cv2.VIDEOWRITER_PROP_KEYINTERVAL, gop_size)
+
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    for index in range(num_frames):
+        frame = np.roll(background, index * 4, axis=1)
+        cv2.putText(frame, str(index), (16, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 4)
+        writer.write(frame)
+
+    writer.release()
+
+
+def load_video_sequential(video_path: str, num_frames: int) -> List[np.ndarray]:
+    """The sequential walk the seek-based loader replaces, every frame is grabbed."""
+    vidcap = cv2.VideoCapture(video_path)
+    frame_count = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+    indices = set(_sample_frame_indices(frame_count, num_frames))
+    frames, count = [], 0
+    while len(frames) < len(indices):
+        if count in indices:
+            success, frame = vidcap.read()
+            if success:
+                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        else:
+            success = vidcap.grab()
+
+        if not success:
+            break
+
+        count += 1
+
+    vidcap.release()
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10.0])
+    parser.add_argument("--num_frames", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--gop_size", type=int, default=250)
+    parser.add_argument("--seek_min_gap", type=int, default=64)
+    parser.add_argument("--output_dir", type=str, default=None, help="Keep the generated videos in this directory")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or tempfile.mkdtemp()
+    os.makedirs(output_dir, exist_ok=True)
+    for minutes in args.minutes:
+        video_path = os.path.join(output_dir, f"synthetic_{minutes:g}min.mp4")
+        if not os.path.exists(video_path):
+            start = time.perf_counter()
+            make_video(video_path, int(minutes * 60 * args.fps), args.fps, args.height, args.width, args.gop_size)
+            print(f"Generated {video_path} in {time.perf_counter() - start:.1f}s.")
+
+        for num_frames in args.num_frames:
+            start = time.perf_counter()
+            expected = load_video_sequential(video_path, num_frames)
+            sequential_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            images = _load_video(video_path, num_frames, seek_min_gap=args.seek_min_gap)
+            seek_time = time.perf_counter() - start
+
+            identical = len(images) == len(expected) and all(
+                np.array_equal(np.asarray(image), frame) for image, frame in zip(images, expected)
+            )
+            print(
+                f"{minutes:g} min, {num_frames} frames: sequential {sequential_time:.2f}s, seek {seek_time:.2f}s "
+                f"({sequential_time / seek_time:.1f}x), identical frames: {identical}."
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Fill the audio feature store (`data.audio_feature_dir`) of the Qwen2.5-Omni videos of a dataset ahead of training.
+
+Files already in the store are skipped, so the build can be resumed.
+
+python scripts/build_audio_feature_store.py --data_path data/train.jsonl --video_dir data/videos \
+    --store_dir data/audio_features --model_path Qwen/Qwen2.5-Omni-7B
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, Tuple
+
+from tqdm import tqdm
+from transformers import WhisperFeatureExtractor
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from verl.utils.dataset import load_rlhf_dataset  # noqa: E402
+from verl.utils.qwen_omni_utils import AudioFeatureStore  # noqa: E402
+
+
+_worker_state = {}
+
+
+def _init_worker(store_dir: str, model_path: str) -> None:
+    feature_extractor = WhisperFeatureExtractor.from_pretrained(model_path)
+    _worker_state["store"] = AudioFeatureStore(store_dir, feature_extractor)
+
+
+def _store_video(video_path: str) -> Tuple[str, Optional[str]]:
+    store: AudioFeatureStore = _worker_state["store"]
+    try:
+        store.fetch({"type": "video", "video": video_path})
+        return video_path, None
+    except Exception as e:
+        return video_path, repr(e)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_path", required=True, type=str, nargs="+", help="Datasets, in `path@split` format")
+    parser.add_argument("--video_key", default="videos", type=str)
+    parser.add_argument("--video_dir", default=None, type=str)
+    parser.add_argument("--store_dir", required=True, type=str)
+    parser.add_argument("--model_path", required=True, type=str, help="The model whose feature extractor is used")
+    parser.add_argument("--num_workers", default=os.cpu_count(), type=int)
+    args = parser.parse_args()
+
+    videos = set()
+    for data_path in args.data_path:
+        for video in load_rlhf_dataset(data_path)[args.video_key]:
+            videos.add(os.path.join(args.video_dir, video) if args.video_dir is not None else video)
+
+    store = AudioFeatureStore(args.store_dir, WhisperFeatureExtractor.from_pretrained(args.model_path))
+    pending = []
+    for video in sorted(videos):
+        entry_dir = store.get_entry_dir({"type": "video", "video": video})
+        if entry_dir is None or not os.path.exists(entry_dir):
+            pending.append(video)
+
+    print(f"{len(videos) - len(pending)} of {len(videos)} videos are stored, processing {len(pending)} videos.")
+    failures = []
+    with ProcessPoolExecutor(
+        args.num_workers, initializer=_init_worker, initargs=(args.store_dir, args.model_path)
+    ) as executor:
+        futures = [executor.submit(_store_video, video) for video in pending]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Storing audio features"):
+            video, error = future.result()
+            if error is not None:
+                failures.append(video)
+                print(f"Failed to process {video}: {error}")
+
+    print(f"{len(pending) - len(failures)} videos are stored, {len(failures)} videos failed.")
+    if len(failures) != 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Decode and preprocess the videos of a dataset once, and store the frames for `data.cache_dir`.
+
+The frames are stored as uint8 arrays, one `.npy` file per video, so the dataset memory-maps them instead of
+decoding. The build is resumable, videos already in the cache are skipped. A manifest is written when every video
+is cached, use `--validate_only` to check an existing cache.
+
+python scripts/build_video_cache.py --data_path data/train.jsonl --video_dir data/videos \
+    --cache_dir data/video_cache --model_path Qwen/Qwen2.5-VL-7B-Instruct --num_video_frames 16
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import torch
+from tqdm import tqdm
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from verl.utils.dataset import load_rlhf_dataset  # noqa: E402
+from verl.utils.video_cache import VideoCache  # noqa: E402
+
+
+_worker_state = {}
+
+
+def _init_worker(args: argparse.Namespace) -> None:
+    torch.set_num_threads(1)  # the parallelism comes from the processes
+    _worker_state["args"] = args
+    _worker_state["cache"] = VideoCache(args.cache_dir, args.video_dir)
+    if args.vila_model:
+        from verl.utils.tokenizer import get_processor
+
+        _worker_state["processor"] = get_processor(args.model_path, num_video_frames=args.num_video_frames)
+
+
+def _decode_qwen(video_path: str, args: argparse.Namespace) -> torch.Tensor:
+    from verl.utils.qwen_vl_utils.vision_process import fetch_video
+
+    ele = {"video": video_path, "nframes": args.num_video_frames}
+    if args.resized_height is not None and args.resized_width is not None:
+        ele["resized_height"], ele["resized_width"] = args.resized_height, args.resized_width
+
+    return fetch_video(ele)  # uint8 (T, C, H, W)
+
+
+def _decode_vila(video_path: str, args: argparse.Namespace) -> torch.Tensor:
+    from verl.utils.vila_remote_code.media import _load_video
+    from verl.utils.vila_remote_code.mm_utils import process_images
+
+    processor = _worker_state["processor"]
+    frames = _load_video(video_path, num_frames=args.num_video_frames)
+    video = process_images(frames, processor.image_processor, processor.config)  # (T, C, H, W) in [-1, 1]
+    return (video.float() + 1) * 127.5  # the dataset normalizes with `x / 255 * 2 - 1`
+
+
+def _cache_video(video: str) -> Tuple[str, Optional[str]]:
+    args: argparse.Namespace = _worker_state["args"]
+    cache: VideoCache = _worker_state["cache"]
+    video_path = os.path.join(args.video_dir, video) if args.video_dir is not None else video
+    try:
+        if args.vila_model:
+            frames = _decode_vila(video_path, args)
+        else:
+            frames = _decode_qwen(video_path, args)
+
+        if frames.size(0) != args.num_video_frames:
+            return video, f"got {frames.size(0)} frames"
+
+        if frames.dtype != torch.uint8:
+            frames = frames.round().clamp(0, 255).to(torch.uint8)
+
+        cache.save(video, frames.contiguous())
+        return video, None
+    except Exception as e:
+        return video, repr(e)
+
+
+def get_videos(data_path: str, video_key: str) -> List[str]:
+    dataset = load_rlhf_dataset(data_path)
+    return sorted(set(dataset[video_key]))
+
+
+def validate(cache: VideoCache, videos: List[str], num_video_frames: int) -> List[str]:
+    """Return the videos that are missing or have a wrong number of frames, reading the array headers only."""
+    invalid = []
+    for video in videos:
+        shape = cache.get_shape(video)
+        if shape is None or len(shape) != 4 or shape[0] != num_video_frames:
+            invalid.append(video)
+
+    return invalid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_path", required=True, type=str, nargs="+", help="Datasets, in `path@split` format")
+    parser.add_argument("--video_key", default="videos", type=str)
+    parser.add_argument("--video_dir", default=None, type=str)
+    parser.add_argument("--cache_dir", required=True, type=str)
+    parser.add_argument("--model_path", default=None, type=str, help="The model whose processor is used (VILA)")
+    parser.add_argument("--vila_model", action="store_true", help="Preprocess with the VILA image processor")
+    parser.add_argument("--num_video_frames", default=8, type=int)
+    parser.add_argument("--resized_height", default=None, type=int)
+    parser.add_argument("--resized_width", default=None, type=int)
+    parser.add_argument("--num_workers", default=os.cpu_count(), type=int)
+    parser.add_argument("--validate_only", action="store_true")
+    args = parser.parse_args()
+    assert not args.vila_model or args.model_path is not None, "VILA requires --model_path."
+
+    videos = sorted({video for data_path in args.data_path for video in get_videos(data_path, args.video_key)})
+    cache = VideoCache(args.cache_dir, args.video_dir)
+    if not args.validate_only:
+        pending = [video for video in videos if not cache.contains(video)]
+        print(f"{len(videos) - len(pending)} of {len(videos)} videos are cached, decoding {len(pending)} videos.")
+        failures = []
+        with ProcessPoolExecutor(args.num_workers, initializer=_init_worker, initargs=(args,)) as executor:
+            futures = [executor.submit(_cache_video, video) for video in pending]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Caching videos"):
+                video, error = future.result()
+                if error is not None:
+                    failures.append(video)
+                    print(f"Failed to cache {video}: {error}")
+
+        print(f"{len(failures)} videos failed.")
+
+    invalid = validate(cache, videos, args.num_video_frames)
+    if len(invalid) != 0:
+        print(
+            f"The cache is incomplete, {len(invalid)} of {len(videos)} videos are missing or invalid, e.g. {invalid[:5]}."
+        )
+        sys.exit(1)
+
+    cache.save_manifest(
+        {
+            "num_video_frames": args.num_video_frames,
+            "vila_model": args.vila_model,
+            "dtype": "uint8",
+            "layout": "TCHW",
+            "num_videos": len(videos),
+            "model_path": args.model_path,
+        }
+    )
+    print(f"The cache of {len(videos)} videos is complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,16 +11,26 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+"""
+Merge the sharded FSDP checkpoint into huggingface safetensors.
+
+The rank files are memory-mapped, so only the shards of the parameters being merged are paged in. Parameters are
+packed into output files of at most `max_shard_size` bytes, which are merged and written in parallel, so the peak
+memory is about `num_workers * max_shard_size`.
+"""
 
 import argparse
+import json
 import os
 import re
+import sys
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
 import torch
-from torch.distributed._tensor import DTensor, Placement, Shard
+from safetensors.torch import save_file
+from torch.distributed._tensor import DTensor, Placement
 from transformers import (
     AutoConfig,
     AutoModelForCausalLM,
@@ -31,6 +41,14 @@ from transformers import (
 )
 
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from verl.utils.model_utils import get_hf_key_mapping, get_tied_weights_keys  # noqa: E402
+
+
+SAFE_WEIGHTS_INDEX_NAME = "model.safetensors.index.json"
+
+
 def merge_by_placement(tensors: List[torch.Tensor], placement: Placement):
     if placement.is_replicate():
         return tensors[0]
@@ -51,30 +69,23 @@ def upload_model_to_huggingface(local_path: str, remote_path: str):
     api.upload_folder(repo_id=remote_path, folder_path=local_path, repo_type="model")
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--local_dir", required=True, type=str, help="The path for your saved model")
-    parser.add_argument("--hf_upload_path", default=False, type=str, help="The path of the huggingface repo to upload")
-    args = parser.parse_args()
-    local_dir: str = args.local_dir
-
-    assert not local_dir.endswith("huggingface"), "The local_dir should not end with huggingface."
-
-    # copy rank zero to find the shape of (dp, fsdp)
-    rank = 0
+def load_rank_state_dicts(local_dir: str) -> Tuple[List[Dict[str, Any]], Tuple[str, ...]]:
+    """Memory-map the state dicts of all ranks, the tensors are read lazily."""
     world_size = 0
     for filename in os.listdir(local_dir):
         match = re.match(r"model_world_size_(\d+)_rank_0\.pt", filename)
         if match:
-            world_size = match.group(1)
+            world_size = int(match.group(1))
             break
 
     assert world_size, "No model file with the proper format."
 
-    rank0_weight_path = os.path.join(local_dir, f"model_world_size_{world_size}_rank_{rank}.pt")
-    state_dict = torch.load(rank0_weight_path, map_location="cpu", weights_only=False)
-    pivot_key = sorted(state_dict.keys())[0]
-    weight = state_dict[pivot_key]
+    def load_rank(rank: int) -> Dict[str, Any]:
+        model_path = os.path.join(local_dir, f"model_world_size_{world_size}_rank_{rank}.pt")
+        return torch.load(model_path, map_location="cpu", weights_only=False, mmap=True)
+
+    state_dict = load_rank(0)
+    weight = state_dict[sorted(state_dict.keys())[0]]
     if isinstance(weight, DTensor):
         # get sharding info
         device_mesh = weight.device_mesh
@@ -82,85 +93,62 @@ if __name__ == "__main__":
         mesh_dim_names = device_mesh.mesh_dim_names
     else:
         # for non-DTensor
-        mesh = np.array([int(world_size)], dtype=np.int64)
+        mesh = np.array([world_size], dtype=np.int64)
         mesh_dim_names = ("fsdp",)
 
     print(f"Got device mesh {mesh}, mesh_dim_names {mesh_dim_names}")
-
     assert mesh_dim_names in (("fsdp",), ("ddp", "fsdp")), f"Unsupported mesh_dim_names {mesh_dim_names}."
 
-    if "tp" in mesh_dim_names:
-        # fsdp * tp
-        total_shards = mesh.shape[-1] * mesh.shape[-2]
-        mesh_shape = (mesh.shape[-2], mesh.shape[-1])
-    else:
-        # fsdp
-        total_shards = mesh.shape[-1]
-        mesh_shape = (mesh.shape[-1],)
+    # the ranks of the fsdp dimension hold distinct shards, the ddp dimension is replicated
+    total_shards = mesh.shape[-1]
+    return [state_dict] + [load_rank(rank) for rank in range(1, total_shards)], mesh_dim_names
 
-    print(f"Processing {total_shards} model shards in total.")
-    model_state_dict_lst = []
-    model_state_dict_lst.append(state_dict)
-    model_state_dict_lst.extend([""] * (total_shards - 1))
 
-    def process_one_shard(rank, model_state_dict_lst):
-        model_path = os.path.join(local_dir, f"model_world_size_{world_size}_rank_{rank}.pt")
-        state_dict = torch.load(model_path, map_location="cpu", weights_only=False)
-        model_state_dict_lst[rank] = state_dict
-        return state_dict
-
-    with ThreadPoolExecutor(max_workers=min(32, os.cpu_count())) as executor:
-        for rank in range(1, total_shards):
-            executor.submit(process_one_shard, rank, model_state_dict_lst)
-
-    state_dict: Dict[str, List[torch.Tensor]] = {}
-    param_placements: Dict[str, List[Placement]] = {}
-    keys = set(model_state_dict_lst[0].keys())
-    for key in keys:
-        state_dict[key] = []
-        for model_state_dict in model_state_dict_lst:
-            try:
-                tensor = model_state_dict.pop(key)
-            except Exception:
-                print(f"Cannot find key {key} in rank {rank}.")
-
-            if isinstance(tensor, DTensor):
-                state_dict[key].append(tensor._local_tensor.bfloat16())
-                placements = tuple(tensor.placements)
-                # replicated placement at ddp dimension can be discarded
-                if mesh_dim_names[0] == "ddp":
-                    placements = placements[1:]
-
-                if key not in param_placements:
-                    param_placements[key] = placements
-                else:
-                    assert param_placements[key] == placements
-            else:
-                state_dict[key].append(tensor.bfloat16())
-
-    del model_state_dict_lst
-
-    for key in sorted(state_dict):
-        if not isinstance(state_dict[key], list):
-            print(f"No need to merge key {key}")
-            continue
-
-        if key in param_placements:
-            # merge shards
-            placements: Tuple[Shard] = param_placements[key]
-            if len(mesh_shape) == 1:
-                # 1-D list, FSDP without TP
-                assert len(placements) == 1
-                shards = state_dict[key]
-                state_dict[key] = merge_by_placement(shards, placements[0])
-            else:
-                # 2-D list, FSDP + TP
-                raise NotImplementedError("FSDP + TP is not supported yet.")
-        else:
-            state_dict[key] = torch.cat(state_dict[key], dim=0)
+def get_full_shape(key: str, state_dicts: List[Dict[str, Any]]) -> torch.Size:
+    tensor = state_dicts[0][key]
+    if isinstance(tensor, DTensor):
+        return tensor.shape  # the global shape
 
-    print("Merge completed.")
-    hf_path = os.path.join(local_dir, "huggingface")
+    return torch.Size([sum(state_dict[key].size(0) for state_dict in state_dicts), *tensor.shape[1:]])
+
+
+def merge_param(key: str, state_dicts: List[Dict[str, Any]], mesh_dim_names: Tuple[str, ...]) -> torch.Tensor:
+    tensor = state_dicts[0][key]
+    if not isinstance(tensor, DTensor):
+        return torch.cat([state_dict[key].bfloat16() for state_dict in state_dicts], dim=0)
+
+    placements = tuple(tensor.placements)
+    # replicated placement at ddp dimension can be discarded
+    if mesh_dim_names[0] == "ddp":
+        placements = placements[1:]
+
+    if len(placements) != 1:
+        # 2-D list, FSDP + TP
+        raise NotImplementedError("FSDP + TP is not supported yet.")
+
+    shards = [state_dict[key]._local_tensor.bfloat16() for state_dict in state_dicts]
+    return merge_by_placement(shards, placements[0])
+
+
+def plan_shards(shapes: Dict[str, torch.Size], max_shard_size: int) -> List[List[str]]:
+    """Pack the parameters into output files of at most `max_shard_size` bytes (bf16)."""
+    shards, current, current_size = [], [], 0
+    for key, shape in shapes.items():
+        size = shape.numel() * 2
+        if current and current_size + size > max_shard_size:
+            shards.append(current)
+            current, current_size = [], 0
+
+        current.append(key)
+        current_size += size
+
+    if current:
+        shards.append(current)
+
+    return shards
+
+
+def load_model_on_meta(hf_path: str) -> PreTrainedModel:
     config: PretrainedConfig = AutoConfig.from_pretrained(hf_path)
     architectures: List[str] = getattr(config, "architectures", ["Unknown"])
 
@@ -177,11 +165,53 @@ if __name__ == "__main__":
         model: PreTrainedModel = AutoClass.from_config(config, torch_dtype=torch.bfloat16)
 
     assert isinstance(model, PreTrainedModel)
-    model.to_empty(device="cpu")
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local_dir", required=True, type=str, help="The path for your saved model")
+    parser.add_argument("--hf_upload_path", default=False, type=str, help="The path of the huggingface repo to upload")
+    parser.add_argument("--max_shard_size", default=5, type=float, help="Max size (GB) of each safetensors file")
+    parser.add_argument("--num_workers", default=4, type=int, help="Number of safetensors files merged in parallel")
+    args = parser.parse_args()
+    local_dir: str = args.local_dir
+
+    assert not local_dir.endswith("huggingface"), "The local_dir should not end with huggingface."
+
+    state_dicts, mesh_dim_names = load_rank_state_dicts(local_dir)
+    print(f"Processing {len(state_dicts)} model shards in total.")
+
+    hf_path = os.path.join(local_dir, "huggingface")
+    model = load_model_on_meta(hf_path)
+    skipped_keys = get_tied_weights_keys(model)
+    param_keys = [key for key in sorted(state_dicts[0].keys()) if key not in skipped_keys]
+    shapes = {key: get_full_shape(key, state_dicts) for key in param_keys}
+    key_mapping = get_hf_key_mapping(param_keys, model)
+    shards = plan_shards(shapes, int(args.max_shard_size * 1024**3))
+    filenames = [f"model-{i + 1:05d}-of-{len(shards):05d}.safetensors" for i in range(len(shards))]
+
+    def merge_shard(keys: List[str], filename: str) -> None:
+        tensors = {key_mapping.get(key, key): merge_param(key, state_dicts, mesh_dim_names) for key in keys}
+        save_file(tensors, os.path.join(hf_path, filename), metadata={"format": "pt"})
+        print(f"Saved {filename}.")
 
     print(f"Saving model to {hf_path}...")
-    model.save_pretrained(hf_path, state_dict=state_dict)
-    del state_dict, model
+    with ThreadPoolExecutor(max_workers=args.num_workers) as executor:
+        for future in [executor.submit(merge_shard, keys, filename) for keys, filename in zip(shards, filenames)]:
+            future.result()
+
+    index = {
+        "metadata": {"total_size": sum(shape.numel() * 2 for shape in shapes.values())},
+        "weight_map": {
+            key_mapping.get(key, key): filename for keys, filename in zip(shards, filenames) for key in keys
+        },
+    }
+    with open(os.path.join(hf_path, SAFE_WEIGHTS_INDEX_NAME), "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+
+    print("Merge completed.")
+    del state_dicts
 
     if args.hf_upload_path:
         upload_model_to_huggingface(hf_path, args.hf_upload_path)
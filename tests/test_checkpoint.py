@@ -0,0 +1,213 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from safetensors.torch import load_file
+from torch.distributed.checkpoint.state_dict import StateDictOptions, get_model_state_dict
+from torch.distributed.fsdp import FullyShardedDataParallel as FSDP
+from torch.distributed.fsdp.wrap import ModuleWrapPolicy
+
+from verl.utils.checkpoint import (
+    find_latest_complete_ckpt,
+    fsdp_checkpoint_manager,
+    is_ckpt_complete,
+    remove_obsolete_ckpt,
+)
+from verl.utils.checkpoint.checkpoint_manager import INCOMPLETE_MARKER
+from verl.utils.checkpoint.fsdp_checkpoint_manager import FSDPCheckpointManager
+
+
+def test_remove_obsolete_ckpt(tmp_path):
+    for step in range(1, 5):
+        os.makedirs(tmp_path / f"global_step_{step}" / "actor")
+
+    # step 1 is still being written by rank 1
+    (tmp_path / "global_step_1" / "actor" / INCOMPLETE_MARKER.format(1)).touch()
+    assert not is_ckpt_complete(str(tmp_path / "global_step_1"))
+    assert is_ckpt_complete(str(tmp_path / "global_step_2"))
+
+    remove_obsolete_ckpt(str(tmp_path), global_step=5, best_global_step=-1, save_limit=2)
+    assert sorted(os.listdir(tmp_path)) == ["global_step_1", "global_step_4"]
+
+
+def _get_checkpoint_manager(seed: int) -> FSDPCheckpointManager:
+    torch.manual_seed(seed)
+    model = FSDP(torch.nn.Sequential(torch.nn.Linear(8, 6), torch.nn.Linear(6, 3)), device_id=torch.device("cpu"))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+    lr_scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lambda step: 1.0)
+    return FSDPCheckpointManager(model, optimizer, lr_scheduler, processing_class=None)
+
+
+def _full_state_dict(checkpoint_manager: FSDPCheckpointManager):
+    options = StateDictOptions(full_state_dict=True, cpu_offload=True, broadcast_from_rank0=False)
+    return get_model_state_dict(checkpoint_manager.model, options=options)
+
+
+def _save_worker(rank: int, world_size: int, tmp_path: str):
+    dist.init_process_group("gloo", init_method=f"file://{tmp_path}/save_store", rank=rank, world_size=world_size)
+    checkpoint_manager = _get_checkpoint_manager(seed=0)
+    checkpoint_manager.model(torch.randn(4, 8)).sum().backward()
+    checkpoint_manager.optimizer.step()
+    checkpoint_manager.save_checkpoint(os.path.join(tmp_path, "ckpt"), checkpoint_format="dcp", save_hf_config=False)
+    state_dict = _full_state_dict(checkpoint_manager)
+    if rank == 0:
+        torch.save(state_dict, os.path.join(tmp_path, "expected.pt"))
+
+    dist.destroy_process_group()
+
+
+def _load_worker(rank: int, world_size: int, tmp_path: str):
+    dist.init_process_group("gloo", init_method=f"file://{tmp_path}/load_store", rank=rank, world_size=world_size)
+    checkpoint_manager = _get_checkpoint_manager(seed=1)
+    checkpoint_manager.load_checkpoint(os.path.join(tmp_path, "ckpt"))
+    state_dict = _full_state_dict(checkpoint_manager)
+    if rank == 0:  # the full state dict is only gathered on rank 0
+        expected = torch.load(os.path.join(tmp_path, "expected.pt"))
+        for key, value in expected.items():
+            torch.testing.assert_close(state_dict[key], value)
+
+    dist.destroy_process_group()
+
+
+def test_distributed_checkpoint_resharding(tmp_path):
+    # save with 2 ranks, resume with 3 ranks
+    mp.spawn(_save_worker, args=(2, str(tmp_path)), nprocs=2)
+    assert is_ckpt_complete(str(tmp_path / "ckpt"))
+    mp.spawn(_load_worker, args=(3, str(tmp_path)), nprocs=3)
+
+
+def _interrupted_save_worker(rank: int, world_size: int, tmp_path: str):
+    dist.init_process_group("gloo", init_method=f"file://{tmp_path}/save_store", rank=rank, world_size=world_size)
+    checkpoint_manager = _get_checkpoint_manager(seed=0)
+    for step in (1, 2):
+        checkpoint_manager.model(torch.randn(4, 8)).sum().backward()
+        checkpoint_manager.optimizer.step()
+        if step == 2:  # the writer never finishes, as if the job was killed during the async save
+            checkpoint_manager._write_state_dicts = lambda *args, **kwargs: threading.Event().wait()
+
+        ckpt_path = os.path.join(tmp_path, f"global_step_{step}")
+        checkpoint_manager.save_checkpoint(ckpt_path, async_save=True, save_hf_config=False)
+        remove_obsolete_ckpt(tmp_path, global_step=step, best_global_step=-1, save_limit=1)
+        if step == 1:
+            checkpoint_manager.wait_for_pending_save()
+            state_dict = _full_state_dict(checkpoint_manager)
+            if rank == 0:
+                torch.save(state_dict, os.path.join(tmp_path, "expected.pt"))
+
+    dist.barrier()
+    os._exit(0)
+
+
+def _resume_worker(rank: int, world_size: int, tmp_path: str):
+    dist.init_process_group("gloo", init_method=f"file://{tmp_path}/load_store", rank=rank, world_size=world_size)
+    checkpoint_manager = _get_checkpoint_manager(seed=1)
+    checkpoint_manager.load_checkpoint(find_latest_complete_ckpt(tmp_path))
+    state_dict = _full_state_dict(checkpoint_manager)
+    if rank == 0:  # the full state dict is only gathered on rank 0
+        expected = torch.load(os.path.join(tmp_path, "expected.pt"))
+        for key, value in expected.items():
+            torch.testing.assert_close(state_dict[key], value)
+
+    dist.destroy_process_group()
+
+
+def test_resume_from_interrupted_async_save(tmp_path):
+    mp.spawn(_interrupted_save_worker, args=(2, str(tmp_path)), nprocs=2)
+    # the last complete checkpoint is kept despite the save limit
+    assert not is_ckpt_complete(str(tmp_path / "global_step_2"))
+    assert find_latest_complete_ckpt(str(tmp_path)) == str(tmp_path / "global_step_1")
+    mp.spawn(_resume_worker, args=(2, str(tmp_path)), nprocs=2)
+
+
+class _RenamedModel(torch.nn.Module):
+    # the checkpoint keys `encoder.*` are loaded as `model.encoder.*`, like the vision language models
+    _checkpoint_conversion_mapping = {"^encoder": "model.encoder"}
+
+    def __init__(self):
+        super().__init__()
+        self.model = torch.nn.ModuleDict(
+            {"encoder": torch.nn.Sequential(torch.nn.Linear(8, 6), torch.nn.Linear(6, 6))}
+        )
+        self.head = torch.nn.Linear(6, 3)
+
+
+class _TiedModel(torch.nn.Module):
+    # the output embeddings share the weight of the input embeddings, like the small language models
+    _tied_weights_keys = ["lm_head.weight"]
+
+    def __init__(self):
+        super().__init__()
+        self.config = SimpleNamespace(tie_word_embeddings=True)
+        self.embed_tokens = torch.nn.Embedding(16, 6)
+        self.layers = torch.nn.Sequential(torch.nn.Linear(6, 6), torch.nn.Linear(6, 6))
+        self.lm_head = torch.nn.Linear(6, 16, bias=False)
+        self.lm_head.weight = self.embed_tokens.weight
+
+
+def _export_worker(rank: int, world_size: int, tmp_path: str, tied: bool):
+    dist.init_process_group("gloo", init_method=f"file://{tmp_path}/export_store", rank=rank, world_size=world_size)
+    fsdp_checkpoint_manager.HF_MAX_SHARD_SIZE = 128  # several safetensors files
+    torch.manual_seed(0)
+    if tied:  # the tied weights stay in the root unit
+        model = FSDP(
+            _TiedModel(), auto_wrap_policy=ModuleWrapPolicy({torch.nn.Sequential}), device_id=torch.device("cpu")
+        )
+    else:
+        model = FSDP(
+            _RenamedModel(), auto_wrap_policy=ModuleWrapPolicy({torch.nn.Linear}), device_id=torch.device("cpu")
+        )
+
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+    lr_scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lambda step: 1.0)
+    checkpoint_manager = FSDPCheckpointManager(model, optimizer, lr_scheduler, processing_class=None)
+    checkpoint_manager.save_checkpoint(os.path.join(tmp_path, "ckpt"), save_hf_weights=True, save_hf_config=False)
+    state_dict = _full_state_dict(checkpoint_manager)
+    if rank == 0:
+        torch.save(state_dict, os.path.join(tmp_path, "expected.pt"))
+
+    dist.destroy_process_group()
+
+
+@pytest.mark.parametrize("tied", [False, True])
+def test_export_hf_weights(tmp_path, tied: bool):
+    mp.spawn(_export_worker, args=(2, str(tmp_path), tied), nprocs=2)
+    hf_path = tmp_path / "ckpt" / "huggingface"
+    with open(hf_path / "model.safetensors.index.json") as f:
+        weight_map = json.load(f)["weight_map"]
+
+    expected = torch.load(tmp_path / "expected.pt")
+    if tied:  # the same keys as `save_pretrained` and the model merger
+        assert "lm_head.weight" in expected
+        expected.pop("lm_head.weight")
+
+    expected = {key.replace("model.encoder", "encoder"): value for key, value in expected.items()}
+    assert sorted(weight_map.keys()) == sorted(expected.keys())
+    assert len(set(weight_map.values())) > 1
+
+    tensors = {}
+    for filename in set(weight_map.values()):
+        shard = load_file(hf_path / filename)
+        assert all(weight_map[key] == filename for key in shard.keys())
+        tensors.update(shard)
+
+    for key, value in expected.items():
+        torch.testing.assert_close(tensors[key], value.to(torch.bfloat16))
@@ -12,11 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
+import numpy as np
+import pytest
 import torch
 from PIL.Image import Image
+from torchdata.stateful_dataloader import StatefulDataLoader
 
-from verl.utils.dataset import RLHFDataset
+from verl.protocol import DataProto
+from verl.utils.dataset import (
+    PromptLengthIndex,
+    RLHFDataset,
+    StreamingRLHFDataset,
+    collate_fn,
+    place_multi_modal_inputs,
+)
+from verl.utils.frame_cache import FrameCache
+from verl.utils.qwen_vl_utils import vision_process
 from verl.utils.tokenizer import get_processor, get_tokenizer
+from verl.utils.video_cache import VideoCache, get_video_name
 
 
 def test_image_dataset():
@@ -42,6 +57,7 @@ def test_image_dataset():
         "position_ids",
         "raw_prompt_ids",
         "multi_modal_data",
+        "multi_modal_inputs",
     }
     assert dataset[0]["problem"] == (
         "<image>Chords $\\overline{A C}$ and $\\overline{D F}$ are equidistant from the center. "
@@ -56,5 +72,229 @@ def test_image_dataset():
     assert isinstance(dataset[0]["multi_modal_data"]["images"][0], Image)
 
 
+def test_multi_modal_inputs():
+    tokenizer = get_tokenizer("Qwen/Qwen2.5-VL-7B-Instruct", use_fast=True)
+    processor = get_processor("Qwen/Qwen2.5-VL-7B-Instruct", use_fast=True)
+    dataset = RLHFDataset(
+        data_path="hiyouga/geometry3k@test",
+        tokenizer=tokenizer,
+        processor=processor,
+        prompt_key="problem",
+        answer_key="answer",
+        image_key="images",
+        max_prompt_length=2048,
+        filter_overlong_prompts=False,
+    )
+    features = [dataset[0], dataset[1]]
+    batch = DataProto.from_single_dict(collate_fn(features))
+    # the rollout gets the prompt and the raw media, its placeholders match the grid of the processed images
+    gen_batch = batch.pop(
+        batch_keys=["input_ids", "attention_mask", "position_ids"],
+        non_tensor_batch_keys=["raw_prompt_ids", "multi_modal_data"],
+    )
+    image_token_id = tokenizer.convert_tokens_to_ids("<|image_pad|>")
+    merge_length = processor.image_processor.merge_size**2
+    for raw_prompt_ids, feature in zip(gen_batch.non_tensor_batch["raw_prompt_ids"], features):
+        num_image_tokens = feature["multi_modal_inputs"]["image_grid_thw"].prod() // merge_length
+        assert list(raw_prompt_ids).count(image_token_id) == num_image_tokens
+
+    # the actor gets the tensors of the dataset, once per prompt
+    batch = batch.repeat(repeat_times=2, interleave=True)
+    actor_inputs = place_multi_modal_inputs(batch.non_tensor_batch["multi_modal_inputs"], "cpu")
+    assert actor_inputs[0] is actor_inputs[1] and actor_inputs[1] is not actor_inputs[2]
+    for index, multi_modal_inputs in enumerate(actor_inputs):
+        expected = features[index // 2]["multi_modal_inputs"]
+        assert multi_modal_inputs.keys() == expected.keys() == {"pixel_values", "image_grid_thw"}
+        assert all(torch.equal(multi_modal_inputs[key], expected[key]) for key in expected)
+
+
+def test_prompt_length_index(tmp_path):
+    key = {"fingerprint": "abc", "pixels": [262144, 4194304], "num_video_frames": 8}
+    index = PromptLengthIndex(str(tmp_path), key)
+    assert index.load(num_examples=3) is None
+    index.save({"text_tokens": np.array([10, 20, 30]), "vision_tokens": np.array([0, 64, 0])})
+    lengths = PromptLengthIndex(str(tmp_path), dict(key)).load(num_examples=3)
+    assert lengths["text_tokens"].tolist() == [10, 20, 30]
+    assert lengths["vision_tokens"].tolist() == [0, 64, 0]
+    assert PromptLengthIndex(str(tmp_path), dict(key)).load(num_examples=4) is None  # stale index
+    assert PromptLengthIndex(str(tmp_path), {**key, "num_video_frames": 16}).load(num_examples=3) is None
+
+
+def test_video_cache(tmp_path):
+    cache = VideoCache(str(tmp_path))
+    frames = torch.randint(0, 256, (4, 3, 28, 56), dtype=torch.uint8)
+    assert cache.load("clips/a.mp4") is None
+    cache.save("clips/a.mp4", frames)
+    assert cache.contains("clips/a.mp4")
+    assert cache.get_shape("clips/a.mp4") == (4, 3, 28, 56)
+    loaded = cache.load("clips/a.mp4")
+    assert loaded.dtype == torch.uint8
+    assert torch.equal(loaded, frames)
+    cache.save_manifest({"num_video_frames": 4})
+    assert VideoCache(str(tmp_path)).num_video_frames == 4
+
+    # the names stay inside the cache directory
+    assert get_video_name("./a.b.mp4") == "a.b"
+    assert get_video_name("../a.mp4") == os.path.join("__", "a")
+    assert get_video_name("/videos/clips/a.mp4", video_dir="/videos") == os.path.join("clips", "a")
+    assert get_video_name("/data/a.mp4", video_dir="/videos") == os.path.join("__", "data", "a")
+
+
+def test_video_decode_service(monkeypatch):
+    num_decodes = []
+
+    def _decode_video(ele, image_factor):
+        num_decodes.append(ele["video"])
+        return torch.zeros((ele["nframes"], 3, 28, 28), dtype=torch.uint8), 2.0
+
+    monkeypatch.setattr(vision_process, "_decode_video", _decode_video)
+    frame_bytes = 3 * 28 * 28
+    service = vision_process.VideoDecodeService(max_workers=2, max_cache_bytes=12 * frame_bytes)
+    futures = [service.submit({"video": "a.mp4", "nframes": 4}) for _ in range(4)]
+    assert all(future.result()[0].size(0) == 4 for future in futures)
+    assert service.fetch({"video": "a.mp4", "nframes": 8})[0].size(0) == 8  # a different sampling is another entry
+    assert num_decodes == ["a.mp4", "a.mp4"]
+    service.fetch({"video": "b.mp4", "nframes": 4})  # evicts the least recently used entry
+    service.fetch({"video": "a.mp4", "nframes": 4})
+    assert num_decodes == ["a.mp4", "a.mp4", "b.mp4", "a.mp4"]
+    assert service.stats()["hit_rate"] == 3 / 7
+
+
+def test_frame_cache(tmp_path):
+    video_path = tmp_path / "a.mp4"
+    video_path.write_bytes(b"video" * 1000)
+    frame_cache = FrameCache(str(tmp_path / "cache"), max_bytes=10000, evict_interval=1)
+    key = frame_cache.get_key(str(video_path), {"nframes": 4})
+    assert frame_cache.get_key(str(video_path), {"nframes": 8}) != key
+    assert frame_cache.get_key(str(tmp_path / "missing.mp4"), {"nframes": 4}) is None
+    assert frame_cache.load(key) is None
+    frames = np.random.randint(0, 256, (4, 8, 8, 3), dtype=np.uint8)
+    frame_cache.save(key, frames, {"sample_fps": 2.0})
+    cached_frames, metadata = frame_cache.load(key)
+    assert np.array_equal(cached_frames, frames)
+    assert metadata == {"sample_fps": 2.0}
+
+    # a copy of the video has the same content, so it hits the cache
+    (tmp_path / "b.mp4").write_bytes(video_path.read_bytes())
+    assert frame_cache.get_key(str(tmp_path / "b.mp4"), {"nframes": 4}) == key
+
+    # the least recently used entries are evicted once the cache exceeds its limit
+    os.utime(frame_cache._get_path(key) + ".npy", (0, 0))
+    for nframes in range(8, 24):
+        frame_cache.save(frame_cache.get_key(str(video_path), {"nframes": nframes}), frames, {})
+
+    assert frame_cache.load(key) is None
+
+
+def test_audio_feature_store(tmp_path):
+    soundfile = pytest.importorskip("soundfile")
+    from transformers import WhisperFeatureExtractor
+
+    from verl.utils.qwen_omni_utils import AudioFeatureStore
+
+    audio_path = str(tmp_path / "a.wav")
+    soundfile.write(audio_path, np.sin(np.arange(32000) / 10).astype(np.float32), 16000)
+    feature_extractor = WhisperFeatureExtractor()
+    store = AudioFeatureStore(str(tmp_path / "store"), feature_extractor)
+    messages = [{"role": "user", "content": [{"type": "audio", "audio": audio_path}, {"type": "text", "text": "hi"}]}]
+    audios, audio_features = store.process_audio_info(messages, use_audio_in_video=False)
+    cached_audios, cached_features = store.process_audio_info(messages, use_audio_in_video=False)
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 1
+    assert np.array_equal(audios[0], cached_audios[0])
+    expected = feature_extractor(audios, sampling_rate=16000, padding="max_length", return_attention_mask=True)
+    assert np.array_equal(cached_features[0]["input_features"], expected["input_features"])
+    assert np.array_equal(cached_features[0]["feature_attention_mask"], expected["attention_mask"])
+
+
+def test_single_pass_demux(tmp_path, monkeypatch):
+    av = pytest.importorskip("av")
+    pytest.importorskip("librosa")
+    from verl.utils.qwen_omni_utils import process_audio_info, process_mm_info_single_pass, process_vision_info
+    from verl.utils.qwen_omni_utils.v2_5 import vision_process as omni_vision_process
+
+    video_path = str(tmp_path / "a.mp4")
+    with av.open(video_path, "w") as container:
+        video_stream = container.add_stream("mpeg4", rate=10)
+        video_stream.width, video_stream.height, video_stream.pix_fmt = 112, 84, "yuv420p"
+        audio_stream = container.add_stream("aac", rate=44100)
+        for index in range(30):
+            frame = np.full((84, 112, 3), index * 8, dtype=np.uint8)
+            container.mux(video_stream.encode(av.VideoFrame.from_ndarray(frame, format="rgb24")))
+
+        for index in range(3 * 44100 // 1024):
+            samples = np.sin(np.arange(index * 1024, (index + 1) * 1024) / 10).astype(np.float32)[None]
+            frame = av.AudioFrame.from_ndarray(samples, format="flt", layout="mono")
+            frame.sample_rate = 44100
+            container.mux(audio_stream.encode(frame))
+
+        container.mux(video_stream.encode())
+        container.mux(audio_stream.encode())
+
+    monkeypatch.setattr(omni_vision_process, "get_video_reader_backend", lambda: "torchvision")
+    for clip in ({}, {"video_start": 0.5, "video_end": 2.0}):
+        messages = [{"role": "user", "content": [{"type": "video", "video": video_path, "nframes": 8, **clip}]}]
+        audios, images, videos, video_kwargs = process_mm_info_single_pass(messages, return_video_kwargs=True)
+        expected_images, expected_videos, expected_kwargs = process_vision_info(messages, return_video_kwargs=True)
+        assert images is None and expected_images is None
+        assert torch.equal(videos[0], expected_videos[0])
+        assert video_kwargs == expected_kwargs
+        assert np.array_equal(audios[0], process_audio_info(messages, use_audio_in_video=True)[0])
+
+
+def test_streaming_dataset(tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for shard in range(3):
+        rows = [{"problem": f"What is {shard * 10 + i}?", "answer": str(shard * 10 + i)} for i in range(10)]
+        if shard == 1:
+            rows.append({"problem": "Why? " * 100, "answer": "overlong"})
+
+        pq.write_table(pa.Table.from_pylist(rows), str(tmp_path / f"train-{shard}.parquet"), row_group_size=4)
+
+    tokenizer = get_tokenizer("Qwen/Qwen2.5-VL-7B-Instruct", use_fast=True)
+    kwargs = dict(
+        data_path=str(tmp_path),
+        tokenizer=tokenizer,
+        processor=None,
+        prompt_key="problem",
+        answer_key="answer",
+        max_prompt_length=64,
+        shuffle_buffer_size=8,
+        prompt_length_index_dir=str(tmp_path / "lengths"),
+    )
+    stream = iter(StreamingRLHFDataset(**kwargs))
+    answers = [next(stream)["ground_truth"] for _ in range(45)]
+    assert len(os.listdir(tmp_path / "lengths")) == 3  # the lengths of each shard are computed once
+    assert sorted(answers[:30], key=int) == [str(i) for i in range(30)]  # an epoch without the overlong prompt
+    assert answers[:30] != [str(i) for i in range(30)] and answers[30:45] != answers[:15]
+
+    dataset = StreamingRLHFDataset(**kwargs)
+    stream = iter(dataset)
+    for _ in range(13):
+        next(stream)
+
+    resumed = StreamingRLHFDataset(**kwargs)
+    resumed.load_state_dict(dataset.state_dict())
+    stream = iter(resumed)
+    assert [next(stream)["ground_truth"] for _ in range(32)] == answers[13:45]
+
+    def get_loader():
+        dataset = StreamingRLHFDataset(**kwargs)
+        return StatefulDataLoader(dataset, batch_size=4, num_workers=2, collate_fn=collate_fn, drop_last=True)
+
+    loader = get_loader()
+    batches = iter(loader)
+    for _ in range(5):
+        next(batches)
+
+    state_dict = loader.state_dict()
+    expected = [next(batches)["ground_truth"].tolist() for _ in range(6)]
+    loader = get_loader()
+    loader.load_state_dict(state_dict)
+    batches = iter(loader)
+    assert [next(batches)["ground_truth"].tolist() for _ in range(6)] == expected
+
+
 if __name__ == "__main__":
     test_image_dataset()
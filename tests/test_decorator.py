@@ -0,0 +1,66 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import torch
+
+from verl.protocol import DataProto
+from verl.single_controller.base.decorator import (
+    MAGIC_ATTR,
+    Dispatch,
+    dispatch_dp_compute_data_proto,
+    project_dispatch_fn,
+    register,
+)
+
+
+class _FakeWorkerGroup:
+    def __init__(self, world_size: int):
+        self.world_size = world_size
+        self.dispatch_bytes_saved = {}
+
+
+def _get_data_proto() -> DataProto:
+    return DataProto.from_dict(
+        tensors={"input_ids": torch.ones(4, 8, dtype=torch.long), "ground_truth_ids": torch.ones(4, 16)},
+        non_tensors={
+            "uid": np.array(list("abcd"), dtype=object),
+            "raw_prompt_ids": np.array(list("efgh"), dtype=object),
+        },
+        meta_info={"temperature": 1.0},
+    )
+
+
+def test_project_dispatch_fn():
+    worker_group = _FakeWorkerGroup(world_size=2)
+    dispatch_fn = project_dispatch_fn(dispatch_dp_compute_data_proto, "compute", ["input_ids", "uid"])
+    args, _ = dispatch_fn(worker_group, _get_data_proto())
+    assert len(args[0]) == 2
+    for shard in args[0]:
+        assert list(shard.batch.keys()) == ["input_ids"]
+        assert list(shard.non_tensor_batch.keys()) == ["uid"]
+        assert shard.meta_info == {"temperature": 1.0}
+
+    assert worker_group.dispatch_bytes_saved["compute"] == 4 * 16 * 4 + 4
+
+
+def test_register_output_keys():
+    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO, input_keys=["input_ids"], output_keys=["input_ids"])
+    def compute(data: DataProto) -> DataProto:
+        return data
+
+    assert getattr(compute, MAGIC_ATTR)["input_keys"] == ["input_ids"]
+    output = compute(_get_data_proto())
+    assert list(output.batch.keys()) == ["input_ids"]
+    assert len(output.non_tensor_batch) == 0
@@ -0,0 +1,83 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from collections import defaultdict
+
+import torch
+from safetensors.torch import save_file
+
+from verl.trainer.eval_server import CheckpointEvaluator, CheckpointGenerator, iterate_hf_weights
+
+
+class _TinyGenerator(CheckpointGenerator):
+    """A tiny CPU model, it answers the prompt token ids multiplied by its weight."""
+
+    def __init__(self):
+        self.weight = None
+        self.num_loads = 0
+
+    def load_weights(self, model_path):
+        self.weight = dict(iterate_hf_weights(model_path))["weight"]
+        self.num_loads += 1
+
+    def generate(self, prompts):
+        completions = []
+        for index, prompt in enumerate(prompts):
+            answer = str(int(self.weight.item() * prompt["raw_prompt_ids"][0]))
+            completions.append((index, [[1]], [1], [answer]))
+
+        return completions
+
+
+def _compute_reward(data):
+    reward_tensor = torch.zeros_like(data.batch["responses"], dtype=torch.float32)
+    reward_metrics = defaultdict(list)
+    for i, (response, ground_truth) in enumerate(
+        zip(data.non_tensor_batch["response_text"], data.non_tensor_batch["ground_truth"])
+    ):
+        reward_tensor[i, 0] = float(response == ground_truth)
+        reward_metrics["accuracy"].append(float(response == ground_truth))
+
+    return reward_tensor, reward_metrics
+
+
+def _save_checkpoint(checkpoint_dir, global_step, weight):
+    hf_path = os.path.join(checkpoint_dir, f"global_step_{global_step}", "actor", "huggingface")
+    os.makedirs(hf_path)
+    save_file({"weight": torch.tensor(weight)}, os.path.join(hf_path, "model.safetensors"))
+
+
+def test_checkpoint_evaluator(tmp_path):
+    checkpoint_dir, output_dir = str(tmp_path / "checkpoints"), str(tmp_path / "results")
+    _save_checkpoint(checkpoint_dir, 1, 1.0)
+    _save_checkpoint(checkpoint_dir, 2, 2.0)
+    prompts = [{"raw_prompt_ids": [i + 1], "ground_truth": str(2 * (i + 1))} for i in range(4)]
+    generator = _TinyGenerator()
+    evaluator = CheckpointEvaluator(generator, prompts, _compute_reward, output_dir, response_length=4, pad_token_id=0)
+    evaluator.serve(checkpoint_dir, exit_when_idle=True)
+    assert generator.num_loads == 2
+    with open(os.path.join(output_dir, "global_step_1.json")) as f:
+        assert json.load(f)["val/accuracy_reward"] == 0.0
+
+    with open(os.path.join(output_dir, "global_step_2.json")) as f:
+        assert json.load(f)["val/accuracy_reward"] == 1.0
+
+    # only the new checkpoint is evaluated after a restart
+    _save_checkpoint(checkpoint_dir, 3, 2.0)
+    evaluator = CheckpointEvaluator(generator, prompts, _compute_reward, output_dir, response_length=4, pad_token_id=0)
+    evaluator.serve(checkpoint_dir, exit_when_idle=True)
+    assert generator.num_loads == 3
+    assert os.path.exists(os.path.join(output_dir, "global_step_3.json"))
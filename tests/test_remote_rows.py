@@ -0,0 +1,109 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from copy import deepcopy
+
+import numpy as np
+import pytest
+import ray
+import torch
+
+from verl.protocol import REMOTE_ROWS_KEY, DataProto, DataProtoFuture, fetch_remote_rows
+from verl.single_controller.base.decorator import Dispatch, register
+from verl.trainer.ray_trainer import DRIVER_ROLLOUT_KEYS
+
+
+LOG_PROB_KEYS = ["input_ids", "attention_mask", "position_ids", "responses", "multi_modal_inputs"]
+
+
+@ray.remote
+class _RolloutWorker:
+    def __init__(self, rank: int):
+        self.rank = rank
+
+    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO, blocking=False)
+    def generate_sequences(self, prompts: DataProto) -> DataProto:
+        batch_size = len(prompts)
+        responses = prompts.batch["input_ids"] + 100 * (self.rank + 1)
+        return DataProto.from_dict(
+            tensors={
+                "prompts": prompts.batch["input_ids"],
+                "responses": responses,
+                "input_ids": torch.cat([prompts.batch["input_ids"], responses], dim=-1),
+                "attention_mask": torch.ones(batch_size, 8, dtype=torch.long),
+                "response_mask": torch.ones(batch_size, 4, dtype=torch.long),
+                "position_ids": torch.arange(8).expand(batch_size, 8),
+                "old_log_probs": torch.rand(batch_size, 4),
+            },
+            non_tensors={
+                "response_text": np.array([f"{self.rank}-{i}" for i in range(batch_size)], dtype=object),
+                "multi_modal_inputs": np.array(
+                    [{"rank": self.rank, "row": i} for i in range(batch_size)], dtype=object
+                ),
+            },
+        )
+
+    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO, input_keys=LOG_PROB_KEYS, output_keys=LOG_PROB_KEYS)
+    def compute_log_prob(self, data: DataProto) -> DataProto:
+        assert REMOTE_ROWS_KEY not in data.non_tensor_batch
+        return data
+
+
+def _run_driver_ops(data: DataProto) -> DataProto:
+    """The driver-side operations of the trainer: balance the batch, repeat and concat."""
+    data.reorder(torch.tensor([5, 2, 7, 0, 3, 6, 1, 4]))
+    return DataProto.concat([data, data.repeat(repeat_times=2, interleave=True).slice_select(0, 4)])
+
+
+def _assert_equal(data: DataProto, expected: DataProto) -> None:
+    assert sorted(data.batch.keys()) == sorted(expected.batch.keys())
+    assert sorted(data.non_tensor_batch.keys()) == sorted(expected.non_tensor_batch.keys())
+    for key in expected.batch.keys():
+        assert torch.equal(data.batch[key], expected.batch[key]), key
+
+    for key, value in expected.non_tensor_batch.items():
+        assert data.non_tensor_batch[key].tolist() == value.tolist(), key
+
+
+@pytest.fixture(scope="module")
+def local_ray():
+    ray.init(num_cpus=4, include_dashboard=False)
+    yield
+    ray.shutdown()
+
+
+def test_remote_rows(local_ray):
+    workers = [_RolloutWorker.remote(rank) for rank in range(2)]
+    prompts = DataProto.from_dict(tensors={"input_ids": torch.arange(32).view(8, 4)})
+    future = DataProtoFuture.concat(
+        [worker.generate_sequences.remote(shard) for worker, shard in zip(workers, prompts.chunk(2))]
+    )
+
+    fetched = future.fetch(batch_keys=DRIVER_ROLLOUT_KEYS, non_tensor_batch_keys=["response_text"])
+    assert sorted(fetched.batch.keys()) == ["attention_mask", "old_log_probs", "response_mask", "responses"]
+    assert sorted(fetched.non_tensor_batch.keys()) == [REMOTE_ROWS_KEY, "response_text"]
+
+    expected = _run_driver_ops(future.get())
+    fetched = _run_driver_ops(fetched)
+    _assert_equal(fetch_remote_rows(deepcopy(fetched)), expected)
+    _assert_equal(
+        fetch_remote_rows(deepcopy(fetched), keys=["input_ids"]),
+        expected.select(batch_keys=[*fetched.batch.keys(), "input_ids"], non_tensor_batch_keys=["response_text"]),
+    )
+
+    # the consumers pull the remote columns from the producing workers
+    outputs = ray.get([worker.compute_log_prob.remote(shard) for worker, shard in zip(workers, fetched.chunk(2))])
+    _assert_equal(
+        DataProto.concat(outputs), expected.select(batch_keys=LOG_PROB_KEYS, non_tensor_batch_keys=LOG_PROB_KEYS)
+    )
@@ -0,0 +1,160 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib.util
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from verl.protocol import DataProto
+from verl.workers.reward import (
+    ParallelFunctionRewardManager,
+    RewardConfig,
+    SequentialFunctionRewardManager,
+    StreamingRewardScorer,
+)
+
+
+REWARD_FUNCTION = """
+import time
+
+
+def compute_score(reward_input):
+    if reward_input["response"] == "slow":
+        time.sleep(60)
+
+    score = float(reward_input["response"] == reward_input["ground_truth"])
+    return {"overall": score, "accuracy": score}
+"""
+
+
+class _FakeTokenizer:
+    vocab = ["slow", "a", "b"]
+
+    def decode(self, sequence, skip_special_tokens=True):
+        return " ".join(self.vocab[token_id] for token_id in sequence)
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [self.decode(sequence) for sequence in sequences]
+
+
+def _get_reward_config(tmp_path, **kwargs) -> RewardConfig:
+    reward_function = tmp_path / "reward_function.py"
+    reward_function.write_text(REWARD_FUNCTION)
+    config = RewardConfig(reward_function=f"{reward_function}:compute_score", num_cpus=2, timeout=1.0, **kwargs)
+    config.post_init()
+    return config
+
+
+def test_parallel_reward_manager(tmp_path):
+    reward_manager = ParallelFunctionRewardManager(_get_reward_config(tmp_path), _FakeTokenizer())
+    data = DataProto.from_dict(
+        tensors={
+            "responses": torch.tensor([[1, 0], [0, 0], [2, 0]]),
+            "response_mask": torch.tensor([[1, 0], [1, 0], [1, 0]]),
+        },
+        non_tensors={"ground_truth": np.array(["a", "a", "a"], dtype=object)},
+    )
+    reward_tensor, reward_metrics = reward_manager.compute_reward(data)
+    assert reward_tensor[:, 0].tolist() == [1.0, 0.0, 0.0]
+    assert reward_metrics["timeout"] == [0.0, 1.0, 0.0]
+    assert reward_metrics["accuracy"] == [1.0, 0.0, 0.0]
+
+
+def test_reward_cache(tmp_path):
+    config = _get_reward_config(tmp_path, cache_size=16, cache_dir=str(tmp_path / "cache"))
+    data = DataProto.from_dict(
+        tensors={
+            "responses": torch.tensor([[1, 0], [1, 0], [2, 0]]),
+            "response_mask": torch.tensor([[1, 0], [1, 0], [1, 0]]),
+        },
+        non_tensors={"ground_truth": np.array(["a", "a", "a"], dtype=object)},
+    )
+    reward_manager = SequentialFunctionRewardManager(config, _FakeTokenizer())
+    reward_tensor, reward_metrics = reward_manager.compute_reward(data)
+    assert reward_tensor[:, 0].tolist() == [1.0, 1.0, 0.0]
+    assert reward_metrics["cache_hit"] == [0.0, 0.0, 0.0]
+
+    # a new manager reads the scores back from disk
+    reward_manager = SequentialFunctionRewardManager(config, _FakeTokenizer())
+    reward_tensor, reward_metrics = reward_manager.compute_reward(data)
+    assert reward_tensor[:, 0].tolist() == [1.0, 1.0, 0.0]
+    assert reward_metrics["cache_hit"] == [1.0, 1.0, 1.0]
+
+
+def test_streaming_reward_scorer(tmp_path):
+    reward_manager = SequentialFunctionRewardManager(_get_reward_config(tmp_path), _FakeTokenizer())
+    num_prompts, n = 8, 2
+    rng = random.Random(0)
+    token_ids = [[[rng.randint(1, 2)] for _ in range(n)] for _ in range(num_prompts)]
+    ground_truth = np.array([rng.choice(["a", "b"]) for _ in range(num_prompts)], dtype=object)
+
+    completion_queue = queue.Queue()
+
+    def generate(prompt_index: int, delay: float):
+        time.sleep(delay)
+        texts = [_FakeTokenizer().decode(sample) for sample in token_ids[prompt_index]]
+        completion_queue.put((prompt_index, token_ids[prompt_index], [1] * n, texts))
+
+    threads = [threading.Thread(target=generate, args=(i, rng.random() * 0.1)) for i in range(num_prompts)]
+    for thread in threads:
+        thread.start()
+
+    scorer = StreamingRewardScorer(
+        reward_manager.compute_reward,
+        ground_truth=np.repeat(ground_truth, n),
+        num_repeat=n,
+        response_length=4,
+        pad_token_id=0,
+    )
+    scorer.consume(completion_queue, num_prompts=num_prompts)
+    reward_tensor, reward_metrics = scorer.finalize()
+    for thread in threads:
+        thread.join()
+
+    # the scores are identical to scoring the whole batch at once
+    responses = torch.tensor([sample + [0] * 3 for samples in token_ids for sample in samples])
+    data = DataProto.from_dict(
+        tensors={"responses": responses, "response_mask": (responses != 0).long()},
+        non_tensors={"ground_truth": np.repeat(ground_truth, n)},
+    )
+    expected_tensor, expected_metrics = reward_manager.compute_reward(data)
+    assert torch.equal(reward_tensor, expected_tensor)
+    assert reward_metrics["accuracy"] == expected_metrics["accuracy"]
+
+
+def test_batched_brisque_reward():
+    pytest.importorskip("piq")
+    reward_function = os.path.join(os.path.dirname(__file__), "..", "examples", "reward_function", "diffusion.py")
+    spec = importlib.util.spec_from_file_location("diffusion_reward", reward_function)
+    diffusion_reward = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(diffusion_reward)
+
+    torch.manual_seed(0)
+    reward_inputs = [
+        {"images": torch.rand(3, 64, 64)},
+        {"videos": torch.rand(16, 3, 64, 64) * 255},
+        {"images": torch.rand(3, 48, 64) * 2 - 1},
+        {"videos": torch.rand(9, 3, 48, 64)},
+    ]
+    expected = diffusion_reward.compute_score(reward_inputs, batched=False, seed=0)
+    scores = diffusion_reward.compute_score(reward_inputs, batched=True, chunk_size=3, seed=0)
+    for score, expected_score in zip(scores, expected):
+        assert score["overall"] == pytest.approx(expected_score["overall"], abs=1e-4)
@@ -46,6 +46,10 @@ except Exception:
 __all__ = ["DataProto", "union_tensor_dict"]
 
 
+# non-tensor key holding (shard_ref, row) pairs of the columns that are kept in the producing workers
+REMOTE_ROWS_KEY = "remote_rows"
+
+
 def pad_dataproto_to_divisor(data: "DataProto", size_divisor: int) -> Tuple["DataProto", int]:
     """Pad a DataProto to size divisible by size_divisor
 
@@ -696,6 +700,96 @@ class DataProtoFuture:
 
         return outputs
 
+    def fetch(
+        self, batch_keys: Optional[List[str]] = None, non_tensor_batch_keys: Optional[List[str]] = None
+    ) -> DataProto:
+        """Fetch a subset of the columns to the driver, the other columns stay in the object stores of the
+        producing workers and are referenced row by row in `REMOTE_ROWS_KEY`. They are pulled by the consumers
+        directly, see `fetch_remote_rows`.
+
+        Args:
+            batch_keys (list, optional): the tensor keys to fetch, keys that do not exist are ignored, None means
+                all the tensor keys
+            non_tensor_batch_keys (list, optional): the non-tensor keys to fetch, None means no non-tensor key
+
+        Returns:
+            DataProto: the DataProto with the fetched columns
+        """
+        assert self.collect_fn is DataProto.concat and self.dispatch_fn is None, "Only support unsplitted futures."
+        local_refs, remote_refs = [], []
+        for future in self.futures:
+            local_ref, remote_ref = _split_columns.remote(future, batch_keys, non_tensor_batch_keys or [])
+            local_refs.append(local_ref)
+            remote_refs.append(remote_ref)
+
+        local_shards: List[DataProto] = ray.get(local_refs)
+        for shard, remote_ref in zip(local_shards, remote_refs):
+            remote_rows = np.empty(len(shard), dtype=object)  # avoid numpy unpacking the tuples
+            for row in range(len(shard)):
+                remote_rows[row] = (remote_ref, row)
+
+            shard.non_tensor_batch[REMOTE_ROWS_KEY] = remote_rows
+
+        return DataProto.concat(local_shards)
+
+
+@ray.remote(num_returns=2)
+def _split_columns(
+    data: DataProto, batch_keys: Optional[List[str]], non_tensor_batch_keys: List[str]
+) -> Tuple[DataProto, DataProto]:
+    # scheduled next to the shard by ray's locality-aware scheduling
+    all_batch_keys = list(data.batch.keys()) if data.batch is not None else []
+    batch_keys = all_batch_keys if batch_keys is None else [key for key in batch_keys if key in all_batch_keys]
+    local_data = DataProto(
+        batch=data.batch.select(*batch_keys) if data.batch is not None else None,
+        non_tensor_batch={k: v for k, v in data.non_tensor_batch.items() if k in non_tensor_batch_keys},
+        meta_info=data.meta_info,
+    )
+    remote_data = DataProto(
+        batch=data.batch.exclude(*batch_keys) if data.batch is not None else None,
+        non_tensor_batch={k: v for k, v in data.non_tensor_batch.items() if k not in non_tensor_batch_keys},
+    )
+    return local_data, remote_data
+
+
+@ray.remote
+def _select_rows(data: DataProto, rows: List[int], keys: Optional[List[str]]) -> DataProto:
+    # scheduled next to the shard by ray's locality-aware scheduling
+    data = data.select(batch_keys=keys, non_tensor_batch_keys=keys)
+    return data.index_select(rows)
+
+
+def fetch_remote_rows(data: DataProto, keys: Optional[List[str]] = None) -> DataProto:
+    """Pull the columns referenced in `REMOTE_ROWS_KEY` from the object stores of the producing workers.
+
+    Args:
+        data (DataProto): the DataProto with remote rows, it is modified in place
+        keys (list, optional): the keys to pull, None means all the remote keys
+
+    Returns:
+        DataProto: the DataProto with the remote columns attached
+    """
+    if REMOTE_ROWS_KEY not in data.non_tensor_batch:
+        return data
+
+    remote_rows = data.non_tensor_batch.pop(REMOTE_ROWS_KEY)
+    shard_rows: Dict[ray.ObjectRef, List[int]] = {}
+    shard_positions: Dict[ray.ObjectRef, List[int]] = {}
+    for position, (ref, row) in enumerate(remote_rows):
+        shard_rows.setdefault(ref, []).append(row)
+        shard_positions.setdefault(ref, []).append(position)
+
+    # only the referenced rows and keys of each shard leave the producing workers
+    shards: List[DataProto] = ray.get([_select_rows.remote(ref, rows, keys) for ref, rows in shard_rows.items()])
+    positions = np.concatenate([shard_positions[ref] for ref in shard_rows])
+    remote_data = DataProto.concat(shards).index_select(np.argsort(positions))
+    if remote_data.batch is not None:
+        for key, value in remote_data.batch.items():
+            data.batch[key] = value
+
+    data.non_tensor_batch.update(remote_data.non_tensor_batch)
+    return data
+
 
 def allgather_dict_tensors(
     tensors: Union[Dict[str, torch.Tensor], TensorDict], size: int, group: ProcessGroup, dim: int = 0
@@ -15,11 +15,13 @@
 from enum import Enum, auto
 from functools import wraps
 from types import FunctionType
-from typing import TYPE_CHECKING, Dict, List, Literal, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple, Union
 
+import numpy as np
 import ray
+import torch
 
-from ...protocol import DataProto, DataProtoFuture
+from ...protocol import REMOTE_ROWS_KEY, DataProto, DataProtoFuture, fetch_remote_rows
 
 
 if TYPE_CHECKING:
@@ -195,7 +197,106 @@ def _materialize_futures(*args, **kwargs):
     return new_args, kwargs
 
 
-def register(dispatch_mode=Dispatch.ALL_TO_ALL, execute_mode=Execute.ALL, blocking=True, materialize_futures=True):
+def _materialize_remote_rows(args: Tuple[Any], kwargs: Dict[str, Any], keys: Optional[List[str]] = None):
+    # pull the columns kept in the producing workers, see `DataProtoFuture.fetch`
+    new_args = tuple(fetch_remote_rows(arg, keys) if isinstance(arg, DataProto) else arg for arg in args)
+    for key, value in kwargs.items():
+        if isinstance(value, DataProto):
+            kwargs[key] = fetch_remote_rows(value, keys)
+
+    return new_args, kwargs
+
+
+def _get_nbytes(value: Any) -> int:
+    """Estimate the payload size of a (possibly nested) value in bytes."""
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.numel()
+    elif isinstance(value, np.ndarray):
+        if value.dtype == np.dtype(object):
+            return sum(_get_nbytes(item) for item in value.flat)
+
+        return value.nbytes
+    elif isinstance(value, dict):
+        return sum(_get_nbytes(item) for item in value.values())
+    elif isinstance(value, (list, tuple)):
+        return sum(_get_nbytes(item) for item in value)
+    elif isinstance(value, (str, bytes)):
+        return len(value)
+    else:
+        return 0
+
+
+def _project_data_proto(data: DataProto, keys: List[str]) -> Tuple[DataProto, int]:
+    """Keep only the declared keys of a DataProto.
+
+    Args:
+        data (DataProto): the DataProto to project
+        keys (List[str]): the keys to keep, either in batch or in non_tensor_batch
+
+    Returns:
+        data (DataProto): the projected DataProto, meta_info is kept as is
+        dropped_bytes (int): the number of bytes that were dropped
+    """
+    dropped_bytes = 0
+    if data.batch is not None:
+        batch_keys = [key for key in data.batch.keys() if key in keys]
+        dropped_bytes += sum(_get_nbytes(data.batch[key]) for key in data.batch.keys() if key not in keys)
+    else:
+        batch_keys = None
+
+    keys = [*keys, REMOTE_ROWS_KEY]  # remote rows are projected when they are pulled
+    non_tensor_batch_keys = [key for key in data.non_tensor_batch.keys() if key in keys]
+    dropped_bytes += sum(_get_nbytes(value) for key, value in data.non_tensor_batch.items() if key not in keys)
+    if dropped_bytes == 0:
+        return data, 0
+
+    return data.select(batch_keys=batch_keys, non_tensor_batch_keys=non_tensor_batch_keys), dropped_bytes
+
+
+def project_dispatch_fn(dispatch_fn: FunctionType, method_name: str, input_keys: List[str]) -> FunctionType:
+    """Wrap a dispatch fn so that DataProto arguments are projected to `input_keys` before they are split.
+
+    The number of dropped bytes of the last call is recorded in `worker_group.dispatch_bytes_saved[method_name]`.
+    """
+
+    @wraps(dispatch_fn)
+    def inner(worker_group: "WorkerGroup", *args, **kwargs):
+        saved_bytes = 0
+        new_args = []
+        for arg in args:
+            if isinstance(arg, DataProto):
+                arg, dropped_bytes = _project_data_proto(arg, input_keys)
+                saved_bytes += dropped_bytes
+
+            new_args.append(arg)
+
+        for key, value in kwargs.items():
+            if isinstance(value, DataProto):
+                kwargs[key], dropped_bytes = _project_data_proto(value, input_keys)
+                saved_bytes += dropped_bytes
+
+        worker_group.dispatch_bytes_saved[method_name] = saved_bytes
+        return dispatch_fn(worker_group, *new_args, **kwargs)
+
+    return inner
+
+
+def register(
+    dispatch_mode=Dispatch.ALL_TO_ALL,
+    execute_mode=Execute.ALL,
+    blocking=True,
+    materialize_futures=True,
+    input_keys: Optional[List[str]] = None,
+    output_keys: Optional[List[str]] = None,
+):
+    """Register a worker method to be called by the WorkerGroup.
+
+    Args:
+        input_keys (List[str], optional): if given, DataProto inputs are projected to these keys on the driver
+            before they are serialized, keys that do not exist in the data are ignored.
+        output_keys (List[str], optional): if given, DataProto outputs are projected to these keys on the worker
+            before they are returned.
+    """
     _check_dispatch_mode(dispatch_mode=dispatch_mode)
     _check_execute_mode(execute_mode=execute_mode)
 
@@ -204,9 +305,21 @@ def register(dispatch_mode=Dispatch.ALL_TO_ALL, execute_mode=Execute.ALL, blocki
         def inner(*args, **kwargs):
             if materialize_futures:
                 args, kwargs = _materialize_futures(*args, **kwargs)
-            return func(*args, **kwargs)
+                args, kwargs = _materialize_remote_rows(args, kwargs, input_keys)
+
+            output = func(*args, **kwargs)
+            if output_keys is not None and isinstance(output, DataProto):
+                output, _ = _project_data_proto(output, output_keys)
+
+            return output
 
-        attrs = {"dispatch_mode": dispatch_mode, "execute_mode": execute_mode, "blocking": blocking}
+        attrs = {
+            "dispatch_mode": dispatch_mode,
+            "execute_mode": execute_mode,
+            "blocking": blocking,
+            "input_keys": input_keys,
+            "output_keys": output_keys,
+        }
         setattr(inner, MAGIC_ATTR, attrs)
         return inner
 
@@ -21,7 +21,13 @@ import threading
 import time
 from typing import Any, Callable, Dict, List, Optional
 
-from .decorator import MAGIC_ATTR, Dispatch, get_predefined_dispatch_fn, get_predefined_execute_fn
+from .decorator import (
+    MAGIC_ATTR,
+    Dispatch,
+    get_predefined_dispatch_fn,
+    get_predefined_execute_fn,
+    project_dispatch_fn,
+)
 
 
 class ResourcePool:
@@ -107,6 +113,9 @@ class WorkerGroup:
 
         self._checker_thread: threading.Thread = None
 
+        # bytes dropped by the input projection of the last call, keyed by method name
+        self.dispatch_bytes_saved: Dict[str, int] = {}
+
     def _is_worker_alive(self, worker):
         raise NotImplementedError("WorkerGroup._is_worker_alive called, should be implemented in derived class.")
 
@@ -166,6 +175,10 @@ class WorkerGroup:
                     dispatch_fn = dispatch_mode["dispatch_fn"]
                     collect_fn = dispatch_mode["collect_fn"]
 
+                # project the inputs to the declared keys, the outputs are projected by the worker itself
+                if attribute.get("input_keys") is not None:
+                    dispatch_fn = project_dispatch_fn(dispatch_fn, method_name, attribute["input_keys"])
+
                 # get execute_fn_name
                 execute_mode = get_predefined_execute_fn(execute_mode=execute_mode)
                 wg_execute_fn_name = execute_mode["execute_fn_name"]
@@ -43,18 +43,25 @@ class DataConfig:
     video_key: str = "videos"
     video_dir: Optional[str] = None
     cache_dir: Optional[str] = None
+    frame_cache_dir: Optional[str] = None
+    frame_cache_gb: float = 100.0
+    audio_feature_dir: Optional[str] = None
     max_prompt_length: int = 512
     max_response_length: int = 512
     rollout_batch_size: int = 512
     mini_rollout_batch_size: Optional[int] = None
     val_batch_size: int = -1
+    val_chunk_size: int = -1
     format_prompt: Optional[str] = None
     override_chat_template: Optional[str] = None
     shuffle: bool = True
     seed: int = 1
+    streaming: bool = False
+    shuffle_buffer_size: int = 1024
     min_pixels: Optional[int] = 262144
     max_pixels: Optional[int] = 4194304
     filter_overlong_prompts: bool = True
+    prompt_length_index_dir: Optional[str] = None
     vila_model: bool = False
     diffusion: bool = False
     is_omni: bool = False
@@ -76,6 +83,15 @@ class DataConfig:
                 print(f"Format prompt file {self.format_prompt} not found.")
                 self.format_prompt = None
 
+        if self.frame_cache_dir is not None:
+            self.frame_cache_dir = os.path.abspath(os.path.expanduser(self.frame_cache_dir))
+
+        if self.audio_feature_dir is not None:
+            self.audio_feature_dir = os.path.abspath(os.path.expanduser(self.audio_feature_dir))
+
+        if self.prompt_length_index_dir is not None:
+            self.prompt_length_index_dir = os.path.abspath(os.path.expanduser(self.prompt_length_index_dir))
+
 
 @dataclass
 class AlgorithmConfig:
@@ -143,12 +159,20 @@ class TrainerConfig:
     """max number of checkpoints to save, -1 means no limit"""
     save_model_only: bool = False
     """save model only, no optimizer state dict"""
+    async_save: bool = False
+    """snapshot the states into pinned memory and write the checkpoint in background"""
+    checkpoint_format: str = "torch"
+    """checkpoint format, `torch` saves a file per rank, `dcp` saves a distributed checkpoint loadable under any world size"""
+    save_hf_weights: bool = False
+    """export the actor weights as huggingface safetensors at save time, no need to run the model merger"""
     save_checkpoint_path: Optional[str] = None
     """save checkpoint path, if not specified, use `checkpoints/project_name/experiment_name`"""
     load_checkpoint_path: Optional[str] = None
     """load checkpoint path"""
     diffusion: bool = False
     """whether to use diffusion trainer"""
+    remote_rollout_data: bool = False
+    """keep the non-tensor rollout outputs in the rollout workers, consumers pull them directly"""
 
     def post_init(self):
         if self.save_checkpoint_path is None:
@@ -12,20 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import torch
 from torch.utils.data import RandomSampler, SequentialSampler
 from torchdata.stateful_dataloader import StatefulDataLoader
 from transformers import PreTrainedTokenizer, ProcessorMixin
 
-from ..utils.dataset import RLHFDataset, collate_fn
+from ..utils.dataset import RLHFDataset, StreamingRLHFDataset, collate_fn
 from .config import DataConfig
 
 
-def create_dataloader(config: DataConfig, tokenizer: PreTrainedTokenizer, processor: Optional[ProcessorMixin]) -> None:
-    train_dataset = RLHFDataset(
-        data_path=config.train_files,
+def get_dataset_kwargs(
+    config: DataConfig, tokenizer: PreTrainedTokenizer, processor: Optional[ProcessorMixin]
+) -> Dict[str, Any]:
+    """The arguments of `RLHFDataset` shared by the train and val sets."""
+    return dict(
         tokenizer=tokenizer,
         processor=processor,
         prompt_key=config.prompt_key,
@@ -35,30 +37,50 @@ def create_dataloader(config: DataConfig, tokenizer: PreTrainedTokenizer, proces
         video_key=config.video_key,
         video_dir=config.video_dir,
         cache_dir=config.cache_dir,
+        frame_cache_dir=config.frame_cache_dir,
+        frame_cache_gb=config.frame_cache_gb,
+        audio_feature_dir=config.audio_feature_dir,
         max_prompt_length=config.max_prompt_length,
         truncation="right",
         format_prompt=config.format_prompt,
         min_pixels=config.min_pixels,
         max_pixels=config.max_pixels,
         filter_overlong_prompts=config.filter_overlong_prompts,
+        prompt_length_index_dir=config.prompt_length_index_dir,
         vila_model=config.vila_model,
         diffusion=config.diffusion,
         is_omni=config.is_omni,
         audio_max_length=config.audio_max_length,
     )
-    # use sampler for better ckpt resume
-    if config.shuffle:
-        train_dataloader_generator = torch.Generator()
-        train_dataloader_generator.manual_seed(config.seed)
-        sampler = RandomSampler(data_source=train_dataset, generator=train_dataloader_generator)
-    else:
-        sampler = SequentialSampler(data_source=train_dataset)
 
+
+def create_dataloader(config: DataConfig, tokenizer: PreTrainedTokenizer, processor: Optional[ProcessorMixin]) -> None:
+    dataset_kwargs = get_dataset_kwargs(config, tokenizer, processor)
     if config.mini_rollout_batch_size is not None:
         train_batch_size = config.mini_rollout_batch_size
     else:
         train_batch_size = config.rollout_batch_size
 
+    if config.streaming:
+        # the dataset shuffles and keeps its own position, which the dataloader saves with the checkpoint
+        train_dataset = StreamingRLHFDataset(
+            data_path=config.train_files,
+            shuffle=config.shuffle,
+            shuffle_buffer_size=config.shuffle_buffer_size,
+            seed=config.seed,
+            **dataset_kwargs,
+        )
+        sampler = None
+    else:
+        train_dataset = RLHFDataset(data_path=config.train_files, **dataset_kwargs)
+        # use sampler for better ckpt resume
+        if config.shuffle:
+            train_dataloader_generator = torch.Generator()
+            train_dataloader_generator.manual_seed(config.seed)
+            sampler = RandomSampler(data_source=train_dataset, generator=train_dataloader_generator)
+        else:
+            sampler = SequentialSampler(data_source=train_dataset)
+
     train_dataloader = StatefulDataLoader(
         dataset=train_dataset,
         batch_size=train_batch_size,
@@ -69,34 +91,16 @@ def create_dataloader(config: DataConfig, tokenizer: PreTrainedTokenizer, proces
         drop_last=True,
     )
 
-    val_dataset = RLHFDataset(
-        data_path=config.val_files,
-        tokenizer=tokenizer,
-        processor=processor,
-        prompt_key=config.prompt_key,
-        answer_key=config.answer_key,
-        image_key=config.image_key,
-        image_dir=config.image_dir,
-        video_key=config.video_key,
-        video_dir=config.video_dir,
-        cache_dir=config.cache_dir,
-        max_prompt_length=config.max_prompt_length,
-        truncation="right",
-        format_prompt=config.format_prompt,
-        min_pixels=config.min_pixels,
-        max_pixels=config.max_pixels,
-        filter_overlong_prompts=config.filter_overlong_prompts,
-        vila_model=config.vila_model,
-        diffusion=config.diffusion,
-        is_omni=config.is_omni,
-        audio_max_length=config.audio_max_length,
-    )
+    val_dataset = RLHFDataset(data_path=config.val_files, **dataset_kwargs)
 
     if config.val_batch_size == -1:
         val_batch_size = len(val_dataset)
     else:
         val_batch_size = config.val_batch_size
 
+    if config.val_chunk_size > 0:  # stream the validation set in chunks to bound the driver memory
+        val_batch_size = min(val_batch_size, config.val_chunk_size)
+
     val_dataloader = StatefulDataLoader(
         dataset=val_dataset,
         batch_size=val_batch_size,
@@ -107,8 +111,10 @@ def create_dataloader(config: DataConfig, tokenizer: PreTrainedTokenizer, proces
         drop_last=False,
     )
 
-    assert len(train_dataloader) >= 1
+    if not config.streaming:  # the length of a stream is unknown
+        assert len(train_dataloader) >= 1
+        print(f"Size of train dataloader: {len(train_dataloader)}")
+
     assert len(val_dataloader) >= 1
-    print(f"Size of train dataloader: {len(train_dataloader)}")
     print(f"Size of val dataloader: {len(val_dataloader)}")
     return train_dataloader, val_dataloader
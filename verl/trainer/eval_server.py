@@ -0,0 +1,296 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A long-lived evaluator that keeps the inference engine and the validation set resident, watches the checkpoint
+directory and hot-swaps the weights of every new checkpoint.
+
+python3 -m verl.trainer.eval_server config=examples/config.yaml \
+    eval.checkpoint_dir=checkpoints/easy_r1/exp_name eval.output_dir=eval_results/exp_name
+"""
+
+import glob
+import json
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from omegaconf import OmegaConf
+from transformers import PreTrainedTokenizer, ProcessorMixin
+
+from ..protocol import DataProto
+from ..utils import torch_functional as VF
+from ..utils.checkpoint import is_ckpt_complete
+from ..workers.reward import StreamingRewardScorer
+from ..workers.reward.streaming import Completion
+from ..workers.rollout.config import RolloutConfig
+from .config import PPOConfig
+
+
+class CheckpointGenerator(ABC):
+    """A generator whose weights can be replaced in place."""
+
+    @abstractmethod
+    def load_weights(self, model_path: str) -> None:
+        """Load the huggingface weights in `model_path`."""
+        ...
+
+    @abstractmethod
+    def generate(self, prompts: List[Dict[str, Any]]) -> List[Completion]:
+        """Generate the responses of the pre-processed prompts, one completion per prompt."""
+        ...
+
+
+def iterate_hf_weights(model_path: str) -> Iterator[Tuple[str, torch.Tensor]]:
+    """Read the safetensors files one tensor at a time."""
+    from safetensors import safe_open
+
+    for filename in sorted(glob.glob(os.path.join(model_path, "*.safetensors"))):
+        with safe_open(filename, framework="pt", device="cpu") as f:
+            for key in f.keys():
+                yield key, f.get_tensor(key)
+
+
+class VLLMGenerator(CheckpointGenerator):
+    """A single-process vLLM engine, created once and reused for every checkpoint."""
+
+    def __init__(self, model_path: str, config: RolloutConfig, tokenizer: PreTrainedTokenizer):
+        os.environ.setdefault("VLLM_ENABLE_V1_MULTIPROCESSING", "0")  # keep the model in this process
+        from vllm import LLM, SamplingParams
+
+        self.llm = LLM(
+            model=model_path,
+            skip_tokenizer_init=False,
+            trust_remote_code=config.trust_remote_code,
+            load_format="dummy",  # the weights come from the checkpoints
+            dtype=config.dtype if config.dtype != "bf16" else "bfloat16",
+            seed=config.seed,
+            tensor_parallel_size=1,
+            gpu_memory_utilization=config.gpu_memory_utilization,
+            max_model_len=config.max_model_len or config.prompt_length + config.response_length,
+            max_num_batched_tokens=config.max_num_batched_tokens,
+            enforce_eager=config.enforce_eager,
+            disable_log_stats=config.disable_log_stats,
+            limit_mm_per_prompt={"image": config.limit_images} if config.limit_images > 0 else None,
+        )
+        sampling_kwargs = {
+            "n": 1,
+            "temperature": config.temperature,
+            "top_p": config.top_p,
+            "top_k": config.top_k,
+            "max_tokens": config.response_length,
+            "detokenize": True,
+        }
+        sampling_kwargs.update(config.val_override_config)
+        self.sampling_params = SamplingParams(**sampling_kwargs)
+        self.config = config
+        self.tokenizer = tokenizer
+
+    def load_weights(self, model_path: str) -> None:
+        model = self.llm.llm_engine.model_executor.driver_worker.worker.model_runner.model
+        model.load_weights(iterate_hf_weights(model_path))
+        self.llm.reset_prefix_cache()  # the cached kv states belong to the old weights
+
+    def generate(self, prompts: List[Dict[str, Any]]) -> List[Completion]:
+        from ..workers.rollout.vllm_rollout_spmd import _process_multi_modal_data
+
+        vllm_inputs = []
+        for prompt in prompts:
+            vllm_input = {"prompt_token_ids": list(prompt["raw_prompt_ids"])}
+            if prompt.get("multi_modal_data") is not None:
+                multi_modal_data = prompt["multi_modal_data"]
+                if "video" not in multi_modal_data:
+                    multi_modal_data = _process_multi_modal_data(
+                        multi_modal_data, prompt["min_pixels"], prompt["max_pixels"]
+                    )
+
+                vllm_input["multi_modal_data"] = multi_modal_data
+
+            vllm_inputs.append(vllm_input)
+
+        outputs = self.llm.generate(vllm_inputs, sampling_params=self.sampling_params, use_tqdm=False)
+        completions = []
+        for index, output in enumerate(outputs):
+            sample_token_ids = [list(sample.token_ids) for sample in output.outputs]
+            sample_lengths = VF.get_response_mask(
+                response_ids=VF.pad_2d_list_to_length(sample_token_ids, self.tokenizer.pad_token_id),
+                eos_token_id=self.tokenizer.eos_token_id,
+            ).sum(-1)
+            completions.append((index, sample_token_ids, sample_lengths.tolist(), [s.text for s in output.outputs]))
+
+        return completions
+
+
+class CheckpointEvaluator:
+    """Evaluate the checkpoints with a resident generator and validation set.
+
+    Results are written to `{output_dir}/global_step_{step}.json`, checkpoints with results are skipped, so the
+    evaluator can be restarted at any time.
+
+    Args:
+        generator (CheckpointGenerator): the generator, its weights are replaced for every checkpoint
+        prompts (List[Dict]): the pre-processed validation set, with `raw_prompt_ids` and `ground_truth`
+        compute_reward (Callable): the `compute_reward` method of a reward manager
+        output_dir (str): the directory of the results
+        response_length (int): the max response length
+        pad_token_id (int): the pad token of the responses
+    """
+
+    def __init__(
+        self,
+        generator: CheckpointGenerator,
+        prompts: List[Dict[str, Any]],
+        compute_reward: Callable[[DataProto], Any],
+        output_dir: str,
+        response_length: int,
+        pad_token_id: int,
+    ):
+        self.generator = generator
+        self.prompts = prompts
+        self.compute_reward = compute_reward
+        self.output_dir = output_dir
+        self.response_length = response_length
+        self.pad_token_id = pad_token_id
+        os.makedirs(output_dir, exist_ok=True)
+
+    def get_result_path(self, global_step: int) -> str:
+        return os.path.join(self.output_dir, f"global_step_{global_step}.json")
+
+    def find_new_checkpoints(self, checkpoint_dir: str) -> List[Tuple[int, str]]:
+        """Find the complete checkpoints with huggingface weights and without results, in order of steps."""
+        checkpoints = []
+        for folder in os.listdir(checkpoint_dir) if os.path.isdir(checkpoint_dir) else []:
+            match = re.fullmatch(r"global_step_(\d+)", folder)
+            if match is None or os.path.exists(self.get_result_path(int(match.group(1)))):
+                continue
+
+            folder_path = os.path.join(checkpoint_dir, folder)
+            hf_path = os.path.join(folder_path, "actor", "huggingface")
+            if is_ckpt_complete(folder_path) and glob.glob(os.path.join(hf_path, "*.safetensors")):
+                checkpoints.append((int(match.group(1)), hf_path))
+
+        return sorted(checkpoints)
+
+    def evaluate(self, global_step: int, model_path: str) -> Dict[str, Any]:
+        self.generator.load_weights(model_path)
+        completions = self.generator.generate(self.prompts)
+        num_repeat = len(completions[0][1])
+        ground_truth = np.array([prompt["ground_truth"] for prompt in self.prompts], dtype=object)
+        scorer = StreamingRewardScorer(
+            self.compute_reward,
+            ground_truth=np.repeat(ground_truth, num_repeat),
+            num_repeat=num_repeat,
+            response_length=self.response_length,
+            pad_token_id=self.pad_token_id,
+        )
+        scorer.submit(completions)
+        reward_tensor, reward_metrics = scorer.finalize()
+        result = {"global_step": global_step, "model_path": model_path, "num_samples": len(reward_tensor)}
+        result["val/reward_score"] = reward_tensor.sum(-1).mean().item()
+        result.update({f"val/{key}_reward": float(np.mean(value)) for key, value in reward_metrics.items()})
+
+        # write to a temporary file first, a result file always holds the complete result
+        result_path = self.get_result_path(global_step)
+        with open(result_path + ".tmp", "w") as f:
+            json.dump(result, f, indent=2)
+
+        os.replace(result_path + ".tmp", result_path)
+        return result
+
+    def serve(self, checkpoint_dir: str, poll_interval: float = 60.0, exit_when_idle: bool = False) -> None:
+        while True:
+            checkpoints = self.find_new_checkpoints(checkpoint_dir)
+            for global_step, model_path in checkpoints:
+                print(f"Evaluating checkpoint {model_path}.")
+                result = self.evaluate(global_step, model_path)
+                print(f"Results of step {global_step}: {json.dumps(result)}")
+
+            if not checkpoints:
+                if exit_when_idle:
+                    return
+
+                time.sleep(poll_interval)
+
+
+def _load_prompts(config: PPOConfig, tokenizer: PreTrainedTokenizer, processor: Optional[ProcessorMixin]):
+    from ..utils.dataset import RLHFDataset
+    from .data_loader import get_dataset_kwargs
+
+    val_dataset = RLHFDataset(data_path=config.data.val_files, **get_dataset_kwargs(config.data, tokenizer, processor))
+    prompts = []
+    for index in range(len(val_dataset)):
+        example = val_dataset[index]
+        prompts.append(
+            {
+                "raw_prompt_ids": example["raw_prompt_ids"],
+                "multi_modal_data": example.get("multi_modal_data"),
+                "ground_truth": example["ground_truth"],
+                "min_pixels": config.data.min_pixels,
+                "max_pixels": config.data.max_pixels,
+            }
+        )
+
+    return prompts
+
+
+def main():
+    from ..utils.tokenizer import get_processor, get_tokenizer
+    from ..workers.reward import get_reward_manager_cls
+
+    cli_args = OmegaConf.from_cli()
+    eval_args = cli_args.pop("eval", {})
+    default_config = OmegaConf.structured(PPOConfig())
+    if hasattr(cli_args, "config"):
+        config_path = cli_args.pop("config", None)
+        default_config = OmegaConf.merge(default_config, OmegaConf.load(config_path))
+
+    config: PPOConfig = OmegaConf.to_object(OmegaConf.merge(default_config, cli_args))
+    config.deep_post_init()
+
+    model_path = config.worker.actor.model.model_path
+    tokenizer = get_tokenizer(
+        model_path,
+        override_chat_template=config.data.override_chat_template,
+        trust_remote_code=config.worker.actor.model.trust_remote_code,
+        use_fast=True,
+    )
+    processor = get_processor(
+        model_path,
+        override_chat_template=config.data.override_chat_template,
+        trust_remote_code=config.worker.actor.model.trust_remote_code,
+        use_fast=True,
+        num_video_frames=config.worker.rollout.num_video_frames,
+    )
+    reward_fn = get_reward_manager_cls(config.worker.reward.reward_type)(config.worker.reward, tokenizer)
+
+    evaluator = CheckpointEvaluator(
+        generator=VLLMGenerator(model_path, config.worker.rollout, tokenizer),
+        prompts=_load_prompts(config, tokenizer, processor),
+        compute_reward=reward_fn.compute_reward,
+        output_dir=eval_args.get("output_dir", os.path.join(config.trainer.save_checkpoint_path, "eval")),
+        response_length=config.data.max_response_length,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    evaluator.serve(
+        eval_args.get("checkpoint_dir", config.trainer.save_checkpoint_path),
+        poll_interval=eval_args.get("poll_interval", 60.0),
+        exit_when_idle=eval_args.get("exit_when_idle", False),
+    )
+
+
+if __name__ == "__main__":
+    main()
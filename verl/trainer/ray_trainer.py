@@ -24,32 +24,37 @@ from collections import defaultdict
 from copy import deepcopy
 from dataclasses import dataclass, field
 from enum import IntEnum, auto
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 import numpy as np
 import ray
 import torch
 from ray.experimental.tqdm_ray import tqdm
+from ray.util.queue import Queue
 from torchdata.stateful_dataloader import StatefulDataLoader
 from transformers import PreTrainedTokenizer, ProcessorMixin
 
-from ..protocol import DataProto, pad_dataproto_to_divisor, unpad_dataproto
+from ..protocol import DataProto, DataProtoFuture, pad_dataproto_to_divisor, unpad_dataproto
 from ..single_controller.base import Worker
 from ..single_controller.ray import RayClassWithInitArgs, RayResourcePool, RayWorkerGroup
 from ..single_controller.ray.base import create_colocated_worker_cls
 from ..utils import torch_functional as VF
-from ..utils.checkpoint import CHECKPOINT_TRACKER, remove_obsolete_ckpt
+from ..utils.checkpoint import CHECKPOINT_TRACKER, find_latest_complete_ckpt, is_ckpt_complete, remove_obsolete_ckpt
 from ..utils.logger import Tracker
 from ..utils.py_functional import convert_dict_to_str, timer
 from ..utils.seqlen_balancing import get_seqlen_balanced_partitions, log_seqlen_unbalance
 from ..workers.fsdp_workers import FSDPWorker
-from ..workers.reward import FunctionRewardManager
+from ..workers.reward import FunctionRewardManager, StreamingRewardScorer
 from . import core_algos
 from .config import PPOConfig
 from .core_algos import AdvantageEstimator, FixedKLController, KLController, compute_kl, get_kl_controller
 from .metrics import compute_data_metrics, compute_throughout_metrics, compute_timing_metrics, reduce_metrics
 
 
+# the rollout tensors read on the driver (balancing, rewards, metrics), the others are pulled by the workers
+DRIVER_ROLLOUT_KEYS = ["responses", "attention_mask", "response_mask", "images", "videos", "old_log_probs"]
+
+
 class Role(IntEnum):
     """
     To create more roles dynamically, you can subclass Role and add new members
@@ -251,6 +256,8 @@ class RayPPOTrainer:
 
         if config.trainer.max_steps is not None:
             self.training_steps = config.trainer.max_steps
+        elif config.data.streaming:
+            raise ValueError("Streaming datasets have no length, `trainer.max_steps` is required.")
         elif config.data.mini_rollout_batch_size is not None:
             num_examples = len(train_dataloader) * config.data.mini_rollout_batch_size
             self.training_steps = num_examples // config.data.rollout_batch_size * config.trainer.total_epochs
@@ -382,27 +389,49 @@ class RayPPOTrainer:
         rollout_worker = self._get_rollout_worker()
         return rollout_worker.world_size
     
+    def _get_dispatch_metrics(self) -> Dict[str, Any]:
+        """Report the bytes dropped by the input projection of worker methods in the last step"""
+        worker_groups = [self._get_actor_worker(), self._get_ref_worker()]
+        if self.use_critic:
+            worker_groups.append(self.critic_wg)
+
+        metrics = {}
+        for worker_group in worker_groups:
+            for method_name, num_bytes in worker_group.dispatch_bytes_saved.items():
+                metrics[f"perf/{method_name}_saved_mb"] = num_bytes / (1024**2)
+
+        return metrics
+
     def _save_checkpoint(self) -> None:
         # path: {save_checkpoint_path}/global_step_{global_step}/{actor,critic}
         if self.val_reward_score > self.best_val_reward_score:
             self.best_val_reward_score = self.val_reward_score
             self.best_global_step = self.global_step
 
-        remove_obsolete_ckpt(
-            self.config.trainer.save_checkpoint_path,
-            self.global_step,
-            self.best_global_step,
-            self.config.trainer.save_limit,
-        )
         folder_path = os.path.join(self.config.trainer.save_checkpoint_path, f"global_step_{self.global_step}")
         actor_path = os.path.join(folder_path, "actor")
         
         # Save actor checkpoint using the appropriate worker
-        self._get_actor_worker().save_checkpoint(actor_path, save_model_only=self.config.trainer.save_model_only)
+        save_kwargs = {
+            "save_model_only": self.config.trainer.save_model_only,
+            "async_save": self.config.trainer.async_save,
+            "checkpoint_format": self.config.trainer.checkpoint_format,
+        }
+        self._get_actor_worker().save_checkpoint(
+            actor_path, save_hf_weights=self.config.trainer.save_hf_weights, **save_kwargs
+        )
 
         if self.use_critic:
             critic_path = os.path.join(folder_path, "critic")
-            self.critic_wg.save_checkpoint(critic_path, save_model_only=self.config.trainer.save_model_only)
+            self.critic_wg.save_checkpoint(critic_path, **save_kwargs)
+
+        # remove after saving, the workers have finished writing the previous checkpoints by now
+        remove_obsolete_ckpt(
+            self.config.trainer.save_checkpoint_path,
+            self.global_step,
+            self.best_global_step,
+            self.config.trainer.save_limit,
+        )
 
         dataloader_path = os.path.join(folder_path, "dataloader.pt")
         dataloader_state_dict = self.train_dataloader.state_dict()
@@ -425,13 +454,24 @@ class RayPPOTrainer:
         step_file = os.path.join(self.config.trainer.load_checkpoint_path, "checkpoint_tracker.json")
         if os.path.exists(step_file):
             load_step = json.load(open(step_file))["last_global_step"]
-            self.config.trainer.load_checkpoint_path = os.path.join(self.config.trainer.load_checkpoint_path, "global_step_%d"%load_step)
+            load_path = os.path.join(self.config.trainer.load_checkpoint_path, "global_step_%d"%load_step)
+            if not is_ckpt_complete(load_path):
+                # the tracker is written once the save is issued, the async save may have been interrupted
+                complete_path = find_latest_complete_ckpt(self.config.trainer.load_checkpoint_path)
+                if complete_path is not None:
+                    print(f"Checkpoint {load_path} is incomplete, fall back to {complete_path}.")
+                    load_path = complete_path
+
+            self.config.trainer.load_checkpoint_path = load_path
 
         if "global_step_" not in self.config.trainer.load_checkpoint_path.strip(os.path.sep).split(os.path.sep)[-1]:
             raise ValueError("`load_checkpoint_path` should end with `global_step_*`.")
 
         print(f"Load from checkpoint: {self.config.trainer.load_checkpoint_path}.")
         self.global_step = int(self.config.trainer.load_checkpoint_path.strip(os.path.sep).split("global_step_")[-1])
+        if not is_ckpt_complete(self.config.trainer.load_checkpoint_path):
+            raise ValueError(f"Checkpoint {self.config.trainer.load_checkpoint_path} is incomplete, the saving was interrupted.")
+
         actor_path = os.path.join(self.config.trainer.load_checkpoint_path, "actor")
         
         # Load actor checkpoint using the appropriate worker
@@ -466,89 +506,132 @@ class RayPPOTrainer:
         samples = samples[: self.config.trainer.val_generations_to_log]
         self.logger.log_generation(samples, self.global_step)
 
-    def _validate(self) -> Dict[str, Any]:
-        reward_tensor_lst = []
-        # Lists to collect samples for the table
-        sample_inputs, sample_outputs, sample_labels, sample_scores = [], [], [], []
-        reward_metrics_lst = defaultdict(list)
-        print("Start validation...")
+    def _generate_val_chunk(self, batch_dict: Dict[str, Any]) -> Tuple[DataProto, DataProtoFuture, int, int]:
+        """Submit the generation of a validation chunk without waiting for it"""
+        test_batch = DataProto.from_single_dict(batch_dict)
+        repeat_times = self.config.worker.rollout.val_override_config.get("n", 1)
+        if self.diffusion:
+            # For diffusion models, pop embedding-related keys
+            test_gen_batch = test_batch.pop(
+                batch_keys=["prompt_embeds", "pooled_prompt_embeds", "negative_prompt_embeds",
+                            "negative_pooled_prompt_embeds"]
+            )
+            test_gen_batch.meta_info = dict(self.config.worker.rollout.val_override_config)
+        else:
+            test_gen_batch = test_batch.pop(
+                batch_keys=["input_ids", "attention_mask", "position_ids"],
+                non_tensor_batch_keys=["raw_prompt_ids", "multi_modal_data"],
+            )
+            test_gen_batch.meta_info = dict(self.config.worker.rollout.val_override_config)
+            test_gen_batch.meta_info["min_pixels"] = self.config.data.min_pixels
+            test_gen_batch.meta_info["max_pixels"] = self.config.data.max_pixels
 
-        if not self.diffusion:
-            self._get_rollout_worker().prepare_rollout_engine()
-            
-        print("***len(val_dataloader)***", len(self.val_dataloader))
-        for idx, batch_dict in enumerate(self.val_dataloader):
-            test_batch = DataProto.from_single_dict(batch_dict)
+        rollout_worker = self._get_rollout_worker()
+        if self.diffusion:
+            # For diffusion, directly generate without padding/unpadding
+            pad_size = 0
+        else:
+            test_gen_batch, pad_size = pad_dataproto_to_divisor(test_gen_batch, rollout_worker.world_size)
 
-            if self.diffusion:
-                # For diffusion models, pop embedding-related keys
-                test_gen_batch = test_batch.pop(
-                    batch_keys=["prompt_embeds", "pooled_prompt_embeds", "negative_prompt_embeds",
-                                "negative_pooled_prompt_embeds"]
-                )
-                repeat_times = self.config.worker.rollout.val_override_config.get("n", 1)
-                test_gen_batch.meta_info = self.config.worker.rollout.val_override_config
+        test_output_future = rollout_worker.generate_sequences(test_gen_batch)
+        return test_batch, test_output_future, pad_size, repeat_times
+
+    def _score_val_chunk(
+        self,
+        test_batch: DataProto,
+        test_output_future: DataProtoFuture,
+        pad_size: int,
+        repeat_times: int,
+        val_stats: Dict[str, Any],
+    ) -> None:
+        """Score a generated validation chunk and accumulate the metrics into `val_stats`"""
+        test_output_gen_batch = test_output_future.get()
+        if not self.diffusion:
+            test_output_gen_batch = unpad_dataproto(test_output_gen_batch, pad_size=pad_size * repeat_times)
+            # repeat to align with repeated responses in rollout
+            test_batch = test_batch.repeat(repeat_times=repeat_times, interleave=True)
+
+        test_batch = test_batch.union(test_output_gen_batch)
+
+        # evaluate using reward_function, decode the samples in the meantime
+        reward_ref = self.val_reward_fn.compute_reward.remote(test_batch)
+        # only the first samples are kept for the table, so the memory does not grow with the validation set
+        num_to_log = self.config.trainer.val_generations_to_log - len(val_stats["inputs"])
+        log_generations = num_to_log > 0
+        if log_generations and not self.diffusion:
+            input_texts = self.tokenizer.batch_decode(
+                test_batch.batch["prompts"][:num_to_log], skip_special_tokens=True
+            )
+            if "response_text" in test_batch.non_tensor_batch:
+                output_texts = test_batch.non_tensor_batch["response_text"][:num_to_log].tolist()
             else:
-                test_gen_batch = test_batch.pop(
-                    batch_keys=["input_ids", "attention_mask", "position_ids"],
-                    non_tensor_batch_keys=["raw_prompt_ids", "multi_modal_data"],
+                output_texts = self.tokenizer.batch_decode(
+                    test_batch.batch["responses"][:num_to_log], skip_special_tokens=True
                 )
-                repeat_times = self.config.worker.rollout.val_override_config.get("n", 1)
-                test_gen_batch.meta_info = self.config.worker.rollout.val_override_config
-                test_gen_batch.meta_info["min_pixels"] = self.config.data.min_pixels
-                test_gen_batch.meta_info["max_pixels"] = self.config.data.max_pixels
-
-            if not self.diffusion:
-                rollout_worker = self._get_rollout_worker()
-                test_gen_batch, pad_size = pad_dataproto_to_divisor(test_gen_batch, rollout_worker.world_size)
-                test_output_gen_batch = rollout_worker.generate_sequences(test_gen_batch)
-                test_output_gen_batch = unpad_dataproto(test_output_gen_batch, pad_size=pad_size * repeat_times)
+        elif log_generations:
+            # For diffusion, assume prompt_text is available in the batch
+            if "text" in test_batch.non_tensor_batch:
+                input_texts = test_batch.non_tensor_batch["text"][:num_to_log].tolist()
             else:
-                # For diffusion, directly generate without padding/unpadding
-                rollout_worker = self._get_rollout_worker()
-                test_output_gen_batch = rollout_worker.generate_sequences(test_gen_batch)
-
-            # repeat to align with repeated responses in rollout
+                # Fallback to placeholder if no text prompts available
+                input_texts = [f"Diffusion prompt {i}" for i in range(min(len(test_batch), num_to_log))]
+
+        reward_tensor, reward_metrics = ray.get(reward_ref)
+        scores = reward_tensor.sum(-1).cpu().tolist()
+        val_stats["score_sum"] += sum(scores)
+        val_stats["score_count"] += len(scores)
+        for key, value in reward_metrics.items():
+            val_stats["metric_sum"][key] += float(np.sum(value))
+            val_stats["metric_count"][key] += len(value)
+
+        if log_generations:
+            val_stats["inputs"].extend(input_texts)
+            val_stats["scores"].extend(scores[:num_to_log])
             if not self.diffusion:
-                test_batch = test_batch.repeat(repeat_times=repeat_times, interleave=True)
-            test_batch = test_batch.union(test_output_gen_batch)
+                val_stats["outputs"].extend(output_texts)
+                val_stats["labels"].extend(test_batch.non_tensor_batch["ground_truth"][:num_to_log].tolist())
 
-            # evaluate using reward_function
-            reward_tensor, reward_metrics = ray.get(self.val_reward_fn.compute_reward.remote(test_batch))
+    def _validate(self) -> Dict[str, Any]:
+        val_stats = {
+            "score_sum": 0.0,
+            "score_count": 0,
+            "metric_sum": defaultdict(float),
+            "metric_count": defaultdict(int),
+            # samples for the table
+            "inputs": [],
+            "outputs": [],
+            "labels": [],
+            "scores": [],
+        }
+        print("Start validation...")
 
-            # store generations
-            if not self.diffusion:
-                input_ids = test_batch.batch["prompts"]
-                input_texts = [self.tokenizer.decode(ids, skip_special_tokens=True) for ids in input_ids]
-                output_ids = test_batch.batch["responses"]
-                output_texts = [self.tokenizer.decode(ids, skip_special_tokens=True) for ids in output_ids]
-            else:
-                # For diffusion, handle differently based on what's available
-                # Assume prompt_text and generated images are available in the batch
-                if "text" in test_batch.non_tensor_batch:
-                    input_texts = test_batch.non_tensor_batch["text"].tolist()
-                else:
-                    # Fallback to placeholder if no text prompts available
-                    input_texts = [f"Diffusion prompt {i}" for i in range(len(test_batch))]
+        if not self.diffusion:
+            self._get_rollout_worker().prepare_rollout_engine()
 
-            scores = reward_tensor.sum(-1).cpu().tolist()
-            sample_inputs.extend(input_texts)
-            sample_scores.extend(scores)
-            if not self.diffusion:
-                sample_outputs.extend(output_texts)
-                sample_labels.extend(test_batch.non_tensor_batch["ground_truth"].tolist())
+        print("***len(val_dataloader)***", len(self.val_dataloader))
+        # generate chunk i + 1 on the rollout workers while chunk i is scored on the driver and the reward actor
+        pending_chunk = None
+        for batch_dict in self.val_dataloader:
+            next_chunk = self._generate_val_chunk(batch_dict)
+            if pending_chunk is not None:
+                self._score_val_chunk(*pending_chunk, val_stats=val_stats)
 
-            reward_tensor_lst.append(reward_tensor)
-            for key, value in reward_metrics.items():
-                reward_metrics_lst[key].extend(value)
+            pending_chunk = next_chunk
+
+        if pending_chunk is not None:
+            self._score_val_chunk(*pending_chunk, val_stats=val_stats)
 
         if not self.diffusion:
             rollout_worker = self._get_rollout_worker()
             rollout_worker.release_rollout_engine()
 
-        self._maybe_log_val_generations(sample_inputs, sample_outputs, sample_labels, sample_scores)
-        self.val_reward_score = torch.cat(reward_tensor_lst, dim=0).sum(-1).mean().item()
-        val_reward_metrics = {f"val/{key}_reward": value for key, value in reduce_metrics(reward_metrics_lst).items()}
+        self._maybe_log_val_generations(
+            val_stats["inputs"], val_stats["outputs"], val_stats["labels"], val_stats["scores"]
+        )
+        self.val_reward_score = val_stats["score_sum"] / max(val_stats["score_count"], 1)
+        val_reward_metrics = {
+            f"val/{key}_reward": value / val_stats["metric_count"][key] for key, value in val_stats["metric_sum"].items()
+        }
         print("Finish validation.")
         return {"val/reward_score": self.val_reward_score, **val_reward_metrics}
 
@@ -594,21 +677,50 @@ class RayPPOTrainer:
                     meta_info_keys=["min_pixels", "max_pixels"],
                 )
 
+            # score the responses while the remaining requests are still decoding
+            stream_reward = (
+                self.config.worker.reward.streaming
+                and not self.diffusion
+                and self.config.algorithm.adv_estimator != "remax"
+            )
+            if stream_reward:
+                stream_queue = Queue(actor_options={"num_cpus": 0})
+                gen_batch.meta_info["stream_queue"] = stream_queue
+                gen_batch.non_tensor_batch["prompt_index"] = np.arange(len(gen_batch))
+
             # generate a batch
             rollout_worker = self._get_rollout_worker()
             gen_batch_output = rollout_worker.generate_sequences(gen_batch)
+            if stream_reward:
+                scorer = StreamingRewardScorer(
+                    self.reward_fn.compute_reward.remote,
+                    ground_truth=np.repeat(new_batch.non_tensor_batch["ground_truth"], self.config.worker.rollout.n),
+                    num_repeat=self.config.worker.rollout.n,
+                    response_length=self.config.data.max_response_length,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                )
+                scorer.consume(stream_queue, num_prompts=len(gen_batch))
+                ray.kill(stream_queue.actor)
+
+            if self.config.trainer.remote_rollout_data:
+                # only fetch what the driver reads, the other columns are pulled by the next stage's workers
+                gen_batch_output = gen_batch_output.fetch(
+                    batch_keys=DRIVER_ROLLOUT_KEYS, non_tensor_batch_keys=["response_text"]
+                )
+            else:
+                gen_batch_output = gen_batch_output.get()
 
             if self.config.algorithm.adv_estimator == "remax":
                 gen_baseline_batch = deepcopy(gen_batch)
                 gen_baseline_batch.meta_info["temperature"] = 0
                 gen_baseline_batch.meta_info["n"] = 1
-                gen_baseline_output = rollout_worker.generate_sequences(gen_baseline_batch)
+                gen_baseline_output = rollout_worker.generate_sequences(gen_baseline_batch).get()
 
                 new_batch = new_batch.union(gen_baseline_output)
                 reward_baseline_tensor, _ = ray.get(self.reward_fn.compute_reward.remote(new_batch))
                 reward_baseline_tensor = reward_baseline_tensor.sum(dim=-1)
 
-                new_batch.pop(batch_keys=list(gen_baseline_output.batch.keys()))
+                new_batch.pop(batch_keys=list(gen_baseline_output.batch.keys()), non_tensor_batch_keys=["response_text"])
                 new_batch.batch["reward_baselines"] = reward_baseline_tensor
                 del gen_baseline_batch, gen_baseline_output
 
@@ -619,14 +731,24 @@ class RayPPOTrainer:
             if not self.diffusion:
                 new_batch = new_batch.repeat(repeat_times=self.config.worker.rollout.n, interleave=True)
             new_batch = new_batch.union(gen_batch_output)
+            if "multi_modal_inputs" in new_batch.non_tensor_batch:
+                # the workers consume the processor outputs of the dataset, the raw media were only for the rollout
+                new_batch.non_tensor_batch.pop("multi_modal_data", None)
 
-            # filter group
-            if self.config.algorithm.online_filtering:
-                reward_tensor, reward_metrics = ray.get(self.reward_fn.compute_reward.remote(new_batch))
+            if stream_reward:
+                reward_tensor, reward_metrics = scorer.finalize()
                 new_batch.batch["token_level_scores"] = reward_tensor
                 for k, v in reward_metrics.items():
                     all_metrics[k].extend(v)
 
+            # filter group
+            if self.config.algorithm.online_filtering:
+                if not stream_reward:
+                    reward_tensor, reward_metrics = ray.get(self.reward_fn.compute_reward.remote(new_batch))
+                    new_batch.batch["token_level_scores"] = reward_tensor
+                    for k, v in reward_metrics.items():
+                        all_metrics[k].extend(v)
+
                 filter_scores = reward_metrics[self.config.algorithm.filter_key]
                 uids = new_batch.non_tensor_batch["uid"]
                 uid2scores = defaultdict(list)
@@ -657,7 +779,7 @@ class RayPPOTrainer:
                     )
             else:
                 print(f"{current_batch_size=} >= {rollout_batch_size=}. Finish generating.")
-                if self.config.algorithm.online_filtering:
+                if len(all_metrics) > 0:
                     metrics.update({f"reward/{k}": v for k, v in reduce_metrics(all_metrics).items()})
 
                 return batch[: self.config.data.rollout_batch_size * self.config.worker.rollout.n]
@@ -793,6 +915,7 @@ class RayPPOTrainer:
             metrics.update(compute_data_metrics(batch=batch, use_critic=self.use_critic, diffusion=self.diffusion))
             metrics.update(compute_timing_metrics(batch=batch, timing_raw=timing_raw, diffusion=self.diffusion))
             metrics.update(compute_throughout_metrics(batch=batch, timing_raw=timing_raw, num_gpus=num_gpus, diffusion=self.diffusion))
+            metrics.update(self._get_dispatch_metrics())
 
             self.logger.log(data=metrics, step=self.global_step)
             main_tqdm.update()
@@ -811,3 +934,8 @@ class RayPPOTrainer:
 
         if self.config.trainer.save_freq <= 0 or self.global_step % self.config.trainer.save_freq != 0:
             self._save_checkpoint()
+
+        if self.config.trainer.async_save:
+            self._get_actor_worker().wait_for_checkpoint()
+            if self.use_critic:
+                self.critic_wg.wait_for_checkpoint()
@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .checkpoint_manager import CHECKPOINT_TRACKER, remove_obsolete_ckpt
+from .checkpoint_manager import CHECKPOINT_TRACKER, find_latest_complete_ckpt, is_ckpt_complete, remove_obsolete_ckpt
 
 
-__all__ = ["CHECKPOINT_TRACKER", "remove_obsolete_ckpt"]
+__all__ = ["CHECKPOINT_TRACKER", "find_latest_complete_ckpt", "is_ckpt_complete", "remove_obsolete_ckpt"]
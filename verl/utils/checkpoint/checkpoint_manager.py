@@ -29,6 +29,7 @@ from transformers import PreTrainedTokenizer, ProcessorMixin
 
 
 CHECKPOINT_TRACKER = "checkpoint_tracker.json"
+INCOMPLETE_MARKER = ".incomplete_rank_{}"
 
 
 class BaseCheckpointManager(ABC):
@@ -93,16 +94,20 @@ class BaseCheckpointManager(ABC):
     def get_rng_state() -> Dict[str, Any]:
         rng_state = {
             "cpu": torch.get_rng_state(),
-            "cuda": torch.cuda.get_rng_state(),
             "numpy": np.random.get_state(),
             "random": random.getstate(),
         }
+        if torch.cuda.is_available():
+            rng_state["cuda"] = torch.cuda.get_rng_state()
+
         return rng_state
 
     @staticmethod
     def load_rng_state(rng_state: Dict[str, Any]):
         torch.set_rng_state(rng_state["cpu"])
-        torch.cuda.set_rng_state(rng_state["cuda"])
+        if "cuda" in rng_state and torch.cuda.is_available():
+            torch.cuda.set_rng_state(rng_state["cuda"])
+
         np.random.set_state(rng_state["numpy"])
         random.setstate(rng_state["random"])
 
@@ -135,11 +140,45 @@ def get_checkpoint_tracker_filename(root_path: str) -> str:
     return os.path.join(root_path, CHECKPOINT_TRACKER)
 
 
+def is_ckpt_complete(path: str) -> bool:
+    """
+    A checkpoint is complete when no rank is still writing it, i.e., no incomplete marker is left in the folder.
+    """
+    marker_prefix = INCOMPLETE_MARKER.split("{}")[0]
+    for _, _, files in os.walk(path):
+        if any(file.startswith(marker_prefix) for file in files):
+            return False
+
+    return True
+
+
+def find_latest_complete_ckpt(path: str, directory_format: str = "global_step_{}") -> Optional[str]:
+    """
+    Find the newest complete checkpoint, the last one is left incomplete if its async saving was interrupted.
+    """
+    if not os.path.exists(path):
+        return None
+
+    pattern = re.escape(directory_format).replace(r"\{\}", r"(\d+)")
+    ckpt_global_steps = []
+    for folder in os.listdir(path):
+        if match := re.fullmatch(pattern, folder):
+            ckpt_global_steps.append(int(match.group(1)))
+
+    for step in sorted(ckpt_global_steps, reverse=True):
+        ckpt_path = os.path.join(path, directory_format.format(step))
+        if is_ckpt_complete(ckpt_path):
+            return ckpt_path
+
+    return None
+
+
 def remove_obsolete_ckpt(
     path: str, global_step: int, best_global_step: int, save_limit: int = -1, directory_format: str = "global_step_{}"
 ):
     """
-    Remove the obsolete checkpoints that exceed the save_limit.
+    Remove the obsolete checkpoints that exceed the save_limit, checkpoints still being written are kept.
+    While the current checkpoint is being written, one more complete checkpoint is kept to resume from.
     """
     if save_limit <= 0:
         return
@@ -147,12 +186,15 @@ def remove_obsolete_ckpt(
     if not os.path.exists(path):
         return
 
+    if not is_ckpt_complete(os.path.join(path, directory_format.format(global_step))):
+        save_limit += 1
+
     pattern = re.escape(directory_format).replace(r"\{\}", r"(\d+)")
     ckpt_global_steps = []
     for folder in os.listdir(path):
         if match := re.match(pattern, folder):
             step = int(match.group(1))
-            if step < global_step:
+            if step < global_step and is_ckpt_complete(os.path.join(path, folder)):
                 ckpt_global_steps.append(step)
 
     ckpt_global_steps.sort(reverse=True)
@@ -12,11 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import glob
+import json
 import os
-from typing import Optional, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import deepcopy
+from typing import Any, Dict, Optional, Union
 
 import torch
 import torch.distributed as dist
+import torch.distributed.checkpoint as dcp
+from safetensors.torch import save_file
+from torch.distributed._state_dict_utils import (
+    _copy_state_dict,
+    _create_cpu_state_dict,
+    _gather_state_dict,
+    _offload_state_dict_to_cpu,
+)
 from torch.distributed.checkpoint.state_dict import (
     StateDictOptions,
     get_model_state_dict,
@@ -26,7 +38,12 @@ from torch.distributed.checkpoint.state_dict import (
 from torch.distributed.fsdp import FullyShardedDataParallel as FSDP
 from transformers import PreTrainedModel, PreTrainedTokenizer, ProcessorMixin
 
-from .checkpoint_manager import BaseCheckpointManager
+from ..model_utils import get_hf_key_mapping, get_tied_weights_keys
+from .checkpoint_manager import INCOMPLETE_MARKER, BaseCheckpointManager
+
+
+DCP_METADATA = ".metadata"
+HF_MAX_SHARD_SIZE = 5 * 1024**3
 
 
 class FSDPCheckpointManager(BaseCheckpointManager):
@@ -39,7 +56,7 @@ class FSDPCheckpointManager(BaseCheckpointManager):
     in a SPMD way.
 
     We save
-    - sharded model states and optimizer states
+    - sharded model states and optimizer states, per rank or as a distributed checkpoint
     - full lr_scheduler states
     - huggingface tokenizer and config for ckpt merge
     """
@@ -52,23 +69,45 @@ class FSDPCheckpointManager(BaseCheckpointManager):
         processing_class: Union[PreTrainedTokenizer, ProcessorMixin],
     ):
         super().__init__(model, optimizer, lr_scheduler, processing_class)
+        self._pinned_state_dict: Optional[Dict[str, Any]] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._pending_save: Optional[Future] = None
+        self._gloo_group: Optional[dist.ProcessGroup] = None
 
     def load_checkpoint(self, path: Optional[str] = None):
         if path is None:
             return
 
-        # every rank download its own checkpoint
-        model_path = os.path.join(path, f"model_world_size_{self.world_size}_rank_{self.rank}.pt")
-        optim_path = os.path.join(path, f"optim_world_size_{self.world_size}_rank_{self.rank}.pt")
+        self.wait_for_pending_save()
         extra_path = os.path.join(path, f"extra_state_world_size_{self.world_size}_rank_{self.rank}.pt")
-        print(f"[rank-{self.rank}]: Loading model from {os.path.abspath(model_path)}.")
-        print(f"[rank-{self.rank}]: Loading optimizer from {os.path.abspath(optim_path)}.")
+        if os.path.exists(os.path.join(path, DCP_METADATA)):
+            # distributed checkpoint, every rank reads the byte ranges of its own shards under any world size
+            print(f"[rank-{self.rank}]: Loading distributed checkpoint from {os.path.abspath(path)}.")
+            model_state_dict, optim_state_dict = get_state_dict(self.model, self.optimizer)
+            state_dict = {"model": model_state_dict, "optim": optim_state_dict}
+            dcp.load(state_dict, checkpoint_id=path)
+            model_state_dict, optim_state_dict = state_dict["model"], state_dict["optim"]
+            state_dict_options = StateDictOptions()
+            if not os.path.exists(extra_path):  # saved under another world size, rng states cannot be mapped
+                extra_path = glob.glob(os.path.join(path, "extra_state_world_size_*_rank_0.pt"))[0]
+        else:
+            # every rank download its own checkpoint
+            model_path = os.path.join(path, f"model_world_size_{self.world_size}_rank_{self.rank}.pt")
+            optim_path = os.path.join(path, f"optim_world_size_{self.world_size}_rank_{self.rank}.pt")
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(
+                    f"Checkpoint {path} is not saved with world size {self.world_size}, "
+                    "save it with `checkpoint_format=dcp` to resume under a different world size."
+                )
+
+            print(f"[rank-{self.rank}]: Loading model from {os.path.abspath(model_path)}.")
+            print(f"[rank-{self.rank}]: Loading optimizer from {os.path.abspath(optim_path)}.")
+            model_state_dict = torch.load(model_path, weights_only=False)
+            optim_state_dict = torch.load(optim_path, weights_only=False)
+            state_dict_options = StateDictOptions(cpu_offload=True)
+
         print(f"[rank-{self.rank}]: Loading extra_state from {os.path.abspath(extra_path)}.")
-        model_state_dict = torch.load(model_path, weights_only=False)
-        optim_state_dict = torch.load(optim_path, weights_only=False)
         extra_state_dict = torch.load(extra_path, weights_only=False)
-
-        state_dict_options = StateDictOptions(cpu_offload=True)
         set_state_dict(
             model=self.model,
             optimizers=self.optimizer,
@@ -79,10 +118,38 @@ class FSDPCheckpointManager(BaseCheckpointManager):
         self.lr_scheduler.load_state_dict(extra_state_dict["lr_scheduler"])
 
         # recover random state
-        if "rng" in extra_state_dict:
+        if "rng" in extra_state_dict and extra_path.endswith(f"world_size_{self.world_size}_rank_{self.rank}.pt"):
             self.load_rng_state(extra_state_dict["rng"])
 
-    def save_checkpoint(self, path: str, save_model_only: bool = False, diffusion: bool = False):
+    def save_checkpoint(
+        self,
+        path: str,
+        save_model_only: bool = False,
+        diffusion: bool = False,
+        async_save: bool = False,
+        checkpoint_format: str = "torch",
+        save_hf_weights: bool = False,
+        save_hf_config: bool = True,
+    ):
+        """Save the sharded states of this rank.
+
+        In async mode, the states are snapshotted into a reusable pinned CPU buffer and written by a background
+        thread, the call returns once the snapshot is taken. The files are written to temporary names and renamed
+        when done, the incomplete marker of this rank is removed after all of them are in place.
+
+        The `torch` format saves a file per rank, which can only be loaded under the same world size. The `dcp`
+        format saves a distributed checkpoint (FQN-keyed shards plus metadata) loadable under any world size.
+
+        With `save_hf_weights`, the full weights are also exported as huggingface safetensors from the same model
+        states, which are gathered in size-bounded buckets and written by rank 0.
+
+        With `save_hf_config`, rank 0 also saves the huggingface config, generation config and processing class of
+        the (non-diffusion) model, models without them, e.g. in tests, should disable it.
+        """
+        if checkpoint_format not in ("torch", "dcp"):
+            raise NotImplementedError(f"Unknown checkpoint format: {checkpoint_format}.")
+
+        self.wait_for_pending_save()  # the pinned buffer is reused
         path = self.local_mkdir(path)
         dist.barrier()
 
@@ -90,35 +157,173 @@ class FSDPCheckpointManager(BaseCheckpointManager):
         model_path = os.path.join(path, f"model_world_size_{self.world_size}_rank_{self.rank}.pt")
         optim_path = os.path.join(path, f"optim_world_size_{self.world_size}_rank_{self.rank}.pt")
         extra_path = os.path.join(path, f"extra_state_world_size_{self.world_size}_rank_{self.rank}.pt")
+        marker_path = os.path.join(path, INCOMPLETE_MARKER.format(self.rank))
+        open(marker_path, "w").close()
 
-        state_dict_options = StateDictOptions(cpu_offload=True)
+        # dcp stages the states to cpu by itself, the export gathers on device
+        cpu_offload = not async_save and checkpoint_format == "torch" and not save_hf_weights
+        state_dict_options = StateDictOptions(cpu_offload=cpu_offload)
+        extra_state_dict = None
         if save_model_only:
-            model_state_dict = get_model_state_dict(self.model, options=state_dict_options)
-            print(f"[rank-{self.rank}]: Saving model to {os.path.abspath(model_path)}.")
-            torch.save(model_state_dict, model_path)
+            state_dicts = {model_path: get_model_state_dict(self.model, options=state_dict_options)}
         else:
             model_state_dict, optim_state_dict = get_state_dict(self.model, self.optimizer, options=state_dict_options)
+            state_dicts = {model_path: model_state_dict, optim_path: optim_state_dict}
             extra_state_dict = {
                 "lr_scheduler": self.lr_scheduler.state_dict(),
                 "rng": self.get_rng_state(),
             }
+
+        if save_hf_weights:
+            if diffusion:
+                raise NotImplementedError("Exporting huggingface weights is not supported for diffusion models.")
+
+            self._export_hf_weights(state_dicts[model_path], os.path.join(path, "huggingface"))
+
+        if checkpoint_format == "dcp":
+            self._save_distributed_checkpoint(path, state_dicts, extra_state_dict, extra_path, marker_path, async_save)
+        else:
             print(f"[rank-{self.rank}]: Saving model to {os.path.abspath(model_path)}.")
-            print(f"[rank-{self.rank}]: Saving optimizer to {os.path.abspath(optim_path)}.")
-            print(f"[rank-{self.rank}]: Saving extra_state to {os.path.abspath(extra_path)}.")
-            torch.save(model_state_dict, model_path)
-            torch.save(optim_state_dict, optim_path)
-            torch.save(extra_state_dict, extra_path)
+            if not save_model_only:
+                print(f"[rank-{self.rank}]: Saving optimizer to {os.path.abspath(optim_path)}.")
+                print(f"[rank-{self.rank}]: Saving extra_state to {os.path.abspath(extra_path)}.")
 
-        # wait for everyone to dump to local
-        dist.barrier()
+            if async_save:
+                state_dicts = self._snapshot(state_dicts)
+                if extra_state_dict is not None:
+                    state_dicts[extra_path] = deepcopy(extra_state_dict)
+
+                if self._writer is None:
+                    self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ckpt_writer")
+
+                self._pending_save = self._writer.submit(self._write_state_dicts, state_dicts, marker_path)
+            else:
+                if not cpu_offload:
+                    state_dicts = {key: _offload_state_dict_to_cpu(value) for key, value in state_dicts.items()}
+
+                if extra_state_dict is not None:
+                    state_dicts[extra_path] = extra_state_dict
+
+                self._write_state_dicts(state_dicts, marker_path)
+
+        if not async_save:
+            # wait for everyone to dump to local
+            dist.barrier()
 
         if self.rank == 0:
             hf_path = os.path.join(path, "huggingface")
             os.makedirs(hf_path, exist_ok=True)
-            if not diffusion:
+            if save_hf_config and not diffusion:
                 assert isinstance(self.model._fsdp_wrapped_module, PreTrainedModel)
                 self.model._fsdp_wrapped_module.config.save_pretrained(hf_path)
                 self.model._fsdp_wrapped_module.generation_config.save_pretrained(hf_path)
                 self.processing_class.save_pretrained(hf_path)
 
         dist.barrier()
+
+    def _save_distributed_checkpoint(
+        self,
+        path: str,
+        state_dicts: Dict[str, Any],
+        extra_state_dict: Optional[Dict[str, Any]],
+        extra_path: str,
+        marker_path: str,
+        async_save: bool,
+    ) -> None:
+        print(f"[rank-{self.rank}]: Saving distributed checkpoint to {os.path.abspath(path)}.")
+        state_dict = {os.path.basename(file_path).split("_")[0]: value for file_path, value in state_dicts.items()}
+        if extra_state_dict is not None:
+            self._write_state_dicts({extra_path: extra_state_dict}, marker_path=None)
+
+        if async_save:
+            if self._gloo_group is None:  # the background collectives of dcp run on cpu
+                self._gloo_group = dist.new_group(backend="gloo")
+
+            future = dcp.async_save(state_dict, checkpoint_id=path, process_group=self._gloo_group)
+
+            def _on_done(future: Future) -> None:
+                if future.exception() is None:
+                    os.remove(marker_path)
+
+            future.add_done_callback(_on_done)
+            self._pending_save = future
+        else:
+            dcp.save(state_dict, checkpoint_id=path)
+            os.remove(marker_path)
+
+    def _export_hf_weights(self, model_state_dict: Dict[str, Any], hf_path: str) -> None:
+        """Gather the full weights bucket by bucket, rank 0 writes every bucket as a safetensors file."""
+        tied_weights_keys = get_tied_weights_keys(self.model._fsdp_wrapped_module)
+        model_state_dict = {key: value for key, value in model_state_dict.items() if key not in tied_weights_keys}
+        buckets, bucket, bucket_size = [], [], 0
+        for key, value in model_state_dict.items():
+            size = value.size().numel() * 2  # bf16, the global size of sharded tensors
+            if bucket and bucket_size + size > HF_MAX_SHARD_SIZE:
+                buckets.append(bucket)
+                bucket, bucket_size = [], 0
+
+            bucket.append(key)
+            bucket_size += size
+
+        if bucket:
+            buckets.append(bucket)
+
+        key_mapping = get_hf_key_mapping(model_state_dict.keys(), self.model._fsdp_wrapped_module)
+        if self.rank == 0:
+            print(f"[rank-{self.rank}]: Exporting huggingface weights to {os.path.abspath(hf_path)}.")
+            os.makedirs(hf_path, exist_ok=True)
+
+        filenames = [f"model-{i + 1:05d}-of-{len(buckets):05d}.safetensors" for i in range(len(buckets))]
+        weight_map, total_size = {}, 0
+        for bucket, filename in zip(buckets, filenames):
+            bucket_state_dict = {key: model_state_dict[key] for key in bucket}
+            full_state_dict = _gather_state_dict(bucket_state_dict, cpu_offload=True, ranks_only=(0,))
+            if self.rank == 0:
+                tensors = {}
+                for key, value in full_state_dict.items():
+                    tensors[key_mapping.get(key, key)] = value.to(torch.bfloat16).contiguous()
+                    weight_map[key_mapping.get(key, key)] = filename
+                    total_size += value.numel() * 2
+
+                save_file(tensors, os.path.join(hf_path, filename), metadata={"format": "pt"})
+                del tensors
+
+            del full_state_dict
+
+        if self.rank == 0:
+            index = {"metadata": {"total_size": total_size}, "weight_map": weight_map}
+            with open(os.path.join(hf_path, "model.safetensors.index.json"), "w") as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+
+    def wait_for_pending_save(self) -> None:
+        """Block until the background write of the last async save finishes."""
+        if self._pending_save is not None:
+            self._pending_save.result()  # re-raise the errors of the writer
+            self._pending_save = None
+
+    def _snapshot(self, state_dicts: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy the (gpu) state dicts into the pinned CPU buffer, allocated once and reused across saves."""
+        named_state_dicts = {os.path.basename(file_path): state_dict for file_path, state_dict in state_dicts.items()}
+        pin_memory = torch.cuda.is_available()
+        if self._pinned_state_dict is None or self._pinned_state_dict.keys() != named_state_dicts.keys():
+            self._pinned_state_dict = _create_cpu_state_dict(named_state_dicts, pin_memory=pin_memory)
+
+        try:
+            _copy_state_dict(named_state_dicts, self._pinned_state_dict, non_blocking=True)
+        except Exception:  # the structure of the states changed, e.g., new optimizer states
+            self._pinned_state_dict = _create_cpu_state_dict(named_state_dicts, pin_memory=pin_memory)
+            _copy_state_dict(named_state_dicts, self._pinned_state_dict, non_blocking=True)
+
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+        return {file_path: self._pinned_state_dict[os.path.basename(file_path)] for file_path in state_dicts.keys()}
+
+    @staticmethod
+    def _write_state_dicts(state_dicts: Dict[str, Any], marker_path: Optional[str]) -> None:
+        for file_path, state_dict in state_dicts.items():
+            torch.save(state_dict, file_path + ".tmp")
+            os.replace(file_path + ".tmp", file_path)
+
+        if marker_path is not None:
+            os.remove(marker_path)
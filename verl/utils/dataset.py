@@ -12,19 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import glob
+import hashlib
+import json
 import math
 import os
 from collections import defaultdict
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
+import datasets
+import pyarrow as pa
+import pyarrow.parquet as pq
 import torch
 from datasets import load_dataset
 from jinja2 import Template
 from PIL import Image
 from PIL.Image import Image as ImageObject
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 from transformers import PreTrainedTokenizer, ProcessorMixin
 
 from .flops_counter import VALID_MODLE_TYPE
@@ -36,10 +42,13 @@ from functools import partial
 from verl.utils.vila_remote_code.tokenizer_utils import tokenize_conversation
 from verl.utils.vila_remote_code.auto_processor import extract_value_from_conv
 from verl.utils.qwen_vl_utils import process_vision_info
-from verl.utils.qwen_omni_utils import process_mm_info
+from verl.utils.qwen_omni_utils import AudioFeatureStore, process_mm_info
+from verl.utils.qwen_omni_utils import process_vision_info as process_omni_vision_info
 import torchvision.transforms.functional as TF
 from verl.utils.diffusion_processor import StableDiffusionProcessor
 from verl.utils.wan_processor import WanProcessor
+from verl.utils.video_cache import VideoCache
+from verl.utils.frame_cache import configure_frame_cache
 
 
 def collate_fn(features: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -61,6 +70,30 @@ def collate_fn(features: List[Dict[str, Any]]) -> Dict[str, Any]:
     return {**tensors, **non_tensors}
 
 
+# the processor outputs consumed by the actor, computed once by the dataset and carried in the batch
+MULTI_MODAL_INPUT_KEYS = ("pixel_values", "image_grid_thw", "pixel_values_videos", "video_grid_thw")
+
+
+def get_multi_modal_inputs(model_inputs: Dict[str, Any]) -> Dict[str, torch.Tensor]:
+    multi_modal_inputs = {key: model_inputs[key] for key in MULTI_MODAL_INPUT_KEYS if key in model_inputs}
+    if "pixel_values_videos" in multi_modal_inputs:  # the video patches are large, keep them in the model dtype
+        multi_modal_inputs["pixel_values_videos"] = multi_modal_inputs["pixel_values_videos"].to(torch.bfloat16)
+
+    return multi_modal_inputs
+
+
+def place_multi_modal_inputs(batch_multi_modal_inputs: np.ndarray, device: Union[str, torch.device]) -> np.ndarray:
+    """Move the multi-modal inputs of a batch to the device, the inputs shared by repeated samples are moved once."""
+    placed = {}
+    for multi_modal_inputs in batch_multi_modal_inputs:
+        if id(multi_modal_inputs) not in placed:
+            placed[id(multi_modal_inputs)] = {key: value.to(device) for key, value in multi_modal_inputs.items()}
+
+    output = np.empty(len(batch_multi_modal_inputs), dtype=object)
+    output[:] = [placed[id(multi_modal_inputs)] for multi_modal_inputs in batch_multi_modal_inputs]
+    return output
+
+
 def process_image(
     image: Union[Dict[str, Any], ImageObject, str], min_pixels: Optional[int], max_pixels: Optional[int]
 ) -> ImageObject:
@@ -126,14 +159,31 @@ def _get_messages_vila(example: Dict[str, Any],
     ]
     return messages, prompt
 
-def _filter_overlong_prompts_vila(example: Dict[str, Any],
-                                  tokenizer=None,
-                                  max_prompt_length: int = 2048,
-                                  prompt_key: str = "prompt",
-                                  image_key: str = "images",
-                                  image_dir: Optional[str] = None,
-                                  video_key: str = "videos",
-                                  video_dir: str = None,) -> bool:
+
+def _quantize_vila_frames(frames: torch.Tensor, image_processor) -> torch.Tensor:
+    """Turn the normalized frames back to uint8, the resized pixels are integers so this is lossless.
+
+    Only the `x / 255 * 2 - 1` normalization of SigLIP is invertible here, other frames are kept as they are.
+    """
+    if (
+        frames.dim() != 4
+        or list(getattr(image_processor, "image_mean", [])) != [0.5, 0.5, 0.5]
+        or list(getattr(image_processor, "image_std", [])) != [0.5, 0.5, 0.5]
+    ):
+        return frames
+
+    return ((frames.float() + 1) * 127.5).round().clamp(0, 255).to(torch.uint8)
+
+
+def _get_prompt_length_vila(
+    example: Dict[str, Any],
+    tokenizer=None,
+    prompt_key: str = "prompt",
+    image_key: str = "images",
+    image_dir: Optional[str] = None,
+    video_key: str = "videos",
+    video_dir: str = None,
+) -> Dict[str, int]:
     def apply_chat_template_vila(conversation):
         vila_conv = []
         for chat in conversation:
@@ -155,7 +205,69 @@ def _filter_overlong_prompts_vila(example: Dict[str, Any],
     messages[-1]['value'] = messages[-1]['value'][-1]
     inputs = tokenize_conversation(messages, tokenizer, add_generation_prompt=True,
                                    return_ids_only=False)
-    return inputs.input_ids[0].size(-1) <= max_prompt_length
+    return {"text_tokens": inputs.input_ids[0].size(-1), "vision_tokens": 0}
+
+
+def _get_config_dict(obj: Any) -> Optional[Dict[str, Any]]:
+    if obj is None:
+        return None
+    elif hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    else:
+        return {"class": obj.__class__.__name__}
+
+
+class PromptLengthIndex:
+    """A sidecar index of the prompt lengths, so that the processor only runs at the first launch.
+
+    The index is keyed by everything that changes the prompt lengths: the dataset fingerprint, the prompt format,
+    the tokenizer and processor configs, the pixel limits and the frame settings. `max_prompt_length` is not a part
+    of the key, the lengths are compared against it at load time.
+    """
+
+    def __init__(self, index_dir: str, key: Dict[str, Any]):
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+        self.path = os.path.join(index_dir, f"{digest[:32]}.npz")
+
+    def load(self, num_examples: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        if not os.path.exists(self.path):
+            return None
+
+        with np.load(self.path) as index:
+            lengths = {key: index[key] for key in ("text_tokens", "vision_tokens")}
+
+        if num_examples is not None and len(lengths["text_tokens"]) != num_examples:
+            print(f"Prompt length index {self.path} does not match the dataset, recomputing.")
+            return None
+
+        return lengths
+
+    def save(self, lengths: Dict[str, np.ndarray]) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # write to a temporary file first, concurrent launches never read a partial index
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **lengths)
+        os.replace(tmp_path, self.path)
+
+
+def load_rlhf_dataset(data_path: str) -> datasets.Dataset:
+    """Load a local file, a local directory or a hub dataset, the split is specified by `path@split`."""
+    if "@" in data_path:
+        data_path, data_split = data_path.split("@")
+    else:
+        data_split = "train"
+
+    if os.path.isdir(data_path):
+        # when we use dataset builder, we should always refer to the train split
+        file_type = os.path.splitext(os.listdir(data_path)[0])[-1][1:].replace("jsonl", "json")
+        return load_dataset(file_type, data_dir=data_path, split=data_split)
+    elif os.path.isfile(data_path):
+        file_type = os.path.splitext(data_path)[-1][1:].replace("jsonl", "json")
+        return load_dataset(file_type, data_files=data_path, split=data_split)
+    else:
+        # load remote dataset from huggingface hub
+        return load_dataset(data_path, split=data_split)
+
 
 class RLHFDataset(Dataset):
     """
@@ -164,7 +276,7 @@ class RLHFDataset(Dataset):
 
     def __init__(
         self,
-        data_path: str,
+        data_path: Optional[str],
         tokenizer: PreTrainedTokenizer,
         processor: Optional[ProcessorMixin],
         prompt_key: str = "prompt",
@@ -174,6 +286,9 @@ class RLHFDataset(Dataset):
         video_key: str = "videos",
         video_dir: str = None,
         cache_dir: str = None,
+        frame_cache_dir: Optional[str] = None,
+        frame_cache_gb: float = 100.0,
+        audio_feature_dir: Optional[str] = None,
         max_prompt_length: int = 1024,
         truncation: str = "error",
         format_prompt: Optional[str] = None,
@@ -184,6 +299,7 @@ class RLHFDataset(Dataset):
         diffusion: bool = False,
         is_omni: bool = False,
         audio_max_length: int = 10000,
+        prompt_length_index_dir: Optional[str] = None,
     ):
         self.tokenizer = tokenizer
         self.processor = processor
@@ -198,6 +314,7 @@ class RLHFDataset(Dataset):
         self.min_pixels = min_pixels
         self.max_pixels = max_pixels
         self.filter_overlong_prompts = filter_overlong_prompts
+        self.prompt_length_index_dir = prompt_length_index_dir
         self.vila_model = vila_model
         self.cache_dir = cache_dir
         self.is_omni = is_omni
@@ -208,39 +325,99 @@ class RLHFDataset(Dataset):
         self.video_backup = None
         self.diffusion = diffusion
 
-        if "@" in data_path:
-            data_path, data_split = data_path.split("@")
-        else:
-            data_split = "train"
-
-        if os.path.isdir(data_path):
-            # when we use dataset builder, we should always refer to the train split
-            file_type = os.path.splitext(os.listdir(data_path)[0])[-1][1:].replace("jsonl", "json")
-            self.dataset = load_dataset(file_type, data_dir=data_path, split=data_split)
-        elif os.path.isfile(data_path):
-            file_type = os.path.splitext(data_path)[-1][1:].replace("jsonl", "json")
-            self.dataset = load_dataset(file_type, data_files=data_path, split=data_split)
-        else:
-            # load remote dataset from huggingface hub
-            self.dataset = load_dataset(data_path, split=data_split)
+        self.video_cache = None
+        if cache_dir is not None:
+            self.video_cache = VideoCache(cache_dir, video_dir)
+            num_video_frames = getattr(processor, "num_video_frames", None)
+            if self.video_cache.num_video_frames not in (None, num_video_frames):
+                print(
+                    f"Disable the video cache {cache_dir}, it holds {self.video_cache.num_video_frames} frames per "
+                    f"video but {num_video_frames} frames are required."
+                )
+                self.video_cache = None
+
+        if frame_cache_dir is not None:  # the dataloader workers inherit the frame cache
+            configure_frame_cache(frame_cache_dir, frame_cache_gb)
+
+        self.audio_feature_store = None
+        if audio_feature_dir is not None and is_omni:
+            self.audio_feature_store = AudioFeatureStore(audio_feature_dir, processor.feature_extractor)
 
         self.format_prompt = None
         if format_prompt:
             with open(format_prompt, encoding="utf-8") as f:
                 self.format_prompt = f.read()
 
+        self.dataset = None
+        if data_path is None:  # the examples are read by the caller, see `StreamingRLHFDataset`
+            return
+
+        self.dataset = load_rlhf_dataset(data_path)
         if self.filter_overlong_prompts:
-            if self.vila_model:
-                _filter_overlong_prompts = partial(_filter_overlong_prompts_vila, tokenizer=self.tokenizer,
-                                                   max_prompt_length=max_prompt_length, prompt_key=prompt_key,
-                                                   image_key=image_key, image_dir=image_dir, video_key=video_key,
-                                                   video_dir=video_dir)
-            else:
-                _filter_overlong_prompts = self._filter_overlong_prompts
-            self.dataset = self.dataset.filter(
-                _filter_overlong_prompts, desc="Filtering overlong prompts", num_proc=16,
+            lengths = self._get_prompt_lengths()
+            keep = lengths["text_tokens"] + lengths["vision_tokens"] <= max_prompt_length
+            print(f"Filtered {len(keep) - keep.sum()} overlong prompts out of {len(keep)}.")
+            self.dataset = self.dataset.select(np.flatnonzero(keep))
+
+    def get_prompt_length_index(self, fingerprint: Any) -> PromptLengthIndex:
+        """The prompt length index of the examples identified by `fingerprint`, under the current settings."""
+        index_dir = self.prompt_length_index_dir
+        if index_dir is None:
+            index_dir = os.path.join(datasets.config.HF_DATASETS_CACHE, "prompt_lengths")
+
+        if self.vila_model:
+            num_video_frames = getattr(self.processor.config, "num_video_frames", None)
+        else:
+            num_video_frames = getattr(self.processor, "num_video_frames", None)
+
+        return PromptLengthIndex(
+            index_dir,
+            key={
+                "fingerprint": fingerprint,
+                "keys": [self.prompt_key, self.image_key, self.video_key],
+                "media_dirs": [self.image_dir, self.video_dir],
+                "format_prompt": self.format_prompt,
+                "tokenizer": [self.tokenizer.name_or_path, len(self.tokenizer), self.tokenizer.chat_template],
+                "processor": _get_config_dict(self.processor),
+                "image_processor": _get_config_dict(getattr(self.processor, "image_processor", None)),
+                "pixels": [self.min_pixels, self.max_pixels],
+                "num_video_frames": num_video_frames,
+                "model_type": [self.vila_model, self.is_omni],
+            },
+        )
+
+    def _get_prompt_lengths(self) -> Dict[str, np.ndarray]:
+        """Load the prompt lengths from the sidecar index, or run the processor over the dataset once."""
+        index = self.get_prompt_length_index(self.dataset._fingerprint)
+        lengths = index.load(len(self.dataset))
+        if lengths is not None:
+            print(f"Loaded prompt lengths from {index.path}.")
+            return lengths
+
+        length_dataset = self.dataset.map(
+            self._get_prompt_length_fn(),
+            remove_columns=self.dataset.column_names,
+            desc="Computing prompt lengths",
+            num_proc=16,
+        )
+        lengths = {key: np.asarray(length_dataset[key], dtype=np.int64) for key in ("text_tokens", "vision_tokens")}
+        index.save(lengths)
+        return lengths
+
+    def _get_prompt_length_fn(self) -> Callable[[Dict[str, Any]], Dict[str, int]]:
+        if self.vila_model:
+            return partial(
+                _get_prompt_length_vila,
+                tokenizer=self.tokenizer,
+                prompt_key=self.prompt_key,
+                image_key=self.image_key,
+                image_dir=self.image_dir,
+                video_key=self.video_key,
+                video_dir=self.video_dir,
             )
 
+        return self._get_prompt_length
+
     def _build_messages(self, example: Dict[str, Any]) -> List[Dict[str, Any]]:
         prompt_str: str = example[self.prompt_key]
         if self.format_prompt:
@@ -295,7 +472,7 @@ class RLHFDataset(Dataset):
         else:
             return [{"role": "user", "content": prompt_str}]
 
-    def _filter_overlong_prompts(self, example: Dict[str, Any]) -> bool:
+    def _get_prompt_length(self, example: Dict[str, Any]) -> Dict[str, int]:
         messages = self._build_messages(example)
         if self.image_key in example:
             prompt = self.processor.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
@@ -307,16 +484,22 @@ class RLHFDataset(Dataset):
                 process_image(image, min_pixels=self.min_pixels, max_pixels=self.max_pixels) for image in images
             ] or None
             model_inputs = self.processor(resized_images, [prompt], add_special_tokens=False, return_tensors="pt")
-            return model_inputs["input_ids"].size(-1) <= self.max_prompt_length
+            input_ids = model_inputs["input_ids"][0]
+            image_token_id = self.processor.tokenizer.convert_tokens_to_ids("<|image_pad|>")
+            vision_tokens = (input_ids == image_token_id).sum().item()
+            return {"text_tokens": input_ids.size(-1) - vision_tokens, "vision_tokens": vision_tokens}
         else:
             input_ids = self.tokenizer.apply_chat_template(messages, add_generation_prompt=True)
-            return len(input_ids) <= self.max_prompt_length
+            return {"text_tokens": len(input_ids), "vision_tokens": 0}
 
     def __len__(self):
         return len(self.dataset)
 
     def __getitem__(self, index):
-        example: dict = self.dataset[index]
+        return self.process_example(self.dataset[index])
+
+    def process_example(self, example: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the model inputs of a raw example."""
         messages = self._build_messages(example)
         max_prompt_length = self.max_prompt_length
         if self.vila_model:
@@ -324,23 +507,21 @@ class RLHFDataset(Dataset):
             vision_key = messages[-1]['content'][0]['type']
             videos_cache = []
             num_video_frames = self.processor.config.num_video_frames
-            if self.cache_dir is not None:
-                cache_path = os.path.join(self.cache_dir, example[self.video_key].split(".")[0]+".pt")
-                if os.path.exists(cache_path):
-                    video_cache = torch.load(cache_path)
-                    video_cache_frames = video_cache.size(0)
-                    if self.processor.num_video_frames != video_cache_frames:
-                        print("Disable using cache video, because the requires num of video frames %d should equal to the cached frames %d" % (self.processor.num_video_frames, video_cache_frames))
-                        self.cache_dir = None
-                    else:
-                        videos_cache.append(video_cache.float() / 255 * 2 - 1)
-                        self.processor.config.num_video_frames = 1
+            if self.video_cache is not None:
+                video_cache = self.video_cache.load(example[self.video_key])
+                if video_cache is not None and video_cache.size(0) == num_video_frames:
+                    videos_cache.append(video_cache)  # uint8, normalized by the rollout worker
+                    self.processor.config.num_video_frames = 1
 
             messages = self.processor.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
             model_inputs = self.processor(text=[messages], return_tensors="pt")
-            example["multi_modal_data"] = {
-                vision_key: videos_cache if len(videos_cache) else model_inputs['media'][vision_key],
-            }
+            if len(videos_cache) == 0:
+                videos_cache = [
+                    _quantize_vila_frames(frames, self.processor.image_processor)
+                    for frames in model_inputs["media"][vision_key]
+                ]
+
+            example["multi_modal_data"] = {vision_key: videos_cache}
             self.processor.config.num_video_frames = num_video_frames
             input_ids = model_inputs.pop("input_ids")[0]
             attention_mask = model_inputs.pop("attention_mask")[0]
@@ -386,22 +567,17 @@ class RLHFDataset(Dataset):
                         image_positions = (input_ids == image_token_id)
                         attention_mask = attention_mask.masked_fill(image_positions, 0)      
                 example["multi_modal_data"] = {"images": images}
+                example["multi_modal_inputs"] = get_multi_modal_inputs(model_inputs)
                 #image_token_id = self.processor.tokenizer.convert_tokens_to_ids("<|image_pad|>")
                 #max_prompt_length += (input_ids==image_token_id).sum()
             elif self.video_key in example:
                 if not self.is_omni:
                     prompt = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
                     videos = None
-                    if self.cache_dir is not None:
-                        cache_path = os.path.join(self.cache_dir, example[self.video_key].split(".")[0]+".pt")
-                        if os.path.exists(cache_path):
-                            video_cache = torch.load(cache_path).float()
-                            video_cache_frames = video_cache.size(0)
-                            if self.processor.num_video_frames != video_cache_frames:
-                                print("Disable using cache video, because the requires num of video frames %d should equal to the cached frames %d" % (self.processor.num_video_frames, video_cache_frames))
-                                self.cache_dir = None
-                            else:
-                                videos = [video_cache]
+                    if self.video_cache is not None:
+                        video_cache = self.video_cache.load(example[self.video_key])
+                        if video_cache is not None and video_cache.size(0) == self.processor.num_video_frames:
+                            videos = [video_cache]
 
                     if videos is None:
                         images, videos, video_kwargs = process_vision_info(messages, return_video_kwargs=True)
@@ -419,6 +595,7 @@ class RLHFDataset(Dataset):
                     input_ids = model_inputs.pop("input_ids")[0]
                     attention_mask = model_inputs.pop("attention_mask")[0]
                     example["multi_modal_data"] = {"video": videos}
+                    example["multi_modal_inputs"] = get_multi_modal_inputs(model_inputs)
 
                     if self.num_tokens_per_frame < 0:
                         video_token_id = self.processor.tokenizer.convert_tokens_to_ids("<|video_pad|>")
@@ -427,16 +604,34 @@ class RLHFDataset(Dataset):
                     max_prompt_length += (self.num_tokens_per_frame * self.processor.num_video_frames)
                 else:
                     prompt = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)[0]
-                    audios, images, videos, video_kwargs = process_mm_info(messages, use_audio_in_video=True,
-                                                                           return_video_kwargs=True)
+                    audio_kwargs = {}
+                    if self.audio_feature_store is not None:  # skip the decoding and the feature extractor
+                        audios, audio_kwargs["audio_features"] = self.audio_feature_store.process_audio_info(
+                            messages, use_audio_in_video=True
+                        )
+                        images, videos, video_kwargs = process_omni_vision_info(messages, return_video_kwargs=True)
+                    else:
+                        audios, images, videos, video_kwargs = process_mm_info(
+                            messages, use_audio_in_video=True, return_video_kwargs=True
+                        )
                     if len(videos) > 0 and not "resized_height" in self.video_hw and not "resized_width" in self.video_hw:
                         self.video_hw["resized_height"], self.video_hw["resized_width"] = videos[0].size(2), videos[
                             0].size(3)
-                    model_inputs = self.processor(text=[prompt], audio=audios, images=images, videos=videos, padding=True,
-                                                  return_tensors="pt", use_audio_in_video=True, **video_kwargs)
+                    model_inputs = self.processor(
+                        text=[prompt],
+                        audio=audios,
+                        images=images,
+                        videos=videos,
+                        padding=True,
+                        return_tensors="pt",
+                        use_audio_in_video=True,
+                        **video_kwargs,
+                        **audio_kwargs,
+                    )
                     input_ids = model_inputs.pop("input_ids")[0]
                     attention_mask = model_inputs.pop("attention_mask")[0]
                     example["multi_modal_data"] = {"video": videos, "audio": audios}
+                    example["multi_modal_inputs"] = get_multi_modal_inputs(model_inputs)
                     feature_attention_mask = model_inputs.pop("feature_attention_mask")
                     audio_feature_length = torch.sum(feature_attention_mask, dim=1)
                     audio_token_id = self.processor.tokenizer.convert_tokens_to_ids("<|VIDEO|>")
@@ -499,3 +694,179 @@ class RLHFDataset(Dataset):
         else:
             example["ground_truth"] = answer
         return example
+
+
+SHARD_EXTENSIONS = (".parquet", ".arrow")
+
+
+def list_shards(data_path: str) -> List[str]:
+    """The parquet or arrow shards of a directory, a glob pattern or a single file, in a stable order."""
+    if os.path.isdir(data_path):
+        paths = glob.glob(os.path.join(data_path, "**", "*"), recursive=True)
+    else:
+        paths = glob.glob(data_path)
+
+    shards = sorted(path for path in paths if path.endswith(SHARD_EXTENSIONS) and os.path.isfile(path))
+    if len(shards) == 0:
+        raise ValueError(f"No parquet or arrow shards found at {data_path}.")
+
+    return shards
+
+
+def iter_shard_rows(path: str, offset: int = 0) -> Iterator[Dict[str, Any]]:
+    """Read the rows of a shard from `offset`, the row groups and record batches before it are skipped undecoded."""
+    if path.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(path)
+        for row_group in range(parquet_file.num_row_groups):
+            num_rows = parquet_file.metadata.row_group(row_group).num_rows
+            if offset >= num_rows:
+                offset -= num_rows
+                continue
+
+            yield from parquet_file.read_row_group(row_group).slice(offset).to_pylist()
+            offset = 0
+    else:
+        with pa.memory_map(path) as source:
+            try:
+                reader = pa.ipc.open_file(source)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            except pa.ArrowInvalid:  # the streaming format of `datasets.save_to_disk`
+                source.seek(0)
+                batches = pa.ipc.open_stream(source)
+
+            for batch in batches:
+                if offset >= batch.num_rows:
+                    offset -= batch.num_rows
+                    continue
+
+                yield from batch.slice(offset).to_pylist()
+                offset = 0
+
+
+class StreamingRLHFDataset(IterableDataset):
+    """Stream the examples of `RLHFDataset` from local parquet or arrow shards, without loading or indexing them.
+
+    The shards are shuffled every epoch and split across the dataloader workers. Each worker fills a shuffle
+    buffer with the next `shuffle_buffer_size` examples that pass the prompt length filter, and drains it in a
+    random order. The RNG of a buffer is derived from the seed, the epoch and the buffer position, so the state
+    of a worker is only its epoch, the shard and row offset where the buffer starts, and the number of examples
+    drained. `StatefulDataLoader` saves it with the checkpoint, and a resumed worker refills that buffer and
+    continues from the next example. The stream repeats over epochs until the trainer stops.
+
+    Args:
+        data_path (str): a directory, a glob pattern or a file of parquet or arrow shards
+        shuffle (bool): shuffle the shards and the examples
+        shuffle_buffer_size (int): the number of examples shuffled together
+        seed (int): the seed of the shuffle
+        kwargs: the arguments of `RLHFDataset`
+    """
+
+    def __init__(
+        self,
+        data_path: str,
+        shuffle: bool = True,
+        shuffle_buffer_size: int = 1024,
+        seed: int = 1,
+        **kwargs,
+    ):
+        self.shards = list_shards(data_path)
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        self.rlhf_dataset = RLHFDataset(data_path=None, **kwargs)
+        self._state = {"epoch": 0, "shard_index": 0, "offset": 0, "num_yielded": 0}
+        self._keep_masks: Dict[int, np.ndarray] = {}
+
+    def state_dict(self) -> Dict[str, int]:
+        return dict(self._state)
+
+    def load_state_dict(self, state_dict: Dict[str, int]) -> None:
+        self._state = dict(state_dict)
+
+    def _get_worker_shards(self, epoch: int) -> List[int]:
+        shard_ids = list(range(len(self.shards)))
+        if self.shuffle:
+            shard_ids = np.random.default_rng([self.seed, epoch]).permutation(shard_ids).tolist()
+
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            shard_ids = shard_ids[worker_info.id :: worker_info.num_workers]
+
+        return shard_ids
+
+    def _get_keep_mask(self, shard_id: int) -> np.ndarray:
+        """The rows of a shard that pass the prompt length filter, the lengths are computed once and indexed."""
+        if shard_id not in self._keep_masks:
+            path = self.shards[shard_id]
+            stat = os.stat(path)
+            index = self.rlhf_dataset.get_prompt_length_index([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+            lengths = index.load()
+            if lengths is None:
+                length_fn = self.rlhf_dataset._get_prompt_length_fn()
+                rows = [length_fn(example) for example in iter_shard_rows(path)]
+                lengths = {
+                    key: np.asarray([row[key] for row in rows], dtype=np.int64)
+                    for key in ("text_tokens", "vision_tokens")
+                }
+                index.save(lengths)
+
+            max_prompt_length = self.rlhf_dataset.max_prompt_length
+            self._keep_masks[shard_id] = lengths["text_tokens"] + lengths["vision_tokens"] <= max_prompt_length
+
+        return self._keep_masks[shard_id]
+
+    def _fill_buffer(
+        self, shard_ids: List[int], shard_index: int, offset: int
+    ) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Read the kept examples of a buffer from a shard position, and return the position after it."""
+        buffer = []
+        while shard_index < len(shard_ids) and len(buffer) < self.shuffle_buffer_size:
+            keep = None
+            if self.rlhf_dataset.filter_overlong_prompts:
+                keep = self._get_keep_mask(shard_ids[shard_index])
+
+            for example in iter_shard_rows(self.shards[shard_ids[shard_index]], offset):
+                offset += 1
+                if keep is None or keep[offset - 1]:
+                    buffer.append(example)
+
+                if len(buffer) == self.shuffle_buffer_size:
+                    break
+            else:
+                shard_index, offset = shard_index + 1, 0
+
+        return buffer, shard_index, offset
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        epoch, shard_index, offset, num_yielded = (
+            self._state[key] for key in ("epoch", "shard_index", "offset", "num_yielded")
+        )
+        from_start = shard_index == 0 and offset == 0 and num_yielded == 0
+        while True:
+            shard_ids = self._get_worker_shards(epoch)
+            epoch_is_empty = True
+            while shard_index < len(shard_ids):
+                buffer, next_shard_index, next_offset = self._fill_buffer(shard_ids, shard_index, offset)
+                order = np.arange(len(buffer))
+                if self.shuffle:
+                    rng = np.random.default_rng([self.seed, epoch, shard_ids[shard_index], offset])
+                    order = rng.permutation(len(buffer))
+
+                for index in range(num_yielded, len(buffer)):
+                    epoch_is_empty = False
+                    # the state points after the example, it is saved while the generator is suspended here
+                    self._state = {
+                        "epoch": epoch,
+                        "shard_index": shard_index,
+                        "offset": offset,
+                        "num_yielded": index + 1,
+                    }
+                    yield self.rlhf_dataset.process_example(buffer[order[index]])
+
+                shard_index, offset, num_yielded = next_shard_index, next_offset, 0
+
+            if epoch_is_empty and from_start:  # no shards or no kept examples in this worker
+                return
+
+            epoch, shard_index, offset, from_start = epoch + 1, 0, 0, True
+            self._state = {"epoch": epoch, "shard_index": 0, "offset": 0, "num_yielded": 0}
@@ -0,0 +1,160 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A content-addressed on-disk cache of decoded video frames, shared across epochs, processes and jobs.
+
+The entries are keyed by a hash of the video content and the sampling and resize parameters, so a renamed or
+copied video hits the cache and a modified video misses it. Frames are stored as uint8 `.npy` files and memory-mapped
+at load, the least recently used entries are evicted when the cache exceeds its size limit.
+
+The cache is enabled by `data.frame_cache_dir` or the `VIDEO_FRAME_CACHE_DIR` environment variable.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+FINGERPRINT_CHUNK_SIZE = 1024**2
+
+
+def file_fingerprint(path: str) -> str:
+    """Hash the size and the head, middle and tail chunks of a file, reading at most 3 MB of a long video."""
+    size = os.path.getsize(path)
+    hasher = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        for offset in (0, max(size // 2 - FINGERPRINT_CHUNK_SIZE // 2, 0), max(size - FINGERPRINT_CHUNK_SIZE, 0)):
+            f.seek(offset)
+            hasher.update(f.read(FINGERPRINT_CHUNK_SIZE))
+
+    return hasher.hexdigest()
+
+
+class FrameCache:
+    """A size-bounded directory of decoded frames.
+
+    Args:
+        cache_dir (str): the directory of the cache
+        max_bytes (int): the size limit, checked every `evict_interval` saves
+        evict_interval (int): the number of saves between two size checks
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, evict_interval: int = 32):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.lock = threading.Lock()
+        self.num_saves = 0
+        self._fingerprints: Dict[Tuple[str, int, int], str] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_key(self, path: str, params: Any) -> Optional[str]:
+        """The key of a local video, or None if the video is not a local file."""
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        stat_key = (path, stat.st_size, stat.st_mtime_ns)
+        if stat_key not in self._fingerprints:  # avoid re-reading the same file within a process
+            self._fingerprints[stat_key] = file_fingerprint(path)
+
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{self._fingerprints[stat_key]}-{params}".encode()).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def load(self, key: str) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+        """Memory-map the frames and read the metadata of an entry."""
+        path = self._get_path(key)
+        try:
+            with open(path + ".json") as f:
+                metadata = json.load(f)
+
+            frames = np.load(path + ".npy", mmap_mode="c")
+            os.utime(path + ".npy")  # the modification time orders the eviction
+        except (OSError, ValueError):  # missing, being evicted or partially written by an older version
+            return None
+
+        return frames, metadata
+
+    def save(self, key: str, frames: np.ndarray, metadata: Dict[str, Any]) -> None:
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to temporary files first, the metadata is written last and marks the entry as complete
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        np.save(f"{path}.{suffix}.npy", np.ascontiguousarray(frames, dtype=np.uint8))
+        os.replace(f"{path}.{suffix}.npy", path + ".npy")
+        with open(f"{path}.{suffix}.json", "w") as f:
+            json.dump(metadata, f)
+
+        os.replace(f"{path}.{suffix}.json", path + ".json")
+        with self.lock:
+            self.num_saves += 1
+            should_evict = (self.num_saves - 1) % self.evict_interval == 0  # the first save, then every interval
+
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache is below 90% of its size limit."""
+        entries, total_bytes = [], 0
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".npy") and ".tmp" not in filename:
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except FileNotFoundError:
+                        continue
+
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, filename[: -len(".npy")])))
+                    total_bytes += stat.st_size
+
+        if total_bytes <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            for suffix in (".json", ".npy"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:  # evicted by another process
+                    pass
+
+            total_bytes -= size
+            if total_bytes <= 0.9 * self.max_bytes:
+                break
+
+
+_frame_cache: Optional[FrameCache] = None
+_frame_cache_configured = False
+
+
+def configure_frame_cache(cache_dir: Optional[str], max_gb: float = 100.0) -> None:
+    """Set the frame cache of this process, forked dataloader workers inherit it."""
+    global _frame_cache, _frame_cache_configured
+    _frame_cache = FrameCache(cache_dir, int(max_gb * 1024**3)) if cache_dir is not None else None
+    _frame_cache_configured = True
+
+
+def get_frame_cache() -> Optional[FrameCache]:
+    if not _frame_cache_configured:
+        configure_frame_cache(
+            os.environ.get("VIDEO_FRAME_CACHE_DIR"), float(os.environ.get("VIDEO_FRAME_CACHE_GB", 100.0))
+        )
+
+    return _frame_cache
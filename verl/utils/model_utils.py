@@ -15,8 +15,9 @@
 Utilities to create common models
 """
 
+import re
 from functools import lru_cache
-from typing import Optional, Tuple
+from typing import Dict, Iterable, Optional, Set, Tuple
 
 import torch
 import torch.distributed as dist
@@ -71,3 +72,31 @@ def print_model_size(model: nn.Module, name: Optional[str] = None) -> None:
             name = model.__class__.__name__
 
         print(f"{name} contains {n_params:.2f}{scale} parameters.")
+
+
+def get_hf_key_mapping(keys: Iterable[str], model: nn.Module) -> Dict[str, str]:
+    """Map the state dict keys to the checkpoint keys of huggingface, reversing the checkpoint conversion mapping
+    of transformers as `save_pretrained` does. Only the keys are needed, no collective is involved."""
+    reverse_key_mapping = {v: k for k, v in getattr(model, "_checkpoint_conversion_mapping", {}).items()}
+    key_mapping = {}
+    for key in keys:
+        new_key = key
+        for pattern, replacement in reverse_key_mapping.items():
+            replacement = replacement.lstrip("^")  # strip off un-needed chars and patterns
+            replacement = re.sub(r"\(.*\)", "", replacement)
+            new_key, n_replace = re.subn(pattern, replacement, key)
+            if n_replace > 0:
+                break
+
+        key_mapping[key] = new_key
+
+    return key_mapping
+
+
+def get_tied_weights_keys(model: nn.Module) -> Set[str]:
+    """The keys of the tied weights, they are restored from the input embeddings on loading, as `save_pretrained`
+    drops them."""
+    if not getattr(getattr(model, "config", None), "tie_word_embeddings", False):
+        return set()
+
+    return set(getattr(model, "_tied_weights_keys", None) or [])
@@ -141,11 +141,16 @@ class Qwen2_5OmniProcessor(ProcessorMixin):
                 tensor, or a nested list of 3D frames. Both channels-first and channels-last formats are supported.
             audio (`np.ndarray`, `List[np.ndarray]`):
                 The audio or batch of audio to be prepared. Each audio can be a NumPy array.
+            audio_features (`List[Dict[str, np.ndarray]]`, *optional*):
+                The precomputed `input_features` and `feature_attention_mask` of each audio, e.g. from the
+                `AudioFeatureStore`. If given, the feature extractor is skipped.
         """
 
         if text is None:
             raise ValueError("You need to specify either a `text` input to process.")
 
+        audio_features = kwargs.pop("audio_features", None)
+
         output_kwargs = self._merge_kwargs(
             Qwen2_5OmniProcessorKwargs,
             tokenizer_init_kwargs=self.tokenizer.init_kwargs,
@@ -157,7 +162,14 @@ class Qwen2_5OmniProcessor(ProcessorMixin):
         use_audio_in_video = output_kwargs["videos_kwargs"].pop("use_audio_in_video")
         fps = output_kwargs["videos_kwargs"].pop("fps", 2.0)
 
-        if audio is not None:
+        if audio_features is not None:
+            audio_inputs = {
+                "feature_attention_mask": np.concatenate([f["feature_attention_mask"] for f in audio_features]),
+                "input_features": np.concatenate([f["input_features"] for f in audio_features]),
+            }
+            input_lengths = (audio_inputs["feature_attention_mask"].sum(-1) - 1) // 2 + 1
+            audio_lengths = iter((input_lengths - 2) // 2 + 1)
+        elif audio is not None:
             output_kwargs["audio_kwargs"]["padding"] = "max_length"  # Support "max_length" padding only here
             audio_inputs = self.feature_extractor(audio, **output_kwargs["audio_kwargs"])
             audio_inputs["feature_attention_mask"] = audio_inputs.pop(
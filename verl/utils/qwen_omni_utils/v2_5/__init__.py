@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .audio_process import process_audio_info
+from .audio_process import AudioFeatureStore, process_audio_info
+from .demux import fetch_video_and_audio, process_mm_info_single_pass, use_single_pass_demux
 from .vision_process import (
     extract_vision_info,
     fetch_image,
@@ -23,6 +24,9 @@ from .vision_process import (
 
 
 def process_mm_info(conversations, use_audio_in_video, return_video_kwargs=False):
+    if use_audio_in_video and use_single_pass_demux():
+        return process_mm_info_single_pass(conversations, return_video_kwargs=return_video_kwargs)
+
     audios = process_audio_info(conversations, use_audio_in_video)
     vision = process_vision_info(conversations, return_video_kwargs=return_video_kwargs)
     return (audios,) + vision
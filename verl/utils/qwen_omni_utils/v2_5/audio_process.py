@@ -13,7 +13,13 @@
 # limitations under the License.
 
 import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
 from io import BytesIO
+from typing import Optional
 
 import audioread
 import av
@@ -21,7 +27,12 @@ import librosa
 import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
 SAMPLE_RATE=16000
+_AUDIO_ENTRY_NAMES = ("waveform", "input_features", "feature_attention_mask")
+
+
 def _check_if_video_has_audio(video_path):
     container = av.open(video_path)
     audio_streams = [stream for stream in container.streams if stream.type == "audio"]
@@ -30,9 +41,37 @@ def _check_if_video_has_audio(video_path):
     return True
 
 
-def process_audio_info(conversations: list[dict] | list[list[dict]], use_audio_in_video: bool):
+def extract_audio_info(conversations: list[dict] | list[list[dict]], use_audio_in_video: bool) -> list[dict]:
+    """Collect the elements that carry audio, the videos are included if `use_audio_in_video`."""
+    audio_infos = []
+    if isinstance(conversations[0], dict):
+        conversations = [conversations]
+    for conversation in conversations:
+        for message in conversation:
+            if not isinstance(message["content"], list):
+                continue
+            for ele in message["content"]:
+                if ele["type"] == "audio" or (use_audio_in_video and ele["type"] == "video"):
+                    audio_infos.append(ele)
+    return audio_infos
+
+
+def get_audio_path(ele: dict) -> Optional[str]:
+    """The local file of an audio element, or None for arrays, urls and base64 data."""
+    if ele["type"] == "audio":
+        path = ele.get("audio", ele.get("audio_url"))
+    else:
+        path = ele.get("video", ele.get("video_url"))
+
+    if not isinstance(path, str) or path.startswith(("data:audio", "http://", "https://")):
+        return None
+
+    return path[len("file://") :] if path.startswith("file://") else path
+
+
+def fetch_audio(ele: dict) -> np.ndarray:
     """
-    Read and process audio info
+    Read and resample the audio of an element
 
     Support dict keys:
 
@@ -46,63 +85,151 @@ def process_audio_info(conversations: list[dict] | list[list[dict]], use_audio_i
     - video_start
     - video_end
     """
-    audios = []
-    if isinstance(conversations[0], dict):
-        conversations = [conversations]
-    for conversation in conversations:
-        for message in conversation:
-            if not isinstance(message["content"], list):
-                continue
-            for ele in message["content"]:
-                if ele["type"] == "audio":
-                    if "audio" in ele or "audio_url" in ele:
-                        path = ele.get("audio", ele.get("audio_url"))
-                        audio_start = ele.get("audio_start", 0.0)
-                        audio_end = ele.get("audio_end", None)
-                        if isinstance(path, np.ndarray):
-                            if path.ndim > 1:
-                                raise ValueError("Support only mono audio")
-                            audios.append(
-                                path[int(SAMPLE_RATE * audio_start) : None if audio_end is None else int(SAMPLE_RATE * audio_end)]
-                            )
-                            continue
-                        elif path.startswith("data:audio"):
-                            _, base64_data = path.split("base64,", 1)
-                            data = BytesIO(base64.b64decode(base64_data))
-                        elif path.startswith("http://") or path.startswith("https://"):
-                            data = audioread.ffdec.FFmpegAudioFile(path)
-                        elif path.startswith("file://"):
-                            data = path[len("file://") :]
-                        else:
-                            data = path
-                    else:
-                        raise ValueError("Unknown audio {}".format(ele))
-                elif use_audio_in_video and ele["type"] == "video":
-                    if "video" in ele or "video_url" in ele:
-                        path = ele.get("video", ele.get("video_url"))
-                        audio_start = ele.get("video_start", 0.0)
-                        audio_end = ele.get("video_end", None)
-                        assert _check_if_video_has_audio(
-                            path
-                        ), "Video must has audio track when use_audio_in_video=True"
-                        if path.startswith("http://") or path.startswith("https://"):
-                            data = audioread.ffdec.FFmpegAudioFile(path)
-                        elif path.startswith("file://"):
-                            data = path[len("file://") :]
-                        else:
-                            data = path
-                    else:
-                        raise ValueError("Unknown video {}".format(ele))
-                else:
-                    continue
-                audios.append(
-                    librosa.load(
-                        data,
-                        sr=SAMPLE_RATE,
-                        offset=audio_start,
-                        duration=(audio_end - audio_start) if audio_end is not None else None,
-                    )[0]
-                )
+    if ele["type"] == "audio":
+        if "audio" in ele or "audio_url" in ele:
+            path = ele.get("audio", ele.get("audio_url"))
+            audio_start = ele.get("audio_start", 0.0)
+            audio_end = ele.get("audio_end", None)
+            if isinstance(path, np.ndarray):
+                if path.ndim > 1:
+                    raise ValueError("Support only mono audio")
+                return path[int(SAMPLE_RATE * audio_start) : None if audio_end is None else int(SAMPLE_RATE * audio_end)]
+            elif path.startswith("data:audio"):
+                _, base64_data = path.split("base64,", 1)
+                data = BytesIO(base64.b64decode(base64_data))
+            elif path.startswith("http://") or path.startswith("https://"):
+                data = audioread.ffdec.FFmpegAudioFile(path)
+            elif path.startswith("file://"):
+                data = path[len("file://") :]
+            else:
+                data = path
+        else:
+            raise ValueError("Unknown audio {}".format(ele))
+    else:
+        if "video" in ele or "video_url" in ele:
+            path = ele.get("video", ele.get("video_url"))
+            audio_start = ele.get("video_start", 0.0)
+            audio_end = ele.get("video_end", None)
+            assert _check_if_video_has_audio(
+                path
+            ), "Video must has audio track when use_audio_in_video=True"
+            if path.startswith("http://") or path.startswith("https://"):
+                data = audioread.ffdec.FFmpegAudioFile(path)
+            elif path.startswith("file://"):
+                data = path[len("file://") :]
+            else:
+                data = path
+        else:
+            raise ValueError("Unknown video {}".format(ele))
+    return librosa.load(
+        data,
+        sr=SAMPLE_RATE,
+        offset=audio_start,
+        duration=(audio_end - audio_start) if audio_end is not None else None,
+    )[0]
+
+
+def process_audio_info(conversations: list[dict] | list[list[dict]], use_audio_in_video: bool):
+    """
+    Read and process audio info, see `fetch_audio` for the supported dict keys.
+    """
+    audios = [fetch_audio(ele) for ele in extract_audio_info(conversations, use_audio_in_video)]
     if len(audios) == 0:
         audios = None
     return audios
+
+
+class AudioFeatureStore:
+    """Store the resampled waveform and the log-mel features of every audio file once, and memory-map them back.
+
+    The entries are keyed by the file (path, size and modification time), the clip range, the sample rate and the
+    feature extractor config. Audio that is not a local file is processed every time.
+
+    Args:
+        store_dir (str): the directory of the store
+        feature_extractor (FeatureExtractionMixin): the feature extractor of the processor
+        log_interval (int): log the hit rate every `log_interval` requests
+    """
+
+    def __init__(self, store_dir: str, feature_extractor, log_interval: int = 256):
+        self.store_dir = store_dir
+        self.feature_extractor = feature_extractor
+        self.log_interval = log_interval
+        self.config_hash = hashlib.sha256(
+            json.dumps([SAMPLE_RATE, feature_extractor.to_dict()], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(store_dir, exist_ok=True)
+
+    def get_entry_dir(self, ele: dict) -> Optional[str]:
+        path = get_audio_path(ele)
+        if path is None or not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        prefix = "audio" if ele["type"] == "audio" else "video"
+        clip = [ele.get(f"{prefix}_start", 0.0), ele.get(f"{prefix}_end", None)]
+        key = json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns, clip, self.config_hash])
+        key = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.store_dir, key[:2], key)
+
+    def extract_features(self, audio: np.ndarray) -> dict[str, np.ndarray]:
+        """Compute the features of one audio as the processor does."""
+        features = self.feature_extractor(
+            [audio], sampling_rate=SAMPLE_RATE, padding="max_length", return_attention_mask=True, return_tensors="np"
+        )
+        return {"input_features": features["input_features"], "feature_attention_mask": features["attention_mask"]}
+
+    def fetch(self, ele: dict) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """Return the waveform and the features of an audio element."""
+        if (self.hits + self.misses + 1) % self.log_interval == 0:
+            logger.info(f"audio feature store stats: {self.stats()}")
+
+        entry_dir = self.get_entry_dir(ele)
+        if entry_dir is not None and os.path.exists(entry_dir):
+            try:
+                arrays = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="c") for name in _AUDIO_ENTRY_NAMES}
+                self.hits += 1
+                waveform = arrays.pop("waveform")
+                return waveform, arrays
+            except (OSError, ValueError):  # removed or written by an older version
+                pass
+
+        self.misses += 1
+        waveform = fetch_audio(ele)
+        features = self.extract_features(waveform)
+        if entry_dir is not None:
+            # write to a temporary directory first, an entry directory always holds a complete entry
+            tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, array in {"waveform": waveform, **features}.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:  # written by another process
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return waveform, features
+
+    def process_audio_info(self, conversations: list[dict] | list[list[dict]], use_audio_in_video: bool):
+        """The same as `process_audio_info`, and the features of the audios for the `audio_features` of the processor."""
+        audios, audio_features = [], []
+        for ele in extract_audio_info(conversations, use_audio_in_video):
+            waveform, features = self.fetch(ele)
+            audios.append(waveform)
+            audio_features.append(features)
+
+        if len(audios) == 0:
+            return None, None
+
+        return audios, audio_features
+
+    def stats(self) -> dict[str, float]:
+        num_requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / num_requests if num_requests > 0 else 0.0,
+        }
@@ -0,0 +1,176 @@
+# Copyright 2025 The Qwen team
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Read the frames and the audio of a video in a single demux pass, for `use_audio_in_video`.
+
+`fetch_audio` and `fetch_video` open the same container separately (an audio track check, librosa through an
+ffmpeg subprocess and the video reader). Here one PyAV container yields both streams, the video frames match the
+torchvision reader and the audio matches the audioread path of `librosa.load`, so the results are bit-compatible
+with `fetch_audio` and `fetch_video` when torchvision is the video reader backend.
+
+The single pass is used by default with the torchvision backend, set `OMNI_SINGLE_PASS_DEMUX=1` to also use it with
+the other backends (the frames may differ slightly from theirs) or `OMNI_SINGLE_PASS_DEMUX=0` to disable it.
+"""
+
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+import av
+import librosa
+import numpy as np
+import torch
+
+from .audio_process import SAMPLE_RATE, extract_audio_info, fetch_audio
+from .vision_process import (
+    IMAGE_FACTOR,
+    extract_vision_info,
+    fetch_image,
+    fetch_video,
+    get_video_reader_backend,
+    resize_video,
+    smart_nframes,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def use_single_pass_demux() -> bool:
+    flag = os.getenv("OMNI_SINGLE_PASS_DEMUX", None)
+    if flag is not None:
+        return flag.lower() in ("1", "true")
+
+    return get_video_reader_backend() == "torchvision"
+
+
+def get_local_video_path(ele: dict) -> Optional[str]:
+    """The local file of a video element, or None for frame lists and urls."""
+    path = ele.get("video")
+    if not isinstance(path, str) or path.startswith(("http://", "https://")):
+        return None
+
+    path = path[len("file://") :] if path.startswith("file://") else path
+    return path if os.path.isfile(path) else None
+
+
+def _audio_to_float(pcm: np.ndarray, sr_native: int, num_channels: int, ele: dict) -> np.ndarray:
+    """Clip, downmix and resample the interleaved int16 samples as `librosa.load` does."""
+    audio_start = ele.get("video_start", 0.0)
+    audio_end = ele.get("video_end", None)
+    s_start = int(np.round(sr_native * audio_start)) * num_channels
+    s_end = None
+    if audio_end is not None:
+        s_end = s_start + int(np.round(sr_native * (audio_end - audio_start))) * num_channels
+
+    y = 1.0 / 32768 * pcm[s_start:s_end].astype(np.float32)
+    if num_channels > 1:
+        y = librosa.to_mono(y.reshape((-1, num_channels)).T)
+
+    if sr_native != SAMPLE_RATE:
+        y = librosa.resample(y, orig_sr=sr_native, target_sr=SAMPLE_RATE, res_type="soxr_hq")
+
+    return y
+
+
+def read_video_and_audio(ele: dict) -> tuple[torch.Tensor, float, np.ndarray]:
+    """Decode the sampled (T, C, H, W) frames, the sample fps and the 16 kHz mono waveform of a local video."""
+    video_path = get_local_video_path(ele)
+    st = time.time()
+    with av.open(video_path) as container:
+        assert len(container.streams.audio) != 0, "Video must has audio track when use_audio_in_video=True"
+        video_stream, audio_stream = container.streams.video[0], container.streams.audio[0]
+        video_stream.thread_type = "AUTO"
+        # the same pts range as `torchvision.io.read_video(pts_unit="sec")`
+        start_offset = int(math.floor(ele.get("video_start", 0.0) * (1 / video_stream.time_base)))
+        end_offset = math.inf
+        if ele.get("video_end", None) is not None:
+            end_offset = int(math.ceil(ele["video_end"] * (1 / video_stream.time_base)))
+
+        # the same sample format as the `ffmpeg -f s16le` pipe read by audioread
+        resampler = av.AudioResampler(format="s16", layout=audio_stream.layout, rate=audio_stream.rate)
+        video_frames, preceding_frame, audio_chunks = {}, None, []
+        for packet in container.demux(video_stream, audio_stream):
+            for frame in packet.decode():
+                if packet.stream.type == "video":
+                    if frame.pts is None:
+                        continue
+                    elif frame.pts < start_offset:
+                        if preceding_frame is None or frame.pts > preceding_frame.pts:
+                            preceding_frame = frame
+                    elif frame.pts <= end_offset:
+                        video_frames[frame.pts] = frame  # keep the decoded frames, only the sampled ones are converted
+                else:
+                    audio_chunks.extend(chunk.to_ndarray().reshape(-1) for chunk in resampler.resample(frame))
+
+        audio_chunks.extend(chunk.to_ndarray().reshape(-1) for chunk in resampler.resample(None))
+        video_fps = float(video_stream.average_rate)
+        sr_native, num_channels = audio_stream.rate, len(audio_stream.layout.channels)
+
+    frames = [video_frames[pts] for pts in sorted(video_frames)]
+    if start_offset > 0 and start_offset not in video_frames and preceding_frame is not None:
+        frames.insert(0, preceding_frame)  # torchvision keeps the last frame before the start
+
+    total_frames = len(frames)
+    nframes = smart_nframes(ele, total_frames=total_frames, video_fps=video_fps)
+    idx = torch.linspace(0, total_frames - 1, nframes).round().long()
+    sample_fps = nframes / max(total_frames, 1e-6) * video_fps
+    video = torch.from_numpy(np.stack([frames[i].to_rgb().to_ndarray() for i in idx.tolist()])).permute(0, 3, 1, 2)
+    pcm = np.concatenate(audio_chunks) if len(audio_chunks) != 0 else np.empty(0, dtype=np.int16)
+    audio = _audio_to_float(pcm, sr_native, num_channels, ele)
+    logger.info(f"single pass demux: {video_path=}, {total_frames=}, {video_fps=}, time={time.time() - st:.3f}s")
+    return video, sample_fps, audio
+
+
+def fetch_video_and_audio(ele: dict, image_factor: int = IMAGE_FACTOR) -> tuple[torch.Tensor, float, np.ndarray]:
+    """The results of `fetch_video(ele, return_video_sample_fps=True)` and `fetch_audio(ele)` from one demux pass."""
+    video, sample_fps, audio = read_video_and_audio(ele)
+    return resize_video(video, ele, image_factor), sample_fps, audio
+
+
+def process_mm_info_single_pass(conversations: list[dict] | list[list[dict]], return_video_kwargs: bool = False):
+    """The same as `process_mm_info(use_audio_in_video=True)`, the local videos are demuxed once."""
+    demuxed = {}
+    for ele in extract_vision_info(conversations):
+        if "video" in ele and id(ele) not in demuxed and get_local_video_path(ele) is not None:
+            demuxed[id(ele)] = fetch_video_and_audio(ele)
+
+    audios = [
+        demuxed[id(ele)][2] if id(ele) in demuxed else fetch_audio(ele)
+        for ele in extract_audio_info(conversations, True)
+    ]
+    image_inputs, video_inputs, video_sample_fps_list = [], [], []
+    for vision_info in extract_vision_info(conversations):
+        if "image" in vision_info or "image_url" in vision_info:
+            image_inputs.append(fetch_image(vision_info))
+        elif "video" in vision_info:
+            if id(vision_info) in demuxed:
+                video_input, video_sample_fps, _ = demuxed[id(vision_info)]
+            else:
+                video_input, video_sample_fps = fetch_video(vision_info, return_video_sample_fps=True)
+
+            video_sample_fps_list.append(video_sample_fps)
+            video_inputs.append(video_input)
+        else:
+            raise ValueError("image, image_url or video should in content.")
+
+    audios = audios if len(audios) != 0 else None
+    image_inputs = image_inputs if len(image_inputs) != 0 else None
+    video_inputs = video_inputs if len(video_inputs) != 0 else None
+    if return_video_kwargs:
+        return audios, image_inputs, video_inputs, {"fps": video_sample_fps_list}
+
+    return audios, image_inputs, video_inputs
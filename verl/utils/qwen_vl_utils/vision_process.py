@@ -19,8 +19,11 @@ import logging
 import math
 import os
 import sys
+import threading
 import time
 import warnings
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
 from io import BytesIO
 
@@ -33,6 +36,8 @@ from torchvision import io, transforms
 from torchvision.transforms import InterpolationMode
 from typing import Optional
 
+from ..frame_cache import get_frame_cache
+
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +61,11 @@ FPS_MAX_FRAMES = 16
 VIDEO_TOTAL_PIXELS = int(float(os.environ.get('VIDEO_MAX_PIXELS', 128000 * 28 * 28 * 0.9)))
 logger.info(f"set VIDEO_TOTAL_PIXELS: {VIDEO_TOTAL_PIXELS}")
 
+# The decode threads and the LRU capacity of the decoded frames. Both are per process, i.e., per dataloader worker,
+# so the host memory of the LRU is `VIDEO_DECODE_CACHE_MB * num_workers` for every rank on the node.
+VIDEO_DECODE_WORKERS = int(os.environ.get("VIDEO_DECODE_WORKERS", 4))
+VIDEO_DECODE_CACHE_BYTES = int(float(os.environ.get("VIDEO_DECODE_CACHE_MB", 256)) * 1024**2)
+
 
 def round_by_factor(number: int, factor: int) -> int:
     """Returns the closest integer to 'number' that is divisible by 'factor'."""
@@ -299,43 +309,201 @@ def get_video_reader_backend() -> str:
     return video_reader_backend
 
 
+def resize_video(video: torch.Tensor, ele: dict, image_factor: int = IMAGE_FACTOR) -> torch.Tensor:
+    """Resize the sampled (T, C, H, W) frames within the pixel limits of the element."""
+    nframes, _, height, width = video.shape
+    min_pixels = ele.get("min_pixels", VIDEO_MIN_PIXELS)
+    total_pixels = ele.get("total_pixels", VIDEO_TOTAL_PIXELS)
+    max_pixels = max(min(VIDEO_MAX_PIXELS, total_pixels / nframes * FRAME_FACTOR), int(min_pixels * 1.05))
+    max_pixels_supposed = ele.get("max_pixels", max_pixels)
+    if max_pixels_supposed > max_pixels:
+        logger.warning(f"The given max_pixels[{max_pixels_supposed}] exceeds limit[{max_pixels}].")
+    max_pixels = min(max_pixels_supposed, max_pixels)
+    if "resized_height" in ele and "resized_width" in ele:
+        resized_height, resized_width = smart_resize(
+            ele["resized_height"],
+            ele["resized_width"],
+            factor=image_factor,
+        )
+    else:
+        resized_height, resized_width = smart_resize(
+            height,
+            width,
+            factor=image_factor,
+            min_pixels=min_pixels,
+            max_pixels=max_pixels,
+        )
+    video = transforms.functional.resize(
+        video,
+        [resized_height, resized_width],
+        interpolation=InterpolationMode.BICUBIC,
+        antialias=True,
+    )  # keep the decoded uint8 frames, they are normalized by the image processor on the consuming worker
+    return video
+
+
+def _decode_video(ele: dict, image_factor: int = IMAGE_FACTOR) -> tuple[torch.Tensor, float]:
+    video_reader_backend = get_video_reader_backend()
+    try:
+        video, sample_fps = VIDEO_READER_BACKENDS[video_reader_backend](ele)
+    except Exception as e:
+        logger.warning(f"video_reader_backend {video_reader_backend} error, use torchvision as default, msg: {e}")
+        video, sample_fps = VIDEO_READER_BACKENDS["torchvision"](ele)
+
+    return resize_video(video, ele, image_factor), sample_fps
+
+
+_VIDEO_DECODE_IGNORED_KEYS = ("type", "video")
+
+
+def _load_or_decode_video(ele: dict, image_factor: int = IMAGE_FACTOR) -> tuple[torch.Tensor, float]:
+    """Read the frames from the on-disk frame cache if enabled, otherwise decode and store them."""
+    frame_cache = get_frame_cache()
+    if frame_cache is None:
+        return _decode_video(ele, image_factor)
+
+    path = ele["video"][7:] if ele["video"].startswith("file://") else ele["video"]
+    params = {
+        "source": "qwen_vl_utils",
+        "backend": get_video_reader_backend(),
+        "image_factor": image_factor,
+        "limits": [VIDEO_MIN_PIXELS, VIDEO_MAX_PIXELS, VIDEO_TOTAL_PIXELS, FRAME_FACTOR, FPS, FPS_MIN_FRAMES, FPS_MAX_FRAMES],
+        "ele": {k: v for k, v in ele.items() if k not in _VIDEO_DECODE_IGNORED_KEYS},
+    }
+    key = frame_cache.get_key(path, params)
+    cached = frame_cache.load(key) if key is not None else None
+    if cached is not None:
+        frames, metadata = cached
+        return torch.from_numpy(frames), metadata["sample_fps"]
+
+    video, sample_fps = _decode_video(ele, image_factor)
+    if key is not None:
+        frame_cache.save(key, video.numpy(), {"sample_fps": sample_fps})
+
+    return video, sample_fps
+
+
+class VideoDecodeService:
+    """Decode videos in a bounded thread pool, and keep the decoded frames in an LRU.
+
+    The LRU is keyed by the path, its modification time and the sampling and resize parameters, so requests for
+    the same clip across epochs and rollouts are free. Concurrent requests for a clip being decoded share the
+    decode. The returned frames are shared by all the requests and must not be modified in place.
+
+    Args:
+        max_workers (int): the number of decode threads
+        max_cache_bytes (int): the capacity of the LRU in bytes, 0 disables it
+        log_interval (int): log the stats every `log_interval` requests
+    """
+
+    def __init__(self, max_workers: int, max_cache_bytes: int, log_interval: int = 256):
+        self.executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="video_decode")
+        self.max_cache_bytes = max_cache_bytes
+        self.log_interval = log_interval
+        self.lock = threading.Lock()
+        self.cache: OrderedDict[tuple, tuple[torch.Tensor, float]] = OrderedDict()
+        self.cache_bytes = 0
+        self.pending: dict[tuple, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.decode_time = 0.0
+
+    @staticmethod
+    def get_key(ele: dict, image_factor: int) -> tuple:
+        path = ele["video"]
+        try:
+            mtime = os.path.getmtime(path)
+        except (OSError, ValueError):  # urls
+            mtime = None
+
+        params = tuple(sorted((k, repr(v)) for k, v in ele.items() if k not in _VIDEO_DECODE_IGNORED_KEYS))
+        return path, mtime, image_factor, params
+
+    def submit(self, ele: dict, image_factor: int = IMAGE_FACTOR) -> Future:
+        """Return a future of `(video, sample_fps)`."""
+        key = self.get_key(ele, image_factor)
+        with self.lock:
+            if (self.hits + self.misses + 1) % self.log_interval == 0:
+                logger.info(f"video decode stats: {self.stats()}")
+
+            if key in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(self.cache[key])
+                return future
+
+            if key in self.pending:
+                self.hits += 1
+                return self.pending[key]
+
+            self.misses += 1
+            future = self.executor.submit(self._decode, key, dict(ele), image_factor)
+            self.pending[key] = future
+            return future
+
+    def fetch(self, ele: dict, image_factor: int = IMAGE_FACTOR) -> tuple[torch.Tensor, float]:
+        return self.submit(ele, image_factor).result()
+
+    def _decode(self, key: tuple, ele: dict, image_factor: int) -> tuple[torch.Tensor, float]:
+        start = time.perf_counter()
+        try:
+            result = _load_or_decode_video(ele, image_factor)
+        except BaseException:
+            with self.lock:
+                self.pending.pop(key, None)
+
+            raise
+
+        with self.lock:
+            self.decode_time += time.perf_counter() - start
+            self._insert(key, result)
+            self.pending.pop(key, None)
+
+        return result
+
+    def _insert(self, key: tuple, result: tuple[torch.Tensor, float]) -> None:
+        size = result[0].numel() * result[0].element_size()
+        if size > self.max_cache_bytes:
+            return
+
+        self.cache[key] = result
+        self.cache_bytes += size
+        while self.cache_bytes > self.max_cache_bytes:
+            _, (video, _) = self.cache.popitem(last=False)
+            self.cache_bytes -= video.numel() * video.element_size()
+
+    def stats(self) -> dict[str, float]:
+        num_requests = self.hits + self.misses
+        return {
+            "requests": num_requests,
+            "hit_rate": self.hits / num_requests if num_requests > 0 else 0.0,
+            "decode_time": self.decode_time,
+            "mean_decode_time": self.decode_time / self.misses if self.misses > 0 else 0.0,
+            "cached_videos": len(self.cache),
+            "cached_mb": self.cache_bytes / 1024**2,
+        }
+
+
+_video_decode_service: Optional[VideoDecodeService] = None
+_video_decode_service_pid: Optional[int] = None
+
+
+def get_video_decode_service() -> VideoDecodeService:
+    """The decode service of this process, dataloader workers create their own after the fork."""
+    global _video_decode_service, _video_decode_service_pid
+    if _video_decode_service is None or _video_decode_service_pid != os.getpid():
+        _video_decode_service = VideoDecodeService(
+            max_workers=VIDEO_DECODE_WORKERS, max_cache_bytes=VIDEO_DECODE_CACHE_BYTES
+        )
+        _video_decode_service_pid = os.getpid()
+
+    return _video_decode_service
+
+
 def fetch_video(ele: dict, image_factor: int = IMAGE_FACTOR, return_video_sample_fps: bool = False) -> torch.Tensor | list[Image.Image]:
     if isinstance(ele["video"], str):
-        video_reader_backend = get_video_reader_backend()
-        try:
-            video, sample_fps = VIDEO_READER_BACKENDS[video_reader_backend](ele)
-        except Exception as e:
-            logger.warning(f"video_reader_backend {video_reader_backend} error, use torchvision as default, msg: {e}")
-            video, sample_fps = VIDEO_READER_BACKENDS["torchvision"](ele)
-
-        nframes, _, height, width = video.shape
-        min_pixels = ele.get("min_pixels", VIDEO_MIN_PIXELS)
-        total_pixels = ele.get("total_pixels", VIDEO_TOTAL_PIXELS)
-        max_pixels = max(min(VIDEO_MAX_PIXELS, total_pixels / nframes * FRAME_FACTOR), int(min_pixels * 1.05))
-        max_pixels_supposed = ele.get("max_pixels", max_pixels)
-        if max_pixels_supposed > max_pixels:
-            logger.warning(f"The given max_pixels[{max_pixels_supposed}] exceeds limit[{max_pixels}].")
-        max_pixels = min(max_pixels_supposed, max_pixels)
-        if "resized_height" in ele and "resized_width" in ele:
-            resized_height, resized_width = smart_resize(
-                ele["resized_height"],
-                ele["resized_width"],
-                factor=image_factor,
-            )
-        else:
-            resized_height, resized_width = smart_resize(
-                height,
-                width,
-                factor=image_factor,
-                min_pixels=min_pixels,
-                max_pixels=max_pixels,
-            )
-        video = transforms.functional.resize(
-            video,
-            [resized_height, resized_width],
-            interpolation=InterpolationMode.BICUBIC,
-            antialias=True,
-        ).float()
+        video, sample_fps = get_video_decode_service().fetch(ele, image_factor)
         if return_video_sample_fps:
             return video, sample_fps
         return video
@@ -384,9 +552,19 @@ def process_vision_info(
     image_inputs = []
     video_inputs = []
     video_sample_fps_list = []
-    for vision_info in vision_infos:
+    # decode the videos of the conversations concurrently
+    video_futures = {
+        i: get_video_decode_service().submit(vision_info)
+        for i, vision_info in enumerate(vision_infos)
+        if "video" in vision_info and isinstance(vision_info["video"], str)
+    }
+    for i, vision_info in enumerate(vision_infos):
         if "image" in vision_info or "image_url" in vision_info:
             image_inputs.append(fetch_image(vision_info))
+        elif i in video_futures:
+            video_input, video_sample_fps = video_futures[i].result()
+            video_sample_fps_list.append(video_sample_fps)
+            video_inputs.append(video_input)
         elif "video" in vision_info:
             video_input, video_sample_fps = fetch_video(vision_info, return_video_sample_fps=True)
             video_sample_fps_list.append(video_sample_fps)
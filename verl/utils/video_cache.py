@@ -0,0 +1,111 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The on-disk cache of preprocessed video frames, built by `scripts/build_video_cache.py`.
+
+Each video is stored as a uint8 `(T, C, H, W)` array in `{cache_dir}/{video_name}.npy`, so loading is a memory
+map instead of an unpickle. `manifest.json` records the settings the frames were preprocessed with.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+import torch
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def get_video_name(video: str, video_dir: Optional[str] = None) -> str:
+    """The cache name of a video, its path relative to the video directory without the extension, e.g.
+    `clips/a.mp4` -> `clips/a`. Absolute and `./`, `../` paths are normalized, the name never leaves the cache."""
+    if video_dir is not None:
+        video = os.path.relpath(os.path.join(video_dir, video), video_dir)
+
+    video = os.path.normpath(video).lstrip(os.sep)
+    parts = ["__" if part == os.pardir else part for part in video.split(os.sep)]
+    return os.path.splitext(os.path.join(*parts))[0]
+
+
+def _get_legacy_video_name(video: str) -> str:
+    # the name of the `.pt` files written by older versions of the cache
+    return video.split(".")[0]
+
+
+class VideoCache:
+    """A directory of preprocessed video frames.
+
+    Args:
+        cache_dir (str): the directory of the cache
+        video_dir (str, optional): the directory the video paths are relative to
+    """
+
+    def __init__(self, cache_dir: str, video_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.video_dir = video_dir
+        self.manifest: Dict[str, Any] = {}
+        manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+
+    @property
+    def num_video_frames(self) -> Optional[int]:
+        return self.manifest.get("num_video_frames")
+
+    def get_path(self, video: str) -> str:
+        return os.path.join(self.cache_dir, get_video_name(video, self.video_dir) + ".npy")
+
+    def contains(self, video: str) -> bool:
+        return os.path.exists(self.get_path(video))
+
+    def load(self, video: str) -> Optional[torch.Tensor]:
+        """Memory-map the cached frames of a video, in their stored dtype. Return None if the video is not cached."""
+        path = self.get_path(video)
+        if os.path.exists(path):
+            # copy-on-write mapping, the pages are read lazily and the file is never modified
+            return torch.from_numpy(np.load(path, mmap_mode="c"))
+
+        legacy_path = os.path.join(self.cache_dir, _get_legacy_video_name(video) + ".pt")
+        if os.path.exists(legacy_path):
+            return torch.load(legacy_path, mmap=True)
+
+        return None
+
+    def get_shape(self, video: str) -> Optional[tuple]:
+        """Read the shape from the array header only."""
+        path = self.get_path(video)
+        if not os.path.exists(path):
+            return None
+
+        return np.load(path, mmap_mode="r").shape
+
+    def save(self, video: str, frames: torch.Tensor) -> None:
+        path = self.get_path(video)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, an interrupted build never leaves a partial array
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, frames.numpy())
+        os.replace(tmp_path, path)
+
+    def save_manifest(self, manifest: Dict[str, Any]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest_path = os.path.join(self.cache_dir, MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(manifest_path + ".tmp", manifest_path)
+        self.manifest = manifest
@@ -27,6 +27,8 @@ import requests
 from transformers import PretrainedConfig
 import imageio
 
+from ..frame_cache import get_frame_cache
+
 # from llava.constants import MEDIA_TOKENS
 # from llava.media import Image, Video
 # from llava.utils import make_list
@@ -164,69 +166,72 @@ def _load_video(video_path: str, num_frames: int) -> List[PIL.Image.Image]:
     return frames
 '''
 
-def _load_video(video_path, num_frames):
+def _sample_frame_indices(frame_count: int, num_frames: int) -> List[int]:
+    """Uniformly sample `num_frames` indices, or take every frame of a short video."""
+    if frame_count >= num_frames:
+        return np.linspace(0, frame_count - 1, num_frames, dtype=int).tolist()
+
+    return list(range(frame_count))
+
+
+def _open_video(video_path: str, num_threads: int) -> cv2.VideoCapture:
+    """Open the video with threaded decoding if the OpenCV build supports it."""
+    if num_threads > 0 and hasattr(cv2, "CAP_PROP_N_THREADS"):
+        try:
+            return cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, num_threads])
+        except cv2.error:
+            pass
+
+    return cv2.VideoCapture(video_path)
+
+
+def _load_video(video_path, num_frames, seek_min_gap: int = 64, num_threads: int = 4):
     """
     num_frames is the max number of frames the model can support.
     frame_count is the number of frames in the input video.
-    max_fps is the max FPS of the model can support.
-    fps is the fps of the input video.
-    """
 
-    import random
+    Instead of walking the whole video, the reader seeks to the keyframe before each sampled index and only decodes
+    forward from there. Close indices are reached by grabbing, since a seek decodes from the previous keyframe anyway.
+    """
     from PIL import Image
 
-    vidcap = cv2.VideoCapture(video_path)
+    vidcap = _open_video(video_path, num_threads)
 
     fps = vidcap.get(cv2.CAP_PROP_FPS)
     frame_count = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
     if fps == 0 or frame_count == 0:
-        print(f"Video file not found. return empty images. {video_file_name}")
+        print(f"Video file not found. return empty images. {video_path}")
         return [
             Image.new("RGB", (720, 720)),
         ] * num_frames
 
-    duration = frame_count / fps
-    frame_interval = frame_count // num_frames
-    if frame_interval == 0 and frame_count <= 1:
-        print(f"frame_interval is equal to 0. return empty image. {video_file_name}")
+    if frame_count // num_frames == 0 and frame_count <= 1:
+        print(f"frame_interval is equal to 0. return empty image. {video_path}")
         return [
             Image.new("RGB", (720, 720)),
         ] * num_frames
-    # print("duration:", duration, "frames:", frame_count, "intervals:", frame_interval)
 
     images = []
-    count = 0
-    success = True
-    frame_indices = np.linspace(0, frame_count - 1, num_frames, dtype=int)
-    while success:
-        # print("frame_count:", frame_count, "count:", count, "num_frames:", num_frames, "frame_interval:", frame_interval)
-        if frame_count >= num_frames:
-            if count in frame_indices:
-                success, frame = vidcap.read()
-                try:
-                    img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    im_pil = Image.fromarray(img)
-                    images.append(im_pil)
-                except BaseException:
-                    continue
-                if len(images) >= num_frames:
-                    return images
-            else:
-                success = vidcap.grab()
-            count += 1
-        else:
-            # Left padding frames if the video is not long enough
-            success, frame = vidcap.read()
-            if success:
-                try:
-                    img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    im_pil = Image.fromarray(img)
-                    images.append(im_pil)
-                except BaseException:
-                    continue
-                count += 1
-            else:
-                break
+    position = 0  # the index of the next frame to be read
+    for index in _sample_frame_indices(frame_count, num_frames):
+        if index - position > seek_min_gap:
+            vidcap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            position = index
+
+        while position < index and vidcap.grab():
+            position += 1
+
+        if position < index:  # the frame count overestimates the length
+            break
+
+        success, frame = vidcap.read()
+        position += 1
+        if not success:
+            break
+
+        images.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+
+    vidcap.release()
     if len(images) == 0:
         raise ValueError("Did not find enough frames in the video. return empty image.")
 
@@ -235,7 +240,18 @@ def _load_video(video_path, num_frames):
 
 def _extract_video(video: Video, config: PretrainedConfig) -> List[PIL.Image.Image]:
     num_frames = config.num_video_frames
+    frame_cache = get_frame_cache()
+    key = None
+    if frame_cache is not None:
+        key = frame_cache.get_key(video.path, {"source": "vila", "num_frames": num_frames})
+        cached = frame_cache.load(key) if key is not None else None
+        if cached is not None:
+            return [PIL.Image.fromarray(frame) for frame in cached[0]]
+
     frames = _load_video(video.path, num_frames=num_frames)
+    if key is not None and len({frame.size for frame in frames}) == 1:
+        frame_cache.save(key, np.stack([np.asarray(frame.convert("RGB")) for frame in frames]), {})
+
     return frames
 
 
@@ -48,7 +48,7 @@ from ..protocol import DataProto
 from ..single_controller.base import Worker
 from ..single_controller.base.decorator import Dispatch, register
 from ..utils.checkpoint.fsdp_checkpoint_manager import FSDPCheckpointManager
-from ..utils.dataset import process_image
+from ..utils.dataset import place_multi_modal_inputs, process_image
 from ..utils.flops_counter import FlopsCounter
 from ..utils.fsdp_utils import (
     get_fsdp_wrap_policy,
@@ -68,6 +68,27 @@ from .sharding_manager import FSDPVLLMShardingManager
 from .sharding_manager.fsdp_ulysses import FSDPUlyssesShardingManager
 
 
+# keys consumed by the forward pass of the actor, ref and critic models
+FORWARD_INPUT_KEYS = [
+    "input_ids",
+    "attention_mask",
+    "position_ids",
+    "responses",
+    "uid",
+    "multi_modal_data",
+    "multi_modal_inputs",
+    "multi_modal_embeds",
+    "multi_modal_labels",
+    "latents",
+    "next_latents",
+    "timesteps",
+    "prompt_embeds",
+    "pooled_prompt_embeds",
+    "negative_prompt_embeds",
+    "negative_pooled_prompt_embeds",
+]
+
+
 class FSDPWorker(Worker):
     def __init__(
         self,
@@ -496,16 +517,31 @@ class FSDPWorker(Worker):
             )
 
     @register(dispatch_mode=Dispatch.ONE_TO_ALL)
-    def save_checkpoint(self, path: str, save_model_only: bool = False):
+    def save_checkpoint(
+        self,
+        path: str,
+        save_model_only: bool = False,
+        async_save: bool = False,
+        checkpoint_format: str = "torch",
+        save_hf_weights: bool = False,
+    ):
         assert self._has_actor or self._has_critic
         if self._use_param_offload:
             load_fsdp_model(self.fsdp_module)
 
-        self.checkpoint_manager.save_checkpoint(path, save_model_only, self.diffusion)
+        self.checkpoint_manager.save_checkpoint(
+            path, save_model_only, self.diffusion, async_save, checkpoint_format, save_hf_weights
+        )
         dist.barrier()
         if self._use_param_offload:
             offload_fsdp_model(self.fsdp_module)
 
+    @register(dispatch_mode=Dispatch.ONE_TO_ALL)
+    def wait_for_checkpoint(self):
+        assert self._has_actor or self._has_critic
+        self.checkpoint_manager.wait_for_pending_save()
+        dist.barrier()
+
     @register(dispatch_mode=Dispatch.ONE_TO_ALL)
     def load_checkpoint(self, path: str):
         assert self._has_actor or self._has_critic
@@ -521,12 +557,23 @@ class FSDPWorker(Worker):
             offload_fsdp_optimizer(self.optimizer)
 
     def _process_multi_modal_inputs(self, data: DataProto):
-        if "multi_modal_data" not in data.non_tensor_batch:
+        if "multi_modal_inputs" not in data.non_tensor_batch and "multi_modal_data" not in data.non_tensor_batch:
             return
 
         if "uid" in self._cache and not np.all(data.non_tensor_batch["uid"] == self._cache["uid"]):
             self._cache.clear()
 
+        if "multi_modal_inputs" in data.non_tensor_batch:  # preprocessed by the dataset, used as-is
+            if "multi_modal_inputs" not in self._cache:
+                self._cache["uid"] = data.non_tensor_batch["uid"]
+                self._cache["multi_modal_inputs"] = place_multi_modal_inputs(
+                    data.non_tensor_batch["multi_modal_inputs"], torch.cuda.current_device()
+                )
+
+            data.non_tensor_batch["multi_modal_inputs"] = self._cache["multi_modal_inputs"]
+            data.non_tensor_batch.pop("multi_modal_data", None)
+            return
+
         if not self.config.vila_model:
             if "multi_modal_inputs" not in self._cache:
                 min_pixels = data.meta_info["min_pixels"]
@@ -645,7 +692,7 @@ class FSDPWorker(Worker):
     def release_rollout_engine(self):
         self.rollout_sharding_manager.offload_vllm()
 
-    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO)
+    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO, blocking=False)
     def generate_sequences(self, prompts: DataProto):
         assert self._has_rollout
         if self.diffusion:
@@ -667,7 +714,11 @@ class FSDPWorker(Worker):
 
         return output.to("cpu")
 
-    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO)
+    @register(
+        dispatch_mode=Dispatch.DP_COMPUTE_PROTO,
+        input_keys=FORWARD_INPUT_KEYS,
+        output_keys=["old_log_probs", "old_prev_sample_mean"],
+    )
     def compute_log_probs(self, data: DataProto):
         assert self._has_actor
 
@@ -702,7 +753,11 @@ class FSDPWorker(Worker):
 
         return output.to("cpu")
 
-    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO)
+    @register(
+        dispatch_mode=Dispatch.DP_COMPUTE_PROTO,
+        input_keys=FORWARD_INPUT_KEYS,
+        output_keys=["ref_log_probs", "ref_prev_sample_mean"],
+    )
     def compute_ref_log_probs(self, data: DataProto):
         assert self._has_ref
 
@@ -733,7 +788,7 @@ class FSDPWorker(Worker):
 
         return output.to("cpu")
 
-    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO)
+    @register(dispatch_mode=Dispatch.DP_COMPUTE_PROTO, input_keys=FORWARD_INPUT_KEYS, output_keys=["values"])
     def compute_values(self, data: DataProto):
         assert self._has_critic
 
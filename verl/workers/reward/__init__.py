@@ -13,7 +13,22 @@
 # limitations under the License.
 
 from .config import RewardConfig
-from .function import BatchFunctionRewardManager, FunctionRewardManager, SequentialFunctionRewardManager
+from .function import (
+    BatchFunctionRewardManager,
+    FunctionRewardManager,
+    ParallelFunctionRewardManager,
+    SequentialFunctionRewardManager,
+    get_reward_manager_cls,
+)
+from .streaming import StreamingRewardScorer
 
 
-__all__ = ["BatchFunctionRewardManager", "FunctionRewardManager", "RewardConfig", "SequentialFunctionRewardManager"]
+__all__ = [
+    "BatchFunctionRewardManager",
+    "FunctionRewardManager",
+    "ParallelFunctionRewardManager",
+    "RewardConfig",
+    "SequentialFunctionRewardManager",
+    "StreamingRewardScorer",
+    "get_reward_manager_cls",
+]
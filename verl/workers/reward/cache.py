@@ -0,0 +1,87 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Content-keyed cache of reward scores
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def get_reward_fn_identity(
+    reward_function: str, reward_function_name: str, reward_function_kwargs: Dict[str, Any]
+) -> str:
+    """Identify a reward function by its source file content, name and kwargs."""
+    with open(reward_function, "rb") as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+
+    return json.dumps([source_hash, reward_function_name, reward_function_kwargs], sort_keys=True, default=str)
+
+
+class RewardCache:
+    """An in-memory LRU cache of reward scores, optionally backed by a sqlite database on disk.
+
+    Args:
+        reward_fn_identity (str): the identity of the reward function, part of every key
+        capacity (int): the max number of scores kept in memory
+        cache_dir (str, optional): the directory of the on-disk cache, shared across runs
+    """
+
+    def __init__(self, reward_fn_identity: str, capacity: int, cache_dir: Optional[str] = None):
+        self.reward_fn_identity = reward_fn_identity
+        self.capacity = capacity
+        self.memory: OrderedDict[str, Dict[str, float]] = OrderedDict()
+        self.db = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(cache_dir, "reward_cache.db"), check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score TEXT)")
+            self.db.commit()
+
+    def get_key(self, response: str, ground_truth: Any, response_length: int) -> str:
+        content = json.dumps([self.reward_fn_identity, response, ground_truth, response_length], default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, float]]:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        if self.db is not None:
+            row = self.db.execute("SELECT score FROM scores WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                score = json.loads(row[0])
+                self._put_memory(key, score)
+                return score
+
+        return None
+
+    def put(self, key: str, score: Dict[str, float]) -> None:
+        self._put_memory(key, score)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?)", (key, json.dumps(score, default=float)))
+
+    def flush(self) -> None:
+        if self.db is not None:
+            self.db.commit()
+
+    def _put_memory(self, key: str, score: Dict[str, float]) -> None:
+        self.memory[key] = score
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
@@ -27,6 +27,11 @@ class RewardConfig:
     reward_function_kwargs: dict = field(default_factory=dict)
     skip_special_tokens: bool = True
     num_cpus: int = 1
+    timeout: float = 30.0  # per-sample timeout (seconds) of the parallel reward manager
+    timeout_score: float = 0.0
+    cache_size: int = 0  # max number of cached scores in memory, 0 disables the reward cache
+    cache_dir: Optional[str] = None  # directory of the on-disk reward cache
+    streaming: bool = False  # score the rollout requests as they finish, only for text rollouts
     # below are auto keys
     reward_function_name: Optional[str] = field(default=None, init=False)
     diffusion: bool = False
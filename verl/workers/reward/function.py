@@ -13,17 +13,22 @@
 # limitations under the License.
 
 import importlib.util
+import math
+import multiprocessing
 import os
+import signal
 import sys
+import time
 from abc import ABC, abstractmethod
 from collections import defaultdict
 from functools import partial
-from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+from typing import Callable, Dict, List, Optional, Tuple, Type, TypedDict
 
 import torch
 from transformers import PreTrainedTokenizer
 
 from ...protocol import DataProto
+from .cache import RewardCache, get_reward_fn_identity
 from .config import RewardConfig
 
 
@@ -44,6 +49,34 @@ SequentialRewardFunction = Callable[[RewardInput], RewardScore]
 BatchRewardFunction = Callable[[List[RewardInput]], List[RewardScore]]
 
 
+class _RewardTimeout(BaseException):
+    """Raised in the reward process on timeout, not an `Exception` so reward functions cannot swallow it."""
+
+
+_process_reward_fn: Optional[SequentialRewardFunction] = None
+
+
+def _init_reward_process(reward_fn: SequentialRewardFunction) -> None:
+    global _process_reward_fn
+    _process_reward_fn = reward_fn
+
+
+def _raise_reward_timeout(signum, frame):
+    raise _RewardTimeout()
+
+
+def _compute_score_with_timeout(reward_input: RewardInput, timeout: float) -> Optional[RewardScore]:
+    """Run the reward function in a pool process, return None if it does not finish in time."""
+    signal.signal(signal.SIGALRM, _raise_reward_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return _process_reward_fn(reward_input)
+    except _RewardTimeout:
+        return None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
 class FunctionRewardManager(ABC):
     """Reward manager for rule-based reward."""
 
@@ -71,10 +104,64 @@ class FunctionRewardManager(ABC):
         self.config = config
         self.tokenizer = tokenizer
         self.diffusion = config.diffusion
+        if config.cache_size > 0 and not self.diffusion:
+            reward_fn_identity = get_reward_fn_identity(
+                config.reward_function, config.reward_function_name, config.reward_function_kwargs
+            )
+            self.cache = RewardCache(reward_fn_identity, config.cache_size, config.cache_dir)
+        else:
+            self.cache = None
+
+    def _decode_responses(self, data: DataProto, response_length: List[int]) -> List[str]:
+        """Reuse the text detokenized by the rollout engine if available, otherwise decode the response ids."""
+        if "response_text" in data.non_tensor_batch and self.config.skip_special_tokens:
+            return data.non_tensor_batch["response_text"].tolist()
+
+        response_ids = data.batch["responses"]
+        return self.tokenizer.batch_decode(
+            [response_ids[i][: response_length[i]] for i in range(len(data))],
+            skip_special_tokens=self.config.skip_special_tokens,
+        )
+
+    def _compute_scores(
+        self,
+        reward_inputs: List[RewardInput],
+        score_fn: Callable[[List[RewardInput]], List[Optional[RewardScore]]],
+    ) -> Tuple[List[Optional[RewardScore]], Optional[List[float]]]:
+        """Score the reward inputs with `score_fn`, only the inputs missing in the cache are scored.
+
+        Returns:
+            scores (List[RewardScore]): the scores, None if the score function failed on the input
+            cache_hits (List[float], optional): 1.0 if the score is from the cache, None if the cache is disabled
+        """
+        if self.cache is None:
+            return score_fn(reward_inputs), None
+
+        keys = [
+            self.cache.get_key(reward_input["response"], reward_input["ground_truth"], reward_input["response_length"])
+            for reward_input in reward_inputs
+        ]
+        scores = [self.cache.get(key) for key in keys]
+        cache_hits = [float(score is not None) for score in scores]
+        # identical samples in the batch are scored once
+        miss_key_to_index = {}
+        for i, score in enumerate(scores):
+            if score is None and keys[i] not in miss_key_to_index:
+                miss_key_to_index[keys[i]] = i
+
+        miss_scores = score_fn([reward_inputs[i] for i in miss_key_to_index.values()])
+        key_to_score = dict(zip(miss_key_to_index.keys(), miss_scores))
+        for key, score in key_to_score.items():
+            if score is not None:
+                self.cache.put(key, score)
+
+        self.cache.flush()
+        scores = [key_to_score[key] if score is None else score for key, score in zip(keys, scores)]
+        return scores, cache_hits
 
     @abstractmethod
     def compute_reward(self, data: DataProto) -> Tuple[torch.Tensor, Dict[str, List[float]]]:
-        """Compute reward for a batch of data."""
+        """Compute reward for a batch of data, every metric has one value per sample (e.g. `cache_hit`)."""
         ...
 
 
@@ -84,24 +171,29 @@ class SequentialFunctionRewardManager(FunctionRewardManager):
     def compute_reward(self, data: DataProto) -> Tuple[torch.Tensor, Dict[str, List[float]]]:
         reward_tensor = torch.zeros_like(data.batch["responses"], dtype=torch.float32)
         reward_metrics = defaultdict(list)
-        response_ids = data.batch["responses"]
-        response_length = data.batch["response_mask"].sum(dim=-1)
+        response_length = data.batch["response_mask"].sum(dim=-1).tolist()
+        response_strs = self._decode_responses(data, response_length)
+        reward_inputs = []
         for i in range(len(data)):
-            valid_response_ids = response_ids[i][: response_length[i]]
-            response_str = self.tokenizer.decode(
-                valid_response_ids, skip_special_tokens=self.config.skip_special_tokens
-            )
-            score = self.reward_fn(
+            reward_inputs.append(
                 {
-                    "response": response_str,
+                    "response": response_strs[i],
                     "response_length": response_length[i],
                     "ground_truth": data.non_tensor_batch["ground_truth"][i],
                 }
             )
+
+        scores, cache_hits = self._compute_scores(
+            reward_inputs, lambda inputs: [self.reward_fn(reward_input) for reward_input in inputs]
+        )
+        for i, score in enumerate(scores):
             reward_tensor[i, response_length[i] - 1] = score["overall"]
             for key, value in score.items():
                 reward_metrics[key].append(value)
 
+        if cache_hits is not None:
+            reward_metrics["cache_hit"] = cache_hits
+
         return reward_tensor, reward_metrics
 
 
@@ -140,22 +232,18 @@ class BatchFunctionRewardManager(FunctionRewardManager):
 
         else:
             reward_inputs = []
-            response_ids = data.batch["responses"]
-            response_length = data.batch["response_mask"].sum(dim=-1)
+            response_length = data.batch["response_mask"].sum(dim=-1).tolist()
+            response_strs = self._decode_responses(data, response_length)
             for i in range(len(data)):
-                valid_response_ids = response_ids[i][: response_length[i]]
-                response_str = self.tokenizer.decode(
-                    valid_response_ids, skip_special_tokens=self.config.skip_special_tokens
-                )
                 reward_inputs.append(
                     {
-                        "response": response_str,
+                        "response": response_strs[i],
                         "response_length": response_length[i],
                         "ground_truth": data.non_tensor_batch["ground_truth"][i],
                     }
                 )
 
-            scores = self.reward_fn(reward_inputs)
+            scores, cache_hits = self._compute_scores(reward_inputs, self.reward_fn)
             reward_tensor = torch.zeros_like(data.batch["responses"], dtype=torch.float32)
             reward_metrics = defaultdict(list)
             for i, score in enumerate(scores):
@@ -163,4 +251,92 @@ class BatchFunctionRewardManager(FunctionRewardManager):
                 for key, value in score.items():
                     reward_metrics[key].append(value)
 
+            if cache_hits is not None:
+                reward_metrics["cache_hit"] = cache_hits
+
             return reward_tensor, reward_metrics
+
+
+class ParallelFunctionRewardManager(FunctionRewardManager):
+    """Score the samples with a sequential reward function in a local process pool of `num_cpus` processes.
+
+    A sample that does not finish in `timeout` seconds gets `timeout_score`, counted in the `timeout` metric.
+    """
+
+    reward_fn: SequentialRewardFunction
+
+    def __init__(self, config: RewardConfig, tokenizer: PreTrainedTokenizer):
+        super().__init__(config, tokenizer)
+        self._create_pool()
+
+    def _create_pool(self) -> None:
+        # fork so that the dynamically loaded reward function is inherited instead of pickled
+        self.pool = multiprocessing.get_context("fork").Pool(
+            processes=self.config.num_cpus, initializer=_init_reward_process, initargs=(self.reward_fn,)
+        )
+
+    def _score_in_pool(self, reward_inputs: List[RewardInput]) -> List[Optional[RewardScore]]:
+        async_results = [
+            self.pool.apply_async(_compute_score_with_timeout, (reward_input, self.config.timeout))
+            for reward_input in reward_inputs
+        ]
+        # safety net for reward functions blocked in native code, where the alarm cannot interrupt them
+        num_rounds = math.ceil(len(reward_inputs) / self.config.num_cpus) + 1
+        deadline = time.monotonic() + self.config.timeout * num_rounds
+        scores, pool_stuck = [], False
+        for async_result in async_results:
+            try:
+                scores.append(async_result.get(timeout=max(deadline - time.monotonic(), 0.0)))
+            except multiprocessing.TimeoutError:
+                scores.append(None)
+                pool_stuck = True
+
+        if pool_stuck:
+            self.pool.terminate()
+            self._create_pool()
+
+        return scores
+
+    def compute_reward(self, data: DataProto) -> Tuple[torch.Tensor, Dict[str, List[float]]]:
+        response_ids = data.batch["responses"]
+        response_length = data.batch["response_mask"].sum(dim=-1).tolist()
+        response_strs = self._decode_responses(data, response_length)
+        reward_inputs = [
+            {
+                "response": response_strs[i],
+                "response_length": response_length[i],
+                "ground_truth": data.non_tensor_batch["ground_truth"][i],
+            }
+            for i in range(len(data))
+        ]
+        scores, cache_hits = self._compute_scores(reward_inputs, self._score_in_pool)
+        score_keys = list(dict.fromkeys(key for score in scores if score is not None for key in score))
+        score_keys = score_keys or ["overall"]
+
+        reward_tensor = torch.zeros_like(response_ids, dtype=torch.float32)
+        reward_metrics = defaultdict(list)
+        for i, score in enumerate(scores):
+            reward_metrics["timeout"].append(float(score is None))
+            if score is None:
+                score = dict.fromkeys(score_keys, self.config.timeout_score)
+
+            reward_tensor[i, response_length[i] - 1] = score["overall"]
+            for key, value in score.items():
+                reward_metrics[key].append(value)
+
+        if cache_hits is not None:
+            reward_metrics["cache_hit"] = cache_hits
+
+        return reward_tensor, reward_metrics
+
+
+def get_reward_manager_cls(reward_type: str) -> Type[FunctionRewardManager]:
+    """Get the reward manager class of `reward_type` (sequential, batch or parallel)."""
+    if reward_type == "sequential":
+        return SequentialFunctionRewardManager
+    elif reward_type == "batch":
+        return BatchFunctionRewardManager
+    elif reward_type == "parallel":
+        return ParallelFunctionRewardManager
+    else:
+        raise NotImplementedError(f"Unknown reward type {reward_type}.")
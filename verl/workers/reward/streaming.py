@@ -0,0 +1,121 @@
+# Copyright 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Reward scoring of rollout requests in order of completion
+"""
+
+import queue
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import ray
+import torch
+
+from ...protocol import DataProto
+from ...utils import torch_functional as VF
+
+
+# (prompt index, token ids of each sample, valid length of each sample, text of each sample)
+Completion = Tuple[int, List[List[int]], List[int], List[str]]
+
+
+class StreamingRewardScorer:
+    """Score rollout completions as soon as they finish, while the remaining requests are still decoding.
+
+    Completions are scored in chunks of whatever has arrived since the last chunk, and the scores are
+    scattered back to the interleaved row order of the rollout output (row = prompt_index * n + sample_index).
+
+    Args:
+        compute_reward (Callable): the reward function, e.g. `reward_fn.compute_reward.remote`, may return object refs,
+            its metrics must have one value per sample
+        ground_truth (np.ndarray): the ground truth of every row, repeated to align with the rollout output
+        num_repeat (int): the number of samples per prompt
+        response_length (int): the padded length of the responses
+        pad_token_id (int): the pad token of the responses
+    """
+
+    def __init__(
+        self,
+        compute_reward: Callable[[DataProto], Any],
+        ground_truth: np.ndarray,
+        num_repeat: int,
+        response_length: int,
+        pad_token_id: int,
+    ):
+        self.compute_reward = compute_reward
+        self.ground_truth = ground_truth
+        self.num_repeat = num_repeat
+        self.response_length = response_length
+        self.pad_token_id = pad_token_id
+        self.pending: List[Tuple[List[int], Any]] = []
+
+    def submit(self, completions: List[Completion]) -> None:
+        rows, response_ids, response_lengths, response_texts = [], [], [], []
+        for prompt_index, sample_token_ids, sample_lengths, sample_texts in completions:
+            for sample_index in range(len(sample_token_ids)):
+                rows.append(prompt_index * self.num_repeat + sample_index)
+
+            response_ids.extend(sample_token_ids)
+            response_lengths.extend(sample_lengths)
+            response_texts.extend(sample_texts)
+
+        responses = VF.pad_2d_list_to_length(response_ids, self.pad_token_id, max_length=self.response_length)
+        response_mask = torch.arange(responses.size(1)).unsqueeze(0) < torch.tensor(response_lengths).unsqueeze(1)
+        texts = np.empty(len(response_texts), dtype=object)
+        texts[:] = response_texts
+        chunk = DataProto.from_dict(
+            tensors={"responses": responses, "response_mask": response_mask.long()},
+            non_tensors={"ground_truth": self.ground_truth[rows], "response_text": texts},
+        )
+        self.pending.append((rows, self.compute_reward(chunk)))
+
+    def consume(self, completion_queue: "queue.Queue", num_prompts: int) -> None:
+        """Pull completions from the queue until all prompts are finished, scoring each arrival immediately.
+
+        Both `queue.Queue` and `ray.util.queue.Queue` are supported.
+        """
+        num_finished = 0
+        while num_finished < num_prompts:
+            completions = [completion_queue.get(block=True)]
+            while num_finished + len(completions) < num_prompts:
+                try:
+                    completions.append(completion_queue.get(block=False))
+                except queue.Empty:
+                    break
+
+            num_finished += len(completions)
+            self.submit(completions)
+
+    def finalize(self) -> Tuple[torch.Tensor, Dict[str, List[float]]]:
+        """Wait for the pending chunks and assemble the scores in the row order of the rollout output."""
+        num_rows = len(self.ground_truth)
+        reward_tensor = torch.zeros(num_rows, self.response_length, dtype=torch.float32)
+        reward_metrics: Dict[str, List[float]] = defaultdict(lambda: [0.0] * num_rows)
+        for rows, result in self.pending:
+            if isinstance(result, ray.ObjectRef):
+                result = ray.get(result)
+
+            chunk_reward_tensor, chunk_metrics = result
+            reward_tensor[rows] = chunk_reward_tensor[:, : self.response_length]
+            for key, values in chunk_metrics.items():
+                if len(values) != len(rows):
+                    raise ValueError(f"Reward metric `{key}` has {len(values)} values for {len(rows)} samples.")
+
+                metric = reward_metrics[key]
+                for row, value in zip(rows, values):
+                    metric[row] = value
+
+        self.pending.clear()
+        return reward_tensor, dict(reward_metrics)
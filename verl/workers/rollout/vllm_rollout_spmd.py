@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import os
+import uuid
 from contextlib import contextmanager
 from typing import Any, Dict, List, Optional, Union
 
@@ -22,6 +23,8 @@ import torch.distributed
 from tensordict import TensorDict
 from transformers import PreTrainedTokenizer, ProcessorMixin
 from vllm import LLM, RequestOutput, SamplingParams
+from vllm.distributed import parallel_state as vllm_ps
+from vllm.sampling_params import RequestOutputKind
 
 from ...protocol import DataProto
 from ...utils import torch_functional as VF
@@ -51,6 +54,14 @@ def _get_logit_bias(processor: Optional[ProcessorMixin]) -> Optional[Dict[int, f
         return None
 
 
+def _normalize_vila_frames(frames: torch.Tensor, device: torch.device, dtype: torch.dtype) -> torch.Tensor:
+    """Normalize the uint8 frames on the device right before the vision tower, as the SigLIP image processor does."""
+    if frames.dtype == torch.uint8:
+        return frames.to(device).to(dtype) * (2 / 255) - 1
+
+    return frames.to(dtype)
+
+
 def _process_multi_modal_data(multi_modal_data: Dict[str, Any], min_pixels: int, max_pixels: int) -> Dict[str, Any]:
     # may convert image path to image object
     # TODO: add video
@@ -219,6 +230,44 @@ class vLLMRollout(BaseRollout):
         for key, value in old_sampling_params_args.items():
             setattr(self.sampling_params, key, value)
 
+    def _generate_streaming(
+        self, vllm_inputs: List[Dict[str, Any]], prompt_index: np.ndarray, stream_queue: Any, eos_token_id: int
+    ) -> List[RequestOutput]:
+        """Step the engine by hand and push every finished request to the stream queue in order of completion."""
+        engine = self.inference_engine.llm_engine
+        sampling_params = self.sampling_params.clone()
+        sampling_params.output_kind = RequestOutputKind.FINAL_ONLY
+        request_ids = [str(uuid.uuid4()) for _ in vllm_inputs]
+        request_to_prompt = {}
+        for request_id, vllm_input, index in zip(request_ids, vllm_inputs, prompt_index):
+            engine.add_request(request_id, vllm_input, sampling_params)
+            request_to_prompt[request_id] = int(index)
+
+        is_producer = vllm_ps.get_tensor_model_parallel_rank() == 0  # tp ranks produce identical outputs
+        finished: Dict[str, RequestOutput] = {}
+        while engine.has_unfinished_requests():
+            for output in engine.step():
+                if not output.finished:
+                    continue
+
+                finished[output.request_id] = output
+                if is_producer:
+                    sample_token_ids = [list(sample.token_ids) for sample in output.outputs]
+                    sample_lengths = VF.get_response_mask(
+                        response_ids=VF.pad_2d_list_to_length(sample_token_ids, self.pad_token_id),
+                        eos_token_id=eos_token_id,
+                    ).sum(-1)
+                    stream_queue.put_nowait(
+                        (
+                            request_to_prompt[output.request_id],
+                            sample_token_ids,
+                            sample_lengths.tolist(),
+                            [sample.text for sample in output.outputs],
+                        )
+                    )
+
+        return [finished[request_id] for request_id in request_ids]
+
     @torch.no_grad()
     def generate_sequences(self, prompts: DataProto) -> DataProto:
         # left-padded attention_mask
@@ -230,6 +279,8 @@ class vLLMRollout(BaseRollout):
 
         non_tensor_batch = prompts.non_tensor_batch
         batch_raw_prompt_ids = non_tensor_batch.pop("raw_prompt_ids")
+        batch_prompt_index = non_tensor_batch.pop("prompt_index", None)
+        stream_queue = prompts.meta_info.pop("stream_queue", None)
         batch_multi_modal_data = non_tensor_batch.pop("multi_modal_data", None)
         if batch_size != len(batch_raw_prompt_ids):
             raise RuntimeError("vllm sharding manager is not work properly.")
@@ -247,11 +298,20 @@ class vLLMRollout(BaseRollout):
                     _raw_prompt_ids = torch.Tensor(list(raw_prompt_ids)).long().unsqueeze(0).to(self.model_vision_encoder.device)
                     vision_key = list(multi_modal_data.keys())[0]
                     _dtype = multi_modal_data[vision_key][0].dtype
-                    multi_modal_data[vision_key] = [_data.to(self.model_vision_encoder.dtype) for _data in multi_modal_data[vision_key]]
-                    num_video_frames = multi_modal_data[vision_key][0].size(0)
+                    if not _dtype.is_floating_point:  # uint8 frames, the embeds are kept in fp32
+                        _dtype = torch.float32
+
+                    # the frames in the batch stay uint8, only the copy fed to the vision tower is normalized
+                    media = {
+                        vision_key: [
+                            _normalize_vila_frames(_data, self.model_vision_encoder.device, self.model_vision_encoder.dtype)
+                            for _data in multi_modal_data[vision_key]
+                        ]
+                    }
+                    num_video_frames = media[vision_key][0].size(0)
                     labels = torch.full(_raw_prompt_ids.shape, 1, dtype=_raw_prompt_ids.dtype, device=_raw_prompt_ids.device)
-                    media_config = {vision_key: {"frames_split": multi_modal_data[vision_key][0].shape[0] // self.group_frames if "video" in vision_key and self.group_frames>0 else 0}}
-                    inputs_embeds, labels, _ = self.model_vision_encoder._embed(_raw_prompt_ids, multi_modal_data, media_config, labels ,None)
+                    media_config = {vision_key: {"frames_split": media[vision_key][0].shape[0] // self.group_frames if "video" in vision_key and self.group_frames>0 else 0}}
+                    inputs_embeds, labels, _ = self.model_vision_encoder._embed(_raw_prompt_ids, media, media_config, labels ,None)
                     if self.max_frames_vllm < num_video_frames:
                         resized_embeds = _sample_video_embeds(inputs_embeds, labels==IGNORE_INDEX, num_video_frames, self.max_frames_vllm)
                     else:
@@ -294,10 +354,17 @@ class vLLMRollout(BaseRollout):
 
         # users can customize different sampling_params at different run
         with self.update_sampling_params(**prompts.meta_info):
-            completions: List[RequestOutput] = self.inference_engine.generate(
-                prompts=vllm_inputs, sampling_params=self.sampling_params, use_tqdm=False
-            )
+            if stream_queue is not None:
+                completions = self._generate_streaming(vllm_inputs, batch_prompt_index, stream_queue, eos_token_id)
+            else:
+                completions: List[RequestOutput] = self.inference_engine.generate(
+                    prompts=vllm_inputs, sampling_params=self.sampling_params, use_tqdm=False
+                )
+
             response_ids = [output.token_ids for completion in completions for output in completion.outputs]
+            # the engine already detokenized the responses, keep the text for the reward and validation
+            response_texts = np.empty(len(response_ids), dtype=object)
+            response_texts[:] = [output.text for completion in completions for output in completion.outputs]
             response_ids = VF.pad_2d_list_to_length(
                 response_ids, self.pad_token_id, max_length=self.config.response_length
             ).to(input_ids.device)
@@ -349,6 +416,8 @@ class vLLMRollout(BaseRollout):
         else:
             non_tensor_batch = {}
 
+        non_tensor_batch["response_text"] = response_texts
+
         prompts.meta_info["num_repeat"] = self.sampling_params.n
         prompts.meta_info["num_chunk_seq"] = self.num_chunk_seq
         return DataProto(batch=batch, non_tensor_batch=non_tensor_batch, meta_info=prompts.meta_info)